@@ -0,0 +1,205 @@
+# action_codec.py
+"""
+Упакованное целочисленное кодирование действий.
+
+Карта кодируется индексом 0..51 (card_index), слот доски - номером 0..12
+(top 0-2, middle 3-7, bottom 8-12). Младшие 2 бита кода - тип действия:
+
+    STREET1      : тип | 5 x (карта 6 бит | слот 4 бита)               (52 бита)
+    PINEAPPLE    : тип | карта1 | слот1 | карта2 | слот2 | сброс       (28 бит)
+    FL_PLACEMENT : тип | 13 карт по слотам (6 бит) | число сбросов (3) | сбросы
+    FL_FOUL      : тип | 52-битная маска карт руки
+
+Размещения упорядочиваются по слоту (а ряды Фантазии и сбросы - по индексу
+карты), поэтому одно и то же действие всегда получает один и тот же код.
+Коды хэшируются и сериализуются дешевле вложенных кортежей с Card.
+"""
+from itertools import combinations, permutations
+from typing import Any, Dict, List, Tuple
+
+from card import Card, card_to_str
+from card_index import CARD_TO_INDEX, INDEX_TO_CARD
+
+ACTION_STREET1 = 0
+ACTION_PINEAPPLE = 1
+ACTION_FL_PLACEMENT = 2
+ACTION_FL_FOUL = 3
+
+TAG_BITS = 2
+TAG_MASK = 0x3
+CARD_BITS = 6
+CARD_MASK = 0x3F
+SLOT_BITS = 4
+SLOT_MASK = 0xF
+PLACEMENT_BITS = CARD_BITS + SLOT_BITS
+
+ROW_OFFSETS: Dict[str, int] = {'top': 0, 'middle': 3, 'bottom': 8}
+SLOT_TO_ROW_INDEX: List[Tuple[str, int]] = (
+    [('top', i) for i in range(3)] + [('middle', i) for i in range(5)] + [('bottom', i) for i in range(5)]
+)
+NUM_SLOTS = 13
+
+# Поля PINEAPPLE
+_P_CARD1 = TAG_BITS
+_P_SLOT1 = _P_CARD1 + CARD_BITS
+_P_CARD2 = _P_SLOT1 + SLOT_BITS
+_P_SLOT2 = _P_CARD2 + CARD_BITS
+_P_DISCARD = _P_SLOT2 + SLOT_BITS
+
+# Поля FL_PLACEMENT
+_FL_COUNT = TAG_BITS + NUM_SLOTS * CARD_BITS
+_FL_DISCARDS = _FL_COUNT + 3
+
+
+def slot_of(row_name: str, index: int) -> int:
+    """Номер слота 0..12 по (ряд, индекс)."""
+    return ROW_OFFSETS[row_name] + index
+
+def encode_placement(card: Card, row_name: str, index: int) -> int:
+    """Упаковывает (карта, ряд, индекс) в 10 бит: карта | слот << 6."""
+    return CARD_TO_INDEX[card] | ((ROW_OFFSETS[row_name] + index) << CARD_BITS)
+
+def encode_pineapple(card1_idx: int, slot1: int, card2_idx: int, slot2: int, discard_idx: int) -> int:
+    """Код действия улиц 2-5 из индексов карт и номеров слотов."""
+    if slot2 < slot1:
+        card1_idx, slot1, card2_idx, slot2 = card2_idx, slot2, card1_idx, slot1
+    return (ACTION_PINEAPPLE | (card1_idx << _P_CARD1) | (slot1 << _P_SLOT1)
+            | (card2_idx << _P_CARD2) | (slot2 << _P_SLOT2) | (discard_idx << _P_DISCARD))
+
+def encode_street1(card_slots: List[Tuple[int, int]]) -> int:
+    """Код действия улицы 1 из пар (индекс карты, слот)."""
+    code = ACTION_STREET1
+    shift = TAG_BITS
+    for card_idx, slot in sorted(card_slots, key=lambda cs: cs[1]):
+        code |= (card_idx | (slot << CARD_BITS)) << shift
+        shift += PLACEMENT_BITS
+    return code
+
+def encode_action(action: Any) -> int:
+    """Кодирует действие в формате GameState (кортежи с Card) в int."""
+    if isinstance(action, int): return action
+    if isinstance(action, tuple) and action and action[0] == "FANTASYLAND_PLACEMENT":
+        _, placement, discarded = action
+        code = ACTION_FL_PLACEMENT
+        shift = TAG_BITS
+        for row_name in ('top', 'middle', 'bottom'):
+            for card_idx in sorted(CARD_TO_INDEX[c] for c in placement[row_name]):
+                code |= card_idx << shift
+                shift += CARD_BITS
+        code |= len(discarded) << _FL_COUNT
+        shift = _FL_DISCARDS
+        for card_idx in sorted(CARD_TO_INDEX[c] for c in discarded):
+            code |= card_idx << shift
+            shift += CARD_BITS
+        return code
+    if isinstance(action, tuple) and action and action[0] == "FANTASYLAND_FOUL":
+        mask = 0
+        for c in action[1]: mask |= 1 << CARD_TO_INDEX[c]
+        return ACTION_FL_FOUL | (mask << TAG_BITS)
+    if isinstance(action, tuple) and len(action) == 3:
+        (card1, row1, idx1), (card2, row2, idx2), discarded = action
+        return encode_pineapple(CARD_TO_INDEX[card1], slot_of(row1, idx1),
+                                CARD_TO_INDEX[card2], slot_of(row2, idx2), CARD_TO_INDEX[discarded])
+    if isinstance(action, tuple) and len(action) == 2:
+        placements, _ = action
+        return encode_street1([(CARD_TO_INDEX[c], slot_of(r, i)) for c, r, i in placements])
+    raise ValueError(f"Cannot encode action: {action!r}")
+
+def action_type(code: int) -> int:
+    """Тип действия (ACTION_*) по коду."""
+    return code & TAG_MASK
+
+def decode_placements(code: int) -> List[Tuple[int, int]]:
+    """Пары (индекс карты, слот) для кодов STREET1 и PINEAPPLE (сброс не входит)."""
+    kind = code & TAG_MASK
+    if kind == ACTION_PINEAPPLE:
+        return [((code >> _P_CARD1) & CARD_MASK, (code >> _P_SLOT1) & SLOT_MASK),
+                ((code >> _P_CARD2) & CARD_MASK, (code >> _P_SLOT2) & SLOT_MASK)]
+    if kind == ACTION_STREET1:
+        result = []
+        shift = TAG_BITS
+        for _ in range(5):
+            field = code >> shift
+            result.append((field & CARD_MASK, (field >> CARD_BITS) & SLOT_MASK))
+            shift += PLACEMENT_BITS
+        return result
+    return []
+
+def pineapple_discard(code: int) -> int:
+    """Индекс сброшенной карты для кода PINEAPPLE."""
+    return (code >> _P_DISCARD) & CARD_MASK
+
+def decode_action(code: int) -> Any:
+    """Восстанавливает действие в формате GameState из кода."""
+    kind = code & TAG_MASK
+    if kind == ACTION_PINEAPPLE:
+        (c1, s1), (c2, s2) = decode_placements(code)
+        row1, idx1 = SLOT_TO_ROW_INDEX[s1]
+        row2, idx2 = SLOT_TO_ROW_INDEX[s2]
+        return ((INDEX_TO_CARD[c1], row1, idx1), (INDEX_TO_CARD[c2], row2, idx2),
+                INDEX_TO_CARD[pineapple_discard(code)])
+    if kind == ACTION_STREET1:
+        placements = []
+        for card_idx, slot in decode_placements(code):
+            row, idx = SLOT_TO_ROW_INDEX[slot]
+            placements.append((INDEX_TO_CARD[card_idx], row, idx))
+        return (placements, [])
+    if kind == ACTION_FL_PLACEMENT:
+        cards = [INDEX_TO_CARD[(code >> (TAG_BITS + k * CARD_BITS)) & CARD_MASK] for k in range(NUM_SLOTS)]
+        n_discard = (code >> _FL_COUNT) & 0x7
+        discarded = [INDEX_TO_CARD[(code >> (_FL_DISCARDS + k * CARD_BITS)) & CARD_MASK] for k in range(n_discard)]
+        return ("FANTASYLAND_PLACEMENT", {'top': cards[0:3], 'middle': cards[3:8], 'bottom': cards[8:13]}, discarded)
+    mask = code >> TAG_BITS
+    return ("FANTASYLAND_FOUL", [INDEX_TO_CARD[i] for i in range(52) if mask >> i & 1])
+
+def format_action(action: Any) -> str:
+    """Форматирует действие (код или кортеж) для логов и UI."""
+    if action is None: return "None"
+    try:
+        code = encode_action(action)
+    except (ValueError, KeyError, TypeError):
+        return f"Unknown Action: {action!r}"
+    kind = code & TAG_MASK
+    decoded = decode_action(code)
+    if kind == ACTION_PINEAPPLE:
+        p1, p2, d = decoded
+        return f"PINEAPPLE: {card_to_str(p1[0])}@{p1[1]}{p1[2]}, {card_to_str(p2[0])}@{p2[1]}{p2[2]}; Discard {card_to_str(d)}"
+    if kind == ACTION_STREET1:
+        placements_str = ", ".join(f"{card_to_str(c)}@{r}{i}" for c, r, i in decoded[0])
+        return f"STREET 1: Place {placements_str}"
+    if kind == ACTION_FL_PLACEMENT:
+        _, placement, discarded = decoded
+        rows_str = " | ".join(" ".join(card_to_str(c) for c in placement[r]) for r in ('top', 'middle', 'bottom'))
+        return f"FANTASYLAND_PLACE: {rows_str}; Discard {' '.join(card_to_str(c) for c in discarded)}"
+    return f"FANTASYLAND_FOUL (Discard {len(decoded[1])})"
+
+
+# --- Генерация кодов легальных действий ---
+
+_STREET1_SHIFTS = [TAG_BITS + k * PLACEMENT_BITS for k in range(5)]
+
+def street1_codes(card_idxs: List[int], slot_combinations: List[Tuple[int, ...]]) -> List[int]:
+    """
+    Коды всех размещений 5 карт по заданным комбинациям слотов.
+    Комбинации слотов должны быть упорядочены по возрастанию (как из combinations()).
+    """
+    s0, s1, s2, s3, s4 = _STREET1_SHIFTS
+    card_perms = [(c0 << s0) | (c1 << s1) | (c2 << s2) | (c3 << s3) | (c4 << s4)
+                  for c0, c1, c2, c3, c4 in permutations(card_idxs)]
+    codes = []
+    for slots in slot_combinations:
+        base = ACTION_STREET1
+        for k, slot in enumerate(slots): base |= slot << (CARD_BITS + _STREET1_SHIFTS[k])
+        codes.extend([base | cp for cp in card_perms])
+    return codes
+
+def pineapple_codes(card_idxs: List[int], free_slots: List[int]) -> List[int]:
+    """Коды всех действий улиц 2-5: сброс одной из 3 карт и размещение двух других."""
+    codes = []
+    for i in range(3):
+        discard_idx = card_idxs[i]
+        a, b = [card_idxs[j] for j in range(3) if j != i]
+        for slot1, slot2 in combinations(free_slots, 2):
+            codes.append(encode_pineapple(a, slot1, b, slot2, discard_idx))
+            codes.append(encode_pineapple(b, slot1, a, slot2, discard_idx))
+    return codes
@@ -0,0 +1,103 @@
+# action_prior.py
+"""
+Дешевая эвристическая оценка (prior) действий по их int-кодам.
+
+Оценка считается векторно для всего списка кодов без декодирования в Card:
+сумма "пригодности" ранга карты для ряда (верх - низкие карты, середина -
+средние, низ - старшие), бонус за пары с картами, уже лежащими в ряду или
+кладущимися в тот же ряд этим действием, и штраф за перегруз одного ряда.
+Используется для порядка раскрытия детей при progressive widening.
+"""
+import random
+from typing import TYPE_CHECKING, List, Sequence
+
+import numpy as np
+
+from action_codec import (ACTION_PINEAPPLE, ACTION_STREET1, CARD_BITS, CARD_MASK, PLACEMENT_BITS,
+                          SLOT_MASK, TAG_BITS, TAG_MASK, _P_CARD1, _P_CARD2, _P_SLOT1, _P_SLOT2)
+from card_index import CARD_TO_INDEX
+
+if TYPE_CHECKING: # Только для аннотаций
+    from game_state import GameState
+
+PAIR_BONUS = 3.0
+CROWD_PENALTY = 1.0 # За каждую карту сверх двух, кладущуюся этим действием в один ряд
+
+# Ряд (0 top, 1 middle, 2 bottom) по номеру слота
+ROW_OF_SLOT = np.array([0] * 3 + [1] * 5 + [2] * 5, dtype=np.int64)
+
+def _row_fit_table() -> np.ndarray:
+    """
+    Пригодность ранга (0..12 = 2..A) для ряда: низкие карты - наверх,
+    средние - в середину, старшие - вниз; старшая непарная карта наверху
+    грозит фолом.
+    """
+    values = np.arange(13) + 2
+    top = np.where(values <= 6, 1.0, np.where(values <= 10, 0.0, -2.0))
+    middle = np.where((values >= 7) & (values <= 11), 1.0, 0.0)
+    bottom = np.where(values >= 12, 1.0, np.where(values >= 8, 0.5, 0.0))
+    return np.stack([top, middle, bottom])
+
+ROW_FIT = _row_fit_table()
+
+
+def _placements(codes: np.ndarray, tag: int):
+    """(карты, слоты) размещений кодов одного типа, формы (n, k)."""
+    if tag == ACTION_STREET1:
+        shifts = TAG_BITS + PLACEMENT_BITS * np.arange(5, dtype=np.int64)
+        fields = (codes[:, None] >> shifts) & ((1 << PLACEMENT_BITS) - 1)
+        return fields & CARD_MASK, (fields >> CARD_BITS) & SLOT_MASK
+    cards = np.stack([(codes >> _P_CARD1) & CARD_MASK, (codes >> _P_CARD2) & CARD_MASK], axis=1)
+    slots = np.stack([(codes >> _P_SLOT1) & SLOT_MASK, (codes >> _P_SLOT2) & SLOT_MASK], axis=1)
+    return cards, slots
+
+
+def action_priors(state: 'GameState', player_idx: int, codes: Sequence[int]) -> np.ndarray:
+    """Prior для каждого кода (больше - лучше). Для действий Фантазии - нули."""
+    if len(codes) == 0: return np.zeros(0)
+    arr = np.asarray(codes, dtype=np.int64)
+    tag = int(arr[0] & TAG_MASK)
+    if tag not in (ACTION_STREET1, ACTION_PINEAPPLE): return np.zeros(len(arr))
+    cards, slots = _placements(arr, tag)
+    ranks = cards >> 2
+    rows = ROW_OF_SLOT[slots]
+    scores = ROW_FIT[rows, ranks].sum(axis=1)
+
+    # Пары с картами доски
+    board = state.boards[player_idx]
+    row_counts = np.zeros((3, 13), dtype=np.float64)
+    for r, row_name in enumerate(board.ROW_NAMES):
+        for card in board.rows[row_name]:
+            if card is not None: row_counts[r, CARD_TO_INDEX[card] >> 2] += 1
+    scores += PAIR_BONUS * row_counts[rows, ranks].sum(axis=1)
+
+    # Пары между картами действия в одном ряду
+    k = ranks.shape[1]
+    for i in range(k):
+        for j in range(i + 1, k):
+            scores += PAIR_BONUS * ((ranks[:, i] == ranks[:, j]) & (rows[:, i] == rows[:, j]))
+
+    # Штраф за то, что действие сваливает карты в один ряд
+    for r in range(3):
+        scores -= CROWD_PENALTY * np.maximum(0, (rows == r).sum(axis=1) - 2)
+    return scores
+
+
+def best_by_prior(state: 'GameState', player_idx: int, codes: Sequence[int]) -> int:
+    """Код с максимальным prior (случайный среди равных) без сортировки всего списка."""
+    priors = action_priors(state, player_idx, codes)
+    best = np.flatnonzero(priors == priors.max())
+    return int(codes[int(best[0] if len(best) == 1 else random.choice(best))])
+
+
+def order_by_prior(state: 'GameState', player_idx: int, codes: List[int], best_last: bool = True) -> List[int]:
+    """
+    Сортирует коды по prior (случайный порядок среди равных).
+    best_last=True - лучшие в конце (для list.pop()), иначе в начале.
+    """
+    if len(codes) < 2: return list(codes)
+    arr = np.asarray(codes, dtype=np.int64)
+    priors = action_priors(state, player_idx, arr)
+    tie_break = np.random.default_rng(random.getrandbits(64)).random(len(arr)) # Сид из random - воспроизводимо
+    order = np.lexsort((tie_break, priors if best_last else -priors))
+    return arr[order].tolist()
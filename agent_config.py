@@ -0,0 +1,64 @@
+# agent_config.py
+"""
+MCTSAgent из переменных окружения - общий разбор для main.py, app.py и
+search_service.py, чтобы точки входа не расходились в параметрах.
+
+    MCTS_TIME_LIMIT_MS, MCTS_RAVE_K, NUM_WORKERS, ROLLOUTS_PER_LEAF,
+    MCTS_TREE_STORE, MCTS_CHECKPOINT_DEPTHS, MCTS_TT_SIZE,
+    MCTS_SESSION_MAX_NODES, MCTS_STREET_PARAMS, MCTS_SELECTION,
+    MCTS_CHANCE_MODE, MCTS_CHANCE_POLICY, MCTS_CHANCE_OUTCOMES,
+    MCTS_PARALLEL, MCTS_LEAF_BATCH, MCTS_MAX_ITERATIONS,
+    MCTS_MAX_SIMULATIONS, MCTS_ROUND_TIME_MS, MCTS_ADAPTIVE_TIME,
+    MCTS_PONDER_SHARE, MCTS_PONDER_MAX_MS, MCTS_SOLVER,
+    MCTS_ROOT_SELECTION, MCTS_GUMBEL_K
+"""
+import os
+from typing import Mapping
+
+from mcts_agent import MCTSAgent
+from search_params import parse_street_params
+from time_manager import TimeManager
+
+
+def agent_from_env(environ: Mapping[str, str] = os.environ, num_workers: int = 1,
+                   ponder_share: float = 0.5) -> MCTSAgent:
+    """
+    MCTSAgent с параметрами из переменных окружения. num_workers и
+    ponder_share - значения точки входа, если NUM_WORKERS и
+    MCTS_PONDER_SHARE не заданы (веб-процессов много, а консольная игра
+    одна и не обдумывает).
+    """
+    time_limit = int(environ.get('MCTS_TIME_LIMIT_MS', MCTSAgent.DEFAULT_TIME_LIMIT_MS))
+    # Время раунда делится по улицам с ранней остановкой (MCTS_ADAPTIVE_TIME=0 - всегда MCTS_TIME_LIMIT_MS)
+    round_time = int(environ.get('MCTS_ROUND_TIME_MS', 5 * time_limit))
+    time_manager = TimeManager(round_time / 1000.0) if environ.get('MCTS_ADAPTIVE_TIME', '1') != '0' else None
+    workers = int(environ.get('NUM_WORKERS', num_workers))
+    rollouts_per_leaf = int(environ.get('ROLLOUTS_PER_LEAF', MCTSAgent.DEFAULT_ROLLOUTS_PER_LEAF))
+    tree_store = environ.get('MCTS_TREE_STORE', MCTSAgent.DEFAULT_TREE_STORE)
+    rave_k = int(environ.get('MCTS_RAVE_K', MCTSAgent.DEFAULT_RAVE_K))
+    print(f"AI Params: TimeLimit={time_limit}ms, RaveK={rave_k}, Workers={workers}, "
+          f"RolloutsPerLeaf={rollouts_per_leaf}, TreeStore={tree_store}")
+    return MCTSAgent(time_limit_ms=time_limit,
+                     rave_k=rave_k,
+                     num_workers=workers,
+                     rollouts_per_leaf=rollouts_per_leaf,
+                     tree_store=tree_store,
+                     checkpoint_depths=tuple(int(d) for d in environ.get('MCTS_CHECKPOINT_DEPTHS', '').split(',') if d.strip()),
+                     transposition_size=int(environ.get('MCTS_TT_SIZE', MCTSAgent.DEFAULT_TRANSPOSITION_SIZE)),
+                     session_max_nodes=int(environ.get('MCTS_SESSION_MAX_NODES', MCTSAgent.DEFAULT_SESSION_MAX_NODES)),
+                     street_params=parse_street_params(environ.get('MCTS_STREET_PARAMS')),
+                     selection=environ.get('MCTS_SELECTION', MCTSAgent.DEFAULT_SELECTION),
+                     chance_mode=environ.get('MCTS_CHANCE_MODE', MCTSAgent.DEFAULT_CHANCE_MODE),
+                     chance_policy=environ.get('MCTS_CHANCE_POLICY', MCTSAgent.DEFAULT_CHANCE_POLICY),
+                     max_chance_outcomes=int(environ.get('MCTS_CHANCE_OUTCOMES', MCTSAgent.DEFAULT_CHANCE_OUTCOMES)),
+                     parallel=environ.get('MCTS_PARALLEL', MCTSAgent.DEFAULT_PARALLEL),
+                     leaf_batch_size=int(environ.get('MCTS_LEAF_BATCH', MCTSAgent.DEFAULT_LEAF_BATCH_SIZE)),
+                     max_iterations=int(environ['MCTS_MAX_ITERATIONS']) if environ.get('MCTS_MAX_ITERATIONS') else None,
+                     max_simulations=int(environ['MCTS_MAX_SIMULATIONS']) if environ.get('MCTS_MAX_SIMULATIONS') else None,
+                     time_manager=time_manager,
+                     # Обдумывание, пока человек думает над ходом (0 - выключено)
+                     ponder_share=float(environ.get('MCTS_PONDER_SHARE', ponder_share)),
+                     ponder_max_time_ms=int(environ.get('MCTS_PONDER_MAX_MS', MCTSAgent.DEFAULT_PONDER_MAX_TIME_MS)),
+                     solver=environ.get('MCTS_SOLVER', '1') != '0',
+                     root_selection=environ.get('MCTS_ROOT_SELECTION', MCTSAgent.DEFAULT_ROOT_SELECTION),
+                     gumbel_k=int(environ.get('MCTS_GUMBEL_K', MCTSAgent.DEFAULT_GUMBEL_K)))
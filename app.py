@@ -3,7 +3,9 @@ import os
 import json
 import random
 import traceback
+import uuid
 import sys # Добавляем sys для выхода и flush
+from collections import OrderedDict
 from typing import List, Set, Optional, Tuple, Any
 from flask import Flask, render_template, request, jsonify, session
 
@@ -16,12 +18,15 @@ try:
     print("Importing modules...")
     from card import Card, card_from_str, card_to_str
     print("Imported card")
-    from game_state import GameState
+    from game_state import GameState, PHASE_ACT
     print("Imported game_state")
     from board import PlayerBoard
     print("Imported board")
-    from mcts_agent import MCTSAgent
+    from agent_config import agent_from_env
+    from search_service import SearchClient, parse_address, service_authkey
+    from search_report import log_report, report_stream
     print("Imported mcts_agent")
+    from action_codec import format_action
     print("--- Imports successful ---")
     sys.stdout.flush(); sys.stderr.flush()
 except ImportError as e:
@@ -58,21 +63,20 @@ try:
     sys.stdout.flush(); sys.stderr.flush()
     ai_agent = None
     try:
-        mcts_time_limit = int(os.environ.get('MCTS_TIME_LIMIT_MS', 5000))
-        mcts_rave_k = int(os.environ.get('MCTS_RAVE_K', 500))
-        mcts_workers = int(os.environ.get('NUM_WORKERS', 1))
-        mcts_rollouts_leaf = int(os.environ.get('ROLLOUTS_PER_LEAF', 4))
-
-        print(f"AI Params: TimeLimit={mcts_time_limit}ms, RaveK={mcts_rave_k}, Workers={mcts_workers}, RolloutsPerLeaf={mcts_rollouts_leaf}")
-        sys.stdout.flush(); sys.stderr.flush()
-
-        ai_agent = MCTSAgent(time_limit_ms=mcts_time_limit,
-                             rave_k=mcts_rave_k,
-                             num_workers=mcts_workers,
-                             rollouts_per_leaf=mcts_rollouts_leaf)
+        # MCTS_SERVICE - адрес общего сервиса поиска хоста (search_service.py): один пул
+        # на все процессы gunicorn вместо своего пула у каждого
+        mcts_service = os.environ.get('MCTS_SERVICE')
+        if mcts_service:
+            ai_agent = SearchClient(parse_address(mcts_service), service_authkey())
+            print(f"Using MCTS search service at {mcts_service}")
+        else:
+            ai_agent = agent_from_env()
 
         print("--- AI Agent Initialized Successfully ---")
         sys.stdout.flush(); sys.stderr.flush()
+
+        # Отчеты о поиске строками JSON: '-' - stdout, иначе путь к файлу
+        search_log = report_stream(os.environ.get('MCTS_SEARCH_LOG'))
     except Exception as e:
         print(f"FATAL ERROR: AI Agent initialization failed: {e}")
         traceback.print_exc()
@@ -91,12 +95,25 @@ except Exception as e:
      sys.exit(1)
 
 
+# Карты AI, розданные заранее для обдумывания (advance_to_human), живут только
+# на сервере: cookie сессии подписана, но не зашифрована. В cookie рука AI
+# пустая (карты при загрузке возвращаются в колоду), load_game_state раздает
+# эти же карты снова. В другом процессе записи нет - AI получит новую раздачу
+MAX_DEALT_AHEAD = 1024
+_dealt_ahead: 'OrderedDict[str, Tuple[int, int, List[Card]]]' = OrderedDict() # ai_session_id -> (улица, игрок, карты)
+
 # --- Функции для работы с состоянием в сессии (JSON) ---
 def save_game_state(state: Optional[GameState]):
-    """Сохраняет состояние игры в сессию как JSON."""
+    """Сохраняет состояние игры в сессию как JSON (без карт AI, розданных заранее)."""
     if state:
         try:
-            session['game_state'] = state.to_dict()
+            state_dict = state.to_dict()
+            ahead = _dealt_ahead.get(get_ai_session_id())
+            if ahead is not None:
+                street, player, cards = ahead
+                if state.street == street and state.get_player_hand(player) == cards: state_dict['current_hands'][player] = None
+                else: _dealt_ahead.pop(get_ai_session_id(), None) # Карты уже сыграны
+            session['game_state'] = state_dict
             session.modified = True
         except Exception as e:
              print(f"Error saving game state to session: {e}")
@@ -105,13 +122,22 @@ def save_game_state(state: Optional[GameState]):
     else:
         session.pop('game_state', None)
 
+def get_ai_session_id() -> str:
+    """Идентификатор игровой сессии для переиспользования дерева AI между запросами."""
+    if 'ai_session_id' not in session:
+        session['ai_session_id'] = uuid.uuid4().hex
+    return session['ai_session_id']
+
 def load_game_state() -> Optional[GameState]:
     """Загружает состояние игры из сессии (JSON)."""
     state_dict = session.get('game_state')
     if state_dict:
         try:
             if isinstance(state_dict, dict):
-                 return GameState.from_dict(state_dict)
+                 state = GameState.from_dict(state_dict)
+                 ahead = _dealt_ahead.get(session.get('ai_session_id'))
+                 if ahead is not None and ahead[0] == state.street: state.deal_ahead(ahead[1], ahead[2])
+                 return state
             else:
                  print(f"Error: Saved game state is not a dict: {type(state_dict)}")
                  session.pop('game_state', None)
@@ -141,19 +167,13 @@ def get_state_for_frontend(state: GameState, player_idx: int) -> dict:
     message = ""
     is_waiting = False
     # Определяем, может ли игрок действовать СЕЙЧАС
-    can_act_now = False
-    if not state.is_round_over() and not state._player_finished_round[player_idx]:
-         if state.is_fantasyland_round and state.fantasyland_status[player_idx]:
-              can_act_now = state.fantasyland_hands[player_idx] is not None
-         else: # Обычный ход или не-ФЛ в ФЛ раунде
-              can_act_now = state.current_hands.get(player_idx) is not None
+    can_act_now = state.phase() == PHASE_ACT and state.next_to_act() == player_idx
 
     if state.is_round_over():
         message = "Раунд завершен! Нажмите 'Начать Раунд'."
         # is_waiting остается False по умолчанию
         try:
-             score = state.get_terminal_score()
-             if player_idx == 1: score = -score
+             score = int(state.get_terminal_scores()[player_idx])
              message += f" Счет за раунд: {score}"
         except Exception as e:
              print(f"Error calculating terminal score: {e}")
@@ -213,10 +233,10 @@ def get_game_state_api():
     if game_state is None:
         print("No game state in session, creating initial state.")
         dealer_idx = random.choice([0, 1])
-        game_state = GameState(dealer_idx=dealer_idx)
         # Важно: НЕ начинаем раунд здесь, просто создаем пустое состояние
-        game_state.street = 0 # Явно указываем, что раунд не начат
-        game_state._player_finished_round = [True, True] # Считаем "завершенным" до старта
+        # street=0 - раунд не начат; все игроки считаются "завершившими" до старта
+        game_state = GameState(dealer_idx=dealer_idx, street=0,
+                               _player_finished_round=[True] * GameState.NUM_PLAYERS)
         save_game_state(game_state)
         is_initial_request = True
         print("Initial empty state created and saved.")
@@ -258,7 +278,6 @@ def get_game_state_api():
 def start_game():
     print("Route /start called")
     human_player_idx = 0
-    ai_idx = 1 - human_player_idx
 
     old_state = load_game_state()
     fl_status_carryover = [False, False]
@@ -283,56 +302,17 @@ def start_game():
     print(f"New round started. Dealer: {dealer_idx}. FL Status: {game_state.fantasyland_status}. Street: {game_state.street}")
     sys.stdout.flush(); sys.stderr.flush()
 
-    # Определяем, нужно ли AI ходить первым
-    ai_needs_to_act = False
-    if game_state.is_fantasyland_round and game_state.fantasyland_status[ai_idx]:
-         ai_needs_to_act = game_state.fantasyland_hands[ai_idx] is not None
-         if ai_needs_to_act: print(f"AI Player {ai_idx} starting Fantasyland placement...")
-    elif not game_state.is_fantasyland_round and game_state.current_player_idx == ai_idx:
-         ai_needs_to_act = game_state.current_hands.get(ai_idx) is not None
-         if ai_needs_to_act: print(f"AI Player {ai_idx} taking first turn (Street {game_state.street})...")
-    elif game_state.is_fantasyland_round and not game_state.fantasyland_status[ai_idx]: # Не-ФЛ игрок в ФЛ раунде
-         ai_needs_to_act = game_state.current_hands.get(ai_idx) is not None
-         if ai_needs_to_act: print(f"AI Player {ai_idx} taking first turn (Regular hand in FL round, Street {game_state.street})...")
-
-
-    if ai_needs_to_act:
-         try:
-              print("Running initial AI turn...")
-              sys.stdout.flush(); sys.stderr.flush()
-              game_state = run_ai_turn(game_state, ai_idx) # <<<<<<<<<< ВЫЗОВ AI
-              print("Initial AI turn finished.")
-              sys.stdout.flush(); sys.stderr.flush()
-              # Раздаем человеку после хода AI, если нужно
-              if not game_state.is_round_over() and not game_state._player_finished_round[human_player_idx]:
-                   if not game_state.is_fantasyland_round and game_state.current_player_idx == human_player_idx and game_state.current_hands.get(human_player_idx) is None:
-                        print(f"Dealing hand to human player {human_player_idx} after AI turn")
-                        game_state._deal_street_to_player(human_player_idx)
-                   elif game_state.is_fantasyland_round and not game_state.fantasyland_status[human_player_idx] and game_state.current_hands.get(human_player_idx) is None:
-                        print(f"Dealing hand to human player {human_player_idx} after AI turn (FL round)")
-                        game_state._deal_street_to_player(human_player_idx)
-
-         except Exception as e:
-              print(f"Error during initial AI turn: {e}")
-              traceback.print_exc()
-              sys.stdout.flush(); sys.stderr.flush()
-              # В случае ошибки AI, все равно пытаемся раздать человеку, если его очередь
-              if not game_state.is_round_over() and not game_state._player_finished_round[human_player_idx]:
-                   if not game_state.is_fantasyland_round and game_state.current_player_idx == human_player_idx and game_state.current_hands.get(human_player_idx) is None:
-                        print(f"Dealing hand to human player {human_player_idx} after AI error")
-                        game_state._deal_street_to_player(human_player_idx)
-                   elif game_state.is_fantasyland_round and not game_state.fantasyland_status[human_player_idx] and game_state.current_hands.get(human_player_idx) is None:
-                        print(f"Dealing hand to human player {human_player_idx} after AI error (FL round)")
-                        game_state._deal_street_to_player(human_player_idx)
-    else:
-         # Если AI не ходил первым, раздаем человеку, если его очередь
-         if not game_state.is_round_over() and not game_state._player_finished_round[human_player_idx]:
-              if not game_state.is_fantasyland_round and game_state.current_player_idx == human_player_idx and game_state.current_hands.get(human_player_idx) is None:
-                   print(f"Dealing initial hand to human player {human_player_idx}")
-                   game_state._deal_street_to_player(human_player_idx)
-              elif game_state.is_fantasyland_round and not game_state.fantasyland_status[human_player_idx] and game_state.current_hands.get(human_player_idx) is None:
-                   print(f"Dealing initial hand to human player {human_player_idx} (FL round)")
-                   game_state._deal_street_to_player(human_player_idx)
+    # Деревья AI прошлого раунда больше не нужны
+    if ai_agent is not None: ai_agent.release_session(get_ai_session_id())
+    _dealt_ahead.pop(get_ai_session_id(), None)
+
+    # AI ходит, пока очередь не дойдет до человека; карты раздаются по очереди
+    try:
+         game_state = advance_to_human(game_state, human_player_idx)
+    except Exception as e:
+         print(f"Error during initial AI turn: {e}")
+         traceback.print_exc()
+         sys.stdout.flush(); sys.stderr.flush()
 
 
     print("Saving state after /start")
@@ -343,7 +323,35 @@ def start_game():
     sys.stdout.flush(); sys.stderr.flush()
     return jsonify(frontend_state)
 
-# Функция run_ai_turn остается без изменений (как в версии с раскомментированным AI)
+def advance_to_human(state: GameState, human_player_idx: int) -> GameState:
+    """
+    Раздает карты и выполняет ходы AI, пока не наступит ход человека
+    или не закончится раунд. Возвращает новое состояние.
+    """
+    player = state.advance()
+    while player != -1 and player != human_player_idx:
+        print(f"AI Player {player} to act (Street {state.street})...")
+        sys.stdout.flush(); sys.stderr.flush()
+        state = run_ai_turn(state, player)
+        player = state.advance()
+    if player == -1: # Раунд окончен
+        _dealt_ahead.pop(get_ai_session_id(), None)
+        if ai_agent is not None: ai_agent.release_session(get_ai_session_id())
+    elif player == human_player_idx and ai_agent is not None and ai_agent.ponder_share > 0:
+        # AI думает, пока думает человек. Если AI ходит на этой улице после
+        # человека, его карты раздаются сразу, и AI набирает статистику
+        # своего решения при сэмплированных ходах человека; иначе следующая
+        # раздача AI неизвестна, и start_pondering ничего не запускает.
+        ai_players = [p for p in state.upcoming_players() if p != human_player_idx]
+        if ai_players:
+            ai_player_idx = ai_players[0] # Ближайший по очереди AI
+            if state.deal_ahead(ai_player_idx):
+                _dealt_ahead[get_ai_session_id()] = (state.street, ai_player_idx, list(state.get_player_hand(ai_player_idx)))
+                _dealt_ahead.move_to_end(get_ai_session_id())
+                while len(_dealt_ahead) > MAX_DEALT_AHEAD: _dealt_ahead.popitem(last=False)
+            ai_agent.start_pondering(get_ai_session_id(), state, ai_player_idx)
+    return state
+
 def run_ai_turn(current_game_state: GameState, ai_player_index: int) -> GameState:
     """
     Выполняет ОДИН ход AI (или полное размещение ФЛ).
@@ -354,25 +362,20 @@ def run_ai_turn(current_game_state: GameState, ai_player_index: int) -> GameStat
         return state
 
     action = None
-    is_fl_placement = state.is_fantasyland_round and state.fantasyland_status[ai_player_index]
 
     if ai_agent is None:
          print(f"FATAL ERROR in run_ai_turn: ai_agent is None!")
-         new_state = state.copy()
-         new_state.boards[ai_player_index].is_foul = True
-         new_state._player_finished_round[ai_player_index] = True
-         hand_to_discard = state.get_player_hand(ai_player_index)
-         if hand_to_discard:
-              new_state.private_discard[ai_player_index].extend(hand_to_discard)
-              if is_fl_placement: new_state.fantasyland_hands[ai_player_index] = None
-              else: new_state.current_hands[ai_player_index] = None
-         return new_state
+         return state.apply_foul(ai_player_index)
 
     try:
          print(f"AI Player {ai_player_index} choosing action...")
          sys.stdout.flush(); sys.stderr.flush()
-         action = ai_agent.choose_action(state)
-         print(f"AI Player {ai_player_index} chose action: {ai_agent._format_action(action)}")
+         if search_log is not None:
+             action, report = ai_agent.choose_action(state, session_id=get_ai_session_id(), return_report=True)
+             log_report(report, search_log, session=get_ai_session_id())
+         else:
+             action = ai_agent.choose_action(state, session_id=get_ai_session_id())
+         print(f"AI Player {ai_player_index} chose action: {format_action(action)}")
          sys.stdout.flush(); sys.stderr.flush()
     except Exception as e:
          print(f"Error getting action from AI agent: {e}")
@@ -384,16 +387,7 @@ def run_ai_turn(current_game_state: GameState, ai_player_index: int) -> GameStat
 
     if action is None:
         print(f"AI Player {ai_player_index} could not choose an action or errored. Setting foul.")
-        hand_to_discard = state.get_player_hand(ai_player_index)
-        if is_fl_placement and hand_to_discard:
-             new_state = state.apply_fantasyland_foul(ai_player_index, hand_to_discard)
-        else:
-             new_state = state.copy()
-             new_state.boards[ai_player_index].is_foul = True
-             new_state._player_finished_round[ai_player_index] = True
-             if hand_to_discard:
-                  new_state.private_discard[ai_player_index].extend(hand_to_discard)
-                  new_state.current_hands[ai_player_index] = None
+        new_state = state.apply_foul(ai_player_index)
         print(f"AI Player {ai_player_index} fouled.")
 
     elif isinstance(action, tuple) and action[0] == "FANTASYLAND_PLACEMENT":
@@ -410,24 +404,36 @@ def run_ai_turn(current_game_state: GameState, ai_player_index: int) -> GameStat
          print(f"AI applying regular action...")
          sys.stdout.flush(); sys.stderr.flush()
          new_state = state.apply_action(ai_player_index, action)
+         if new_state is state: # Действие не применилось - иначе ход AI зациклится
+              print(f"AI Player {ai_player_index} action was rejected. Setting foul.")
+              new_state = state.apply_foul(ai_player_index)
 
     print(f"AI Player {ai_player_index} action applied.")
     sys.stdout.flush(); sys.stderr.flush()
     return new_state
 
 
+@app.route('/leave', methods=['POST'])
+def leave_game():
+    """Страница закрыта (navigator.sendBeacon): обдумывание за эту партию больше не нужно."""
+    if 'ai_session_id' in session:
+        _dealt_ahead.pop(session['ai_session_id'], None)
+        if ai_agent is not None: ai_agent.stop_pondering(session['ai_session_id'])
+    return ('', 204)
+
 @app.route('/move', methods=['POST'])
 def handle_move():
     """Обрабатывает ход человека (после нажатия 'Готов')."""
     print("Route /move called")
     human_player_idx = 0
-    ai_idx = 1 - human_player_idx
     game_state = load_game_state()
 
     if game_state is None: return jsonify({"error": "Игра не найдена."}), 400
     if game_state.is_round_over(): return jsonify({"error": "Раунд завершен."}), 400
     if game_state._player_finished_round[human_player_idx]:
          return jsonify({"error": "Вы уже завершили раунд."}), 400
+    if game_state.next_to_act() != human_player_idx:
+         return jsonify({"error": "Сейчас не ваш ход."}), 400
 
     move_data = request.json
     new_state = game_state
@@ -473,6 +479,7 @@ def handle_move():
                   print(f"Applying human Pineapple action (Street {game_state.street}).")
 
              if action:
+                  print(f"Human action: {format_action(action)}")
                   new_state = game_state.apply_action(human_player_idx, action)
              else:
                   raise ValueError("Не удалось сформировать действие для обычного хода.")
@@ -481,83 +488,9 @@ def handle_move():
         print(f"Human action applied. Human finished: {new_state._player_finished_round[human_player_idx]}")
         sys.stdout.flush(); sys.stderr.flush()
 
-        # --- Ход AI (если он еще не закончил) ---
-        ai_made_move = False
-        if not new_state.is_round_over() and not new_state._player_finished_round[ai_idx]:
-             ai_can_act = False
-             if new_state.is_fantasyland_round and new_state.fantasyland_status[ai_idx]:
-                  ai_can_act = new_state.fantasyland_hands[ai_idx] is not None
-             else:
-                  ai_can_act = new_state.current_hands.get(ai_idx) is not None
-
-             if ai_can_act:
-                  print(f"AI Player {ai_idx} making move after human...")
-                  sys.stdout.flush(); sys.stderr.flush()
-                  new_state = run_ai_turn(new_state, ai_idx)
-                  ai_made_move = True
-                  print(f"AI finished move. AI finished round: {new_state._player_finished_round[ai_idx]}")
-                  sys.stdout.flush(); sys.stderr.flush()
-             else:
-                  print(f"AI Player {ai_idx} cannot act yet (waiting for cards or finished).")
-                  sys.stdout.flush(); sys.stderr.flush()
-
-
-        # --- Переход к следующей улице / Раздача карт ---
-        if not new_state.is_round_over():
-             needs_dealing = False
-             # Переход улицы в обычном раунде
-             if not new_state.is_fantasyland_round and all(new_state._player_acted_this_street):
-                  new_state.street += 1
-                  if new_state.street <= 5:
-                       print(f"--- Advancing to Street {new_state.street} ---")
-                       sys.stdout.flush(); sys.stderr.flush()
-                       new_state._player_acted_this_street = [False] * new_state.NUM_PLAYERS
-                       new_state.current_player_idx = 1 - new_state.dealer_idx
-                       needs_dealing = True
-
-             # Передача хода в обычном раунде
-             elif not new_state.is_fantasyland_round and not all(new_state._player_acted_this_street):
-                  current_player = new_state.current_player_idx
-                  other_player = 1 - current_player
-                  if new_state._player_acted_this_street[current_player] and not new_state._player_acted_this_street[other_player]:
-                       if not new_state._player_finished_round[other_player]:
-                            new_state.current_player_idx = other_player
-                            if new_state.current_hands.get(other_player) is None:
-                                 needs_dealing = True
-
-             # Раздача карт
-             if needs_dealing or new_state.is_fantasyland_round:
-                  players_to_deal = []
-                  if needs_dealing and not new_state.is_fantasyland_round:
-                       if all(not acted for acted in new_state._player_acted_this_street):
-                            for p_idx in range(new_state.NUM_PLAYERS):
-                                 if not new_state._player_finished_round[p_idx] and new_state.current_hands.get(p_idx) is None:
-                                      players_to_deal.append(p_idx)
-                       else:
-                            p_idx = new_state.current_player_idx
-                            if not new_state._player_finished_round[p_idx] and new_state.current_hands.get(p_idx) is None:
-                                 players_to_deal.append(p_idx)
-                  elif new_state.is_fantasyland_round:
-                       for p_idx_deal in range(new_state.NUM_PLAYERS):
-                            if not new_state.fantasyland_status[p_idx_deal] and \
-                               not new_state._player_finished_round[p_idx_deal] and \
-                               new_state.current_hands.get(p_idx_deal) is None:
-                                    players_to_deal.append(p_idx_deal)
-
-                  ai_needs_to_act_after_deal = False
-                  for p_idx_deal in players_to_deal:
-                       print(f"Dealing cards to player {p_idx_deal} (Street {new_state.street})")
-                       sys.stdout.flush(); sys.stderr.flush()
-                       new_state._deal_street_to_player(p_idx_deal)
-                       if p_idx_deal == ai_idx:
-                            ai_needs_to_act_after_deal = True
-
-                  if ai_needs_to_act_after_deal and not new_state._player_finished_round[ai_idx]:
-                       print(f"AI Player {ai_idx} making move after deal...")
-                       sys.stdout.flush(); sys.stderr.flush()
-                       new_state = run_ai_turn(new_state, ai_idx)
-                       print(f"AI finished move after deal. AI finished round: {new_state._player_finished_round[ai_idx]}")
-                       sys.stdout.flush(); sys.stderr.flush()
+        # --- Ходы AI и раздача карт до следующего хода человека ---
+        if new_state is game_state: raise ValueError("Ход не может быть применен к текущей доске.")
+        new_state = advance_to_human(new_state, human_player_idx)
 
 
         # --- Сохранение и ответ ---
@@ -0,0 +1,1046 @@
+# benchmark.py
+"""
+Бенчмарки движка и поиска.
+Запуск: python benchmark.py <имя> [параметры], например:
+    python benchmark.py canonical --games 200
+    python benchmark.py tree --games 2
+"""
+import argparse
+import contextlib
+import io
+import random
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from game_state import GameState
+from mcts_node import MCTSNode
+
+
+@contextlib.contextmanager
+def _quiet():
+    """Глушит отладочный вывод движка во время замеров."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+def _random_action(state: GameState, player_idx: int) -> Any:
+    """Случайное легальное действие без генерации полного списка действий."""
+    hand = list(state.get_player_hand(player_idx))
+    slots = state.boards[player_idx].get_available_slots()
+    if state.street == 1:
+        chosen_slots = random.sample(slots, 5)
+        return ([(card, row, idx) for card, (row, idx) in zip(hand, chosen_slots)], [])
+    random.shuffle(hand)
+    (row1, idx1), (row2, idx2) = random.sample(slots, 2)
+    return ((hand[0], row1, idx1), (hand[1], row2, idx2), hand[2])
+
+def _self_play_action(state: GameState, player_idx: int) -> Any:
+    """Политика self-play: случайная улица 1, эвристика роллаутов на улицах 2-5."""
+    if state.street == 1:
+        return _random_action(state, player_idx)
+    actions = state.get_legal_actions_for_player(player_idx)
+    return MCTSNode(state)._heuristic_rollout_policy(state, player_idx, actions)
+
+def _play_round(on_decision: Callable[[GameState, int], None], dealer_idx: int = 0,
+                policy: Callable[[GameState, int], Any] = _self_play_action, num_players: int = 2) -> GameState:
+    """Играет обычный раунд self-play, вызывая on_decision перед каждым ходом."""
+    state = GameState(dealer_idx=dealer_idx, num_players=num_players)
+    state.start_new_round(dealer_idx)
+    while not state.is_round_over():
+        p = state.advance()
+        on_decision(state, p)
+        state = state.apply_action(p, policy(state, p))
+    return state
+
+
+# --- Канонизация по мастям ---
+
+def bench_canonical(games: int = 200, seed: int = 0) -> Dict[str, Any]:
+    """
+    Сравнивает долю попаданий кэша с сырыми и каноническими ключами на позициях
+    self-play и замеряет стоимость одного вызова канонизатора.
+    """
+    from canonical import canonicalize_hand, canonicalize_board_hand, canonicalize_state
+
+    random.seed(seed)
+    positions: List[tuple] = []
+    def record(state: GameState, p: int):
+        positions.append((state.copy(), p))
+    with _quiet():
+        for g in range(games): _play_round(record, dealer_idx=g % 2)
+
+    key_kinds = {
+        'hand': lambda s, p, c: canonicalize_hand(s.get_player_hand(p), canonical=c),
+        'board_hand': lambda s, p, c: canonicalize_board_hand(s.boards[p], s.get_player_hand(p), canonical=c),
+        'state': lambda s, p, c: canonicalize_state(s, perspective_player=p, canonical=c),
+    }
+    results: Dict[str, Any] = {'positions': len(positions)}
+    for name, fn in key_kinds.items():
+        row = {}
+        for c in (False, True):
+            seen = set(); hits = 0
+            start = time.perf_counter()
+            for s, p in positions:
+                key, _ = fn(s, p, c)
+                if key in seen: hits += 1
+                else: seen.add(key)
+            elapsed = time.perf_counter() - start
+            label = 'canonical' if c else 'raw'
+            row[label] = {'hit_rate': hits / max(1, len(positions)), 'distinct': len(seen),
+                          'us_per_call': 1e6 * elapsed / max(1, len(positions))}
+        results[name] = row
+    return results
+
+
+# --- Пакетные симуляции ---
+
+def bench_batch(games: int = 2000, seed: int = 0) -> Dict[str, Any]:
+    """
+    Сравнивает скорость случайных доигрываний: GameStateBatch против
+    скалярного GameState (те же случайные действия, один процесс).
+    """
+    import numpy as np
+    from game_state_batch import GameStateBatch, get_tables
+
+    random.seed(seed)
+    get_tables() # Таблицы строятся один раз, в замер не входят
+    start = time.perf_counter()
+    batch = GameStateBatch(games, rng=np.random.default_rng(seed))
+    batch.play_random()
+    scores = batch.terminal_scores()
+    batch_time = time.perf_counter() - start
+
+    scalar_games = max(1, games // 20)
+    start = time.perf_counter()
+    with _quiet():
+        for g in range(scalar_games):
+            state = _play_round(lambda s, p: None, dealer_idx=g % 2, policy=_random_action)
+            state.get_terminal_score()
+    scalar_time = time.perf_counter() - start
+
+    batch_rate = games / batch_time
+    scalar_rate = scalar_games / scalar_time
+    return {'batch': {'games': games, 'games_per_sec': batch_rate, 'mean_score_p0': float(scores[:, 0].mean())},
+            'scalar': {'games': scalar_games, 'games_per_sec': scalar_rate},
+            'speedup': batch_rate / scalar_rate}
+
+
+# --- Хранилище дерева MCTS ---
+
+def _search_nodes(agent, state: GameState, iterations: int, fake_rollout,
+                  transpositions=None, on_iteration: Optional[Callable[[int, MCTSNode], None]] = None,
+                  time_limit: Optional[float] = None) -> Tuple[int, Any]:
+    """
+    Итерации поиска на MCTSNode (MCTSAgent._run_iteration без пула).
+    fake_rollout(состояние, действия узла перед раскрытием) -> (очки, действия для RAVE).
+    time_limit (сек) дополнительно ограничивает поиск по времени. Возвращает (число узлов, корень).
+    """
+    from mcts_node import action_code_array
+    from mcts_session import count_nodes
+
+    def rollout(leaf_state: GameState, node: MCTSNode):
+        source = node.parent if node.action is not None else node
+        reward, extra = fake_rollout(leaf_state, source.untried_actions or [a for a in source.children if isinstance(a, int)])
+        return [reward], action_code_array(extra)
+
+    start = time.perf_counter()
+    root = MCTSNode(state)
+    if transpositions is not None: root.tt_entry = transpositions.lookup(state)
+    for it in range(iterations):
+        if time_limit is not None and time.perf_counter() - start > time_limit: break
+        agent._run_iteration(root, transpositions, rollout)
+        if on_iteration is not None: on_iteration(it, root)
+    return count_nodes(root, 10**9), root
+
+def _search_arrays(agent, state: GameState, iterations: int, fake_rollout, store_states: bool = True) -> Tuple[int, Any]:
+    """Те же итерации на ArrayTree. Возвращает (число раскрытых узлов, дерево)."""
+    from mcts_tree import ArrayTree, NO_NODE
+    player = state.next_to_act()
+    actions = state.get_legal_action_codes_for_player(player)
+    tree = ArrayTree(state, actions, store_states=store_states)
+    nodes = 1
+    for _ in range(iterations):
+        path = tree.select(agent.street_params)
+        leaf = path[-1]
+        sim_actions = set()
+        if not tree.is_terminal(leaf):
+            child = tree.expand(leaf)
+            if child != NO_NODE:
+                path.append(child); nodes += 1
+                sim_actions.add(int(tree.action[child]))
+        block = slice(int(tree.first_child[leaf]), int(tree.first_child[leaf]) + max(0, int(tree.num_children[leaf])))
+        with tree.node_state(path[-1]) as leaf_state:
+            reward, extra = fake_rollout(leaf_state, tree.action[block].tolist() if block.start >= 0 else [])
+        tree.backpropagate(path, reward, 1, sim_actions | extra)
+    return nodes, tree
+
+def bench_tree(games: int = 2, seed: int = 0, iterations: int = 300) -> Dict[str, Any]:
+    """
+    Сравнивает хранилища дерева MCTS (MCTSNode, ArrayTree с состояниями и без) на позициях
+    self-play: узлы в секунду и байты на узел (tracemalloc, включая GameState
+    узлов). Байты на узел - прирост памяти дерева после поиска относительно
+    дерева из одного корня (fixed_bytes: состояние корня, первый блок массивов),
+    деленный на число добавленных узлов. Роллаут заменен синтетическим
+    (случайные очки и несколько действий для RAVE), чтобы замер отражал
+    накладные расходы самого дерева.
+    """
+    import gc
+    import tracemalloc
+    import numpy as np
+    from mcts_agent import MCTSAgent
+
+    random.seed(seed)
+    positions: List[GameState] = []
+    with _quiet():
+        for g in range(games):
+            _play_round(lambda s, p: positions.append(s.copy()), dealer_idx=g % 2)
+        agent = MCTSAgent(num_workers=1, rollouts_per_leaf=1, chance_mode='none') # ArrayTree без узлов случая
+
+    def fake_rollout(state: GameState, actions: List[int]):
+        extra = set(random.sample(actions, min(len(actions), 8))) if actions else set()
+        return np.array([random.uniform(-6, 6) for _ in state.boards]), extra
+
+    results: Dict[str, Any] = {'positions': len(positions), 'iterations': iterations}
+    stores = (('nodes', _search_nodes), ('arrays', _search_arrays),
+              ('stateless', lambda *args: _search_arrays(*args, store_states=False)))
+    for name, search in stores:
+        # Скорость и память меряются отдельными проходами: tracemalloc искажает время
+        random.seed(seed)
+        total_nodes = 0; total_time = 0.0
+        with _quiet():
+            for state in positions:
+                start = time.perf_counter()
+                total_nodes += search(agent, state, iterations, fake_rollout)[0]
+                total_time += time.perf_counter() - start
+        random.seed(seed)
+        fixed_bytes = added_bytes = 0
+        with _quiet():
+            for state in positions:
+                traced = []
+                for count in (0, iterations):
+                    tracemalloc.start()
+                    _, tree = search(agent, state, count, fake_rollout)
+                    traced.append(tracemalloc.get_traced_memory()[0]) # Дерево еще живо
+                    del tree
+                    tracemalloc.stop()
+                    gc.collect()
+                fixed_bytes += traced[0]
+                added_bytes += traced[1] - traced[0]
+        results[name] = {'nodes': total_nodes, 'nodes_per_sec': total_nodes / total_time,
+                         'fixed_bytes': fixed_bytes / max(1, len(positions)),
+                         'bytes_per_node': added_bytes / max(1, total_nodes - len(positions))}
+    return results
+
+
+def bench_transpositions(games: int = 2, seed: int = 0, iterations: int = 400) -> Dict[str, Any]:
+    """
+    Сравнивает обычное дерево и DAG с таблицей транспозиций на позициях улиц
+    2-5 (настоящие роллауты в процессе): доля попаданий, память таблицы и
+    число симуляций до сходимости - итерация, после которой рекомендуемый ход
+    (с точностью до транспозиции) больше не меняется.
+    """
+    from mcts_agent import MCTSAgent
+    from transposition import TranspositionTable
+
+    random.seed(seed)
+    positions: List[GameState] = []
+    with _quiet():
+        for g in range(games):
+            _play_round(lambda s, p: positions.append(s.copy()) if s.street > 1 else None, dealer_idx=g % 2)
+        agent = MCTSAgent(num_workers=1, rollouts_per_leaf=1)
+
+    def rollout(state: GameState, actions: List[int]):
+        return MCTSNode(state).rollout()
+
+    results: Dict[str, Any] = {'positions': len(positions), 'iterations': iterations}
+    for name, use_tt in (('tree', False), ('dag', True)):
+        random.seed(seed)
+        converge: List[int] = []
+        hits = lookups = tt_bytes = 0
+        start = time.perf_counter()
+        for state in positions:
+            table = TranspositionTable() if use_tt else None
+            last_change = [0]; best_key = [None]
+            def on_iteration(it: int, root: MCTSNode):
+                if not root.children: return
+                best = MCTSAgent._best_child(root)
+                key = TranspositionTable.key_of(best.game_state)
+                if key != best_key[0]: best_key[0] = key; last_change[0] = it + 1
+            with _quiet():
+                _search_nodes(agent, state, iterations, rollout, table, on_iteration)
+            converge.append(last_change[0])
+            if table is not None:
+                hits += table.hits; lookups += table.lookups; tt_bytes += table.nbytes()
+        row: Dict[str, Any] = {'mean_sims_to_converge': sum(converge) / max(1, len(converge)),
+                               'sec': time.perf_counter() - start}
+        if use_tt: row.update(hit_rate=hits / max(1, lookups), tt_bytes_per_position=tt_bytes / max(1, len(positions)))
+        results[name] = row
+    return results
+
+
+def bench_reuse(games: int = 2, seed: int = 0, iterations: int = 300,
+                players: Tuple[int, ...] = (2, 3)) -> Dict[str, Any]:
+    """
+    Переиспользование дерева между решениями в сессии (self-play агентом,
+    parallel='none', узлы случая по умолчанию): доля решений, начатых с
+    перекоренения сохраненного дерева (SearchReport.reused_visits), и
+    унаследованные корнем посещения. Первое решение игрока в раунде не в
+    счет - дерева у него еще нет.
+    """
+    from mcts_agent import MCTSAgent
+    from search_params import SearchBudget
+
+    budget = SearchBudget(max_iterations=iterations)
+    results: Dict[str, Any] = {'iterations': iterations}
+    for num_players in players:
+        with _quiet():
+            agent = MCTSAgent(parallel='none', rollouts_per_leaf=1)
+        random.seed(seed)
+        decisions = 0; eligible = 0
+        reused: List[int] = []
+        for g in range(games):
+            state = GameState(dealer_idx=g % num_players, num_players=num_players)
+            seen = set()
+            with _quiet():
+                state.start_new_round(g % num_players)
+                while not state.is_round_over():
+                    p = state.advance()
+                    action, report = agent.choose_action(state, session_id=g, budget=budget, seed=seed + decisions, return_report=True)
+                    decisions += 1; eligible += p in seen; seen.add(p)
+                    if report.reused_visits is not None: reused.append(report.reused_visits)
+                    state = state.apply_action(p, action)
+                agent.release_session(g)
+        agent.close()
+        results[f'{num_players}_players'] = {'decisions': decisions, 'eligible': eligible, 'reused': len(reused),
+                                             'hit_rate': len(reused) / max(1, eligible),
+                                             'reused_visits': sum(reused),
+                                             'visits_per_hit': sum(reused) / max(1, len(reused))}
+    return results
+
+
+def bench_ponder(games: int = 2, seed: int = 0, iterations: int = 300, seconds: float = 0.5) -> Dict[str, Any]:
+    """
+    Обдумывание на ходе соперника (2 игрока, агент - игрок 1, игрок 0 -
+    self-play): как в app.py, перед ходом игрока 0 агенту раздаются карты
+    наперед, если он ходит на этой улице позже, и агент обдумывает seconds
+    секунд. Считаются обдуманные решения, решения, получившие статистику
+    обдумывания (SearchReport.reused_visits), и перенесенные посещения.
+    """
+    from mcts_agent import MCTSAgent
+    from search_params import SearchBudget
+
+    budget = SearchBudget(max_iterations=iterations)
+    with _quiet():
+        agent = MCTSAgent(parallel='none', rollouts_per_leaf=1, ponder_share=1.0, ponder_max_time_ms=seconds * 1000)
+    random.seed(seed)
+    decisions = 0; pondered = 0; ponder_simulations = 0
+    reused: List[int] = []
+    for g in range(games):
+        state = GameState(dealer_idx=g % 2, num_players=2)
+        with _quiet():
+            state.start_new_round(g % 2)
+            while not state.is_round_over():
+                p = state.advance()
+                if p == 0:
+                    if state.deal_ahead(1) and agent.start_pondering(g, state, 1):
+                        time.sleep(seconds)
+                        pondered += 1
+                    state = state.apply_action(p, _self_play_action(state, p))
+                    continue
+                action, report = agent.choose_action(state, session_id=g, budget=budget, seed=seed + decisions, return_report=True)
+                decisions += 1
+                if agent.last_ponder is not None and agent.last_ponder.session_key == (g, 1):
+                    ponder_simulations += agent.last_ponder.simulations
+                    agent.last_ponder = None
+                if report.reused_visits: reused.append(report.reused_visits)
+                state = state.apply_action(p, action)
+            agent.release_session(g)
+    agent.close()
+    return {'iterations': iterations, 'ponder_seconds': seconds, 'decisions': decisions,
+            'pondered': pondered, 'seeded': len(reused),
+            'ponder_simulations': ponder_simulations / max(1, pondered),
+            'reused_visits': sum(reused),
+            'visits_per_seeded': sum(reused) / max(1, len(reused))}
+
+
+def bench_widening(games: int = 4, seed: int = 0, iterations: int = 300) -> Dict[str, Any]:
+    """
+    Поиск на корнях улицы 1 (тысячи действий) без progressive widening и с ним
+    (настоящие роллауты в процессе): сколько детей раскрыто, сколько посещений
+    у лучшего ребенка и число симуляций до стабилизации рекомендации.
+    """
+    from mcts_agent import MCTSAgent
+
+    random.seed(seed)
+    positions: List[GameState] = []
+    with _quiet():
+        for g in range(games):
+            _play_round(lambda s, p: positions.append(s.copy()) if s.street == 1 else None, dealer_idx=g % 2)
+        agents = {'no_widening': MCTSAgent(num_workers=1, rollouts_per_leaf=1, street_params={1: {'pw_k': 0.0}}),
+                  'widening': MCTSAgent(num_workers=1, rollouts_per_leaf=1)}
+
+    def rollout(state: GameState, actions: List[int]):
+        return MCTSNode(state).rollout()
+
+    results: Dict[str, Any] = {'positions': len(positions), 'iterations': iterations}
+    for name, agent in agents.items():
+        random.seed(seed)
+        children: List[int] = []; best_visits: List[int] = []; converge: List[int] = []
+        for state in positions:
+            last_change = [0]; best_action = [None]
+            def on_iteration(it: int, root: MCTSNode):
+                if not root.children: return
+                best = MCTSAgent._best_child(root)
+                if best.action != best_action[0]: best_action[0] = best.action; last_change[0] = it + 1
+            with _quiet():
+                _, root = _search_nodes(agent, state, iterations, rollout, None, on_iteration)
+            children.append(len(root.children))
+            best_visits.append(MCTSAgent._best_child(root).visits)
+            converge.append(last_change[0])
+        n = max(1, len(positions))
+        results[name] = {'mean_children': sum(children) / n, 'mean_best_child_visits': sum(best_visits) / n,
+                         'mean_sims_to_converge': sum(converge) / n}
+    return results
+
+
+def bench_puct(games: int = 2, seed: int = 0, seconds: float = 1.5) -> Dict[str, Any]:
+    """
+    UCT+RAVE против PUCT с prior при одинаковом времени на позицию (настоящие
+    роллауты в процессе): число симуляций, раскрытых детей, доля посещений
+    пяти лучших детей и перцентиль prior у рекомендованного хода.
+    """
+    import numpy as np
+    from mcts_agent import MCTSAgent
+    from action_prior import action_priors
+
+    random.seed(seed)
+    positions: List[GameState] = []
+    with _quiet():
+        for g in range(games):
+            _play_round(lambda s, p: positions.append(s.copy()), dealer_idx=g % 2)
+        agents = {'uct': MCTSAgent(num_workers=1, rollouts_per_leaf=1),
+                  'puct': MCTSAgent(num_workers=1, rollouts_per_leaf=1, selection='puct')}
+
+    def rollout(state: GameState, actions: List[int]):
+        return MCTSNode(state).rollout()
+
+    results: Dict[str, Any] = {'positions': len(positions), 'seconds_per_position': seconds}
+    for name, agent in agents.items():
+        random.seed(seed)
+        sims = children = top5 = percentile = 0.0
+        for state in positions:
+            with _quiet():
+                _, root = _search_nodes(agent, state, 10**9, rollout, time_limit=seconds)
+            visits = sorted((child.visits for child in root.children.values()), reverse=True)
+            sims += root.visits; children += len(root.children)
+            top5 += sum(visits[:5]) / max(1, root.visits)
+            player = state.next_to_act()
+            codes = state.get_legal_action_codes_for_player(player)
+            priors = action_priors(state, player, codes)
+            # Слоты первой улицы сэмплируются - prior хода считаем отдельно, а не ищем в codes
+            best_prior = action_priors(state, player, [MCTSAgent._best_child(root).action])[0]
+            percentile += float(np.mean(priors < best_prior))
+        n = max(1, len(positions))
+        results[name] = {'mean_sims': sims / n, 'mean_children': children / n,
+                         'top5_visit_share': top5 / n, 'best_prior_percentile': percentile / n}
+    return results
+
+
+def bench_chance(games: int = 2, seed: int = 0, seconds: float = 2.0) -> Dict[str, Any]:
+    """
+    Раздачи в дереве: без узлов случая, с сэмплированными исходами (две
+    политики) и open-loop на позициях улиц 2-4 (настоящие роллауты). Для
+    каждого режима: симуляции, узлы (и на симуляцию), доля симуляций,
+    прошедших через узел ответного хода соперника, среднее посещений узлов
+    ответа и доля узлов ответа с одним посещением, максимальная глубина по
+    ходам; chance_root -
+    проверка несмещенности значения узла случая (_chance_root_bias).
+    """
+    from mcts_agent import MCTSAgent
+
+    random.seed(seed)
+    positions: List[GameState] = []
+    with _quiet():
+        for g in range(games):
+            _play_round(lambda s, p: positions.append(s.copy()) if 2 <= s.street <= 4 else None, dealer_idx=g % 2)
+        agents = {'none': MCTSAgent(num_workers=1, rollouts_per_leaf=1, chance_mode='none'),
+                  'sampled': MCTSAgent(num_workers=1, rollouts_per_leaf=1, chance_mode='sampled'),
+                  'sampled_balanced': MCTSAgent(num_workers=1, rollouts_per_leaf=1, chance_mode='sampled', chance_policy='balanced'),
+                  'open_loop': MCTSAgent(num_workers=1, rollouts_per_leaf=1, chance_mode='open_loop')}
+
+    def rollout(state: GameState, actions: List[int]):
+        return MCTSNode(state).rollout()
+
+    def action_depths(root: MCTSNode):
+        """(узел, число ходов от корня) для всех узлов дерева."""
+        stack = [(root, 0)]
+        while stack:
+            node, depth = stack.pop()
+            yield node, depth
+            for child in node.children.values(): stack.append((child, depth + (child.action is not None)))
+
+    results: Dict[str, Any] = {'positions': len(positions), 'seconds_per_position': seconds}
+    for name, agent in agents.items():
+        random.seed(seed)
+        sims = nodes = reply_share = max_depth = 0.0
+        reply_visits: List[int] = []
+        for state in positions:
+            with _quiet():
+                count, root = _search_nodes(agent, state, 10**9, rollout, time_limit=seconds)
+            sims += root.visits; nodes += count
+            depths = list(action_depths(root))
+            replies = [node.visits for node, depth in depths if depth == 2 and node.action is not None]
+            reply_share += sum(replies) / max(1, root.visits)
+            reply_visits.extend(replies)
+            max_depth += max(depth for _, depth in depths)
+        n = max(1, len(positions))
+        results[name] = {'mean_sims': sims / n, 'mean_nodes': nodes / n, 'nodes_per_sim': nodes / max(1.0, sims),
+                         'reply_visit_share': reply_share / n, 'mean_max_depth': max_depth / n,
+                         # Узлы ответа с одним посещением не дают дереву ничего сверх роллаута
+                         'reply_mean_visits': sum(reply_visits) / max(1, len(reply_visits)),
+                         'reply_single_visit_share': sum(v == 1 for v in reply_visits) / max(1, len(reply_visits))}
+    results['chance_root'] = _chance_root_bias(agents, positions, seed, seconds)
+    return results
+
+
+def _chance_root_bias(agents: Dict[str, Any], positions: List[GameState], seed: int, seconds: float) -> Dict[str, Any]:
+    """
+    Несмещенность значения узла случая: корень - позиция после хода по prior
+    (следующему игроку раздача еще не пришла). Раздачи равновероятны, поэтому
+    Q корня (среднее по посещениям исходов) должен совпадать со средним Q
+    исходов с равными весами; q_gap - средняя разность (для масштаба -
+    q_spread, разброс Q исходов), visit_ratio - отношение самого посещаемого
+    исхода к наименее посещаемому.
+    """
+    from action_prior import best_by_prior
+
+    roots = []
+    for state in positions:
+        player = state.next_to_act()
+        after = state.apply_action(player, best_by_prior(state, player, state.get_legal_action_codes_for_player(player)))
+        if not after.is_round_over() and MCTSNode(after).is_chance_node(): roots.append((after, player))
+    results: Dict[str, Any] = {'roots': len(roots)}
+    for name in ('sampled', 'sampled_balanced'):
+        random.seed(seed)
+        gap = spread = ratio = 0.0
+        for state, player in roots:
+            with _quiet():
+                _, root = _search_nodes(agents[name], state, 10**9, lambda s, actions: MCTSNode(s).rollout(), time_limit=seconds)
+            outcomes = [child for child in root.children.values() if child.visits > 0]
+            if not outcomes: continue
+            q = [child.get_q_value(player) for child in outcomes]
+            visits = [child.visits for child in outcomes]
+            gap += abs(sum(v * x for v, x in zip(visits, q)) / sum(visits) - sum(q) / len(q))
+            spread += max(q) - min(q)
+            ratio += max(visits) / min(visits)
+        n = max(1, len(roots))
+        results[name] = {'q_gap': gap / n, 'q_spread': spread / n, 'visit_ratio': ratio / n}
+    return results
+
+
+def bench_parallel(games: int = 1, seed: int = 0, seconds: float = 3.0) -> Dict[str, Any]:
+    """
+    MCTSAgent.choose_action (настоящий пул процессов) при leaf-, tree- и
+    root-параллелизме для числа воркеров от 1 до числа ядер: симуляций в
+    секунду и доля позиций, где решение совпало с решением tree-режима
+    (для самого tree - со вторым независимым прогоном, т.е. уровень шума).
+    Пул агента живет все прогоны режима: запуск пула попадает в первый ход.
+    """
+    import multiprocessing
+    from mcts_agent import MCTSAgent
+
+    random.seed(seed)
+    positions: List[GameState] = []
+    with _quiet():
+        for g in range(games):
+            _play_round(lambda s, p: positions.append(s.copy()) if 2 <= s.street <= 4 else None, dealer_idx=g % 2)
+    positions = positions[:4]
+
+    def run(mode: str, workers: int) -> Tuple[float, List[Any]]:
+        with _quiet():
+            agent = MCTSAgent(num_workers=workers, rollouts_per_leaf=workers, time_limit_ms=seconds * 1000, parallel=mode)
+        sims = 0; decisions = []
+        for state in positions:
+            with _quiet():
+                decisions.append(agent.choose_action(state))
+            sims += agent.last_simulations
+        agent.close()
+        return sims / (seconds * max(1, len(positions))), decisions
+
+    cpus = multiprocessing.cpu_count()
+    worker_counts = sorted({1, 2, cpus // 2, cpus} & set(range(1, cpus + 1)))
+    results: Dict[str, Any] = {'positions': len(positions), 'cpus': cpus, 'seconds_per_position': seconds}
+    base_rate = None
+    for workers in worker_counts:
+        random.seed(seed)
+        runs = {mode: run(mode, workers) for mode in ('tree', 'leaf', 'root')}
+        _, tree_repeat = run('tree', workers)
+        row: Dict[str, Any] = {}
+        for mode, (rate, decisions) in runs.items():
+            if base_rate is None: base_rate = runs['leaf'][0]
+            reference = tree_repeat if mode == 'tree' else runs['tree'][1]
+            row[mode] = {'sims_per_sec': rate, 'speedup_vs_leaf_1': rate / max(base_rate, 1e-9),
+                         'agreement_with_tree': sum(a == b for a, b in zip(decisions, reference)) / max(1, len(positions))}
+        results[f'workers_{workers}'] = row
+    return results
+
+
+def bench_pool(moves: int = 5, seed: int = 0, workers: int = 2) -> Dict[str, Any]:
+    """
+    Постоянная (не зависящая от лимита времени) стоимость хода, связанная с
+    пулом процессов: раньше каждый ход создавал пул 'spawn', ждал первый
+    роллаут и останавливал пул; теперь пул агента создается один раз
+    (инициализатор прогревает таблицы), а ход платит лишь за передачу задачи.
+    """
+    import multiprocessing
+    from mcts_agent import MCTSAgent, run_parallel_rollout
+
+    random.seed(seed)
+    with _quiet():
+        state = GameState()
+        state.start_new_round(0)
+        agent = MCTSAgent(num_workers=workers, rollouts_per_leaf=1)
+    state_dict = state.to_dict()
+    context = multiprocessing.get_context(agent.POOL_START_METHOD)
+
+    per_move_pool = []
+    for _ in range(moves):
+        start = time.perf_counter()
+        with context.Pool(processes=agent.num_workers) as pool:
+            pool.apply(run_parallel_rollout, (state_dict,))
+        per_move_pool.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    agent.warm_up()
+    warm_up = time.perf_counter() - start
+    pool = agent._get_pool()
+    round_trips = []
+    for _ in range(moves):
+        start = time.perf_counter()
+        pool.apply(run_parallel_rollout, (state_dict,))
+        round_trips.append(time.perf_counter() - start)
+    agent.close()
+    with _quiet():
+        start = time.perf_counter()
+        for _ in range(moves): run_parallel_rollout(state_dict)
+        in_process = (time.perf_counter() - start) / moves
+    return {'workers': agent.num_workers, 'moves': moves,
+            'new_pool_per_move_ms': 1000 * sum(per_move_pool) / moves,
+            'persistent_pool_warm_up_ms': 1000 * warm_up,
+            'persistent_pool_per_move_ms': 1000 * sum(round_trips) / moves,
+            'rollout_in_process_ms': 1000 * in_process}
+
+
+def bench_pipeline(games: int = 1, seed: int = 0, seconds: float = 2.0) -> Dict[str, Any]:
+    """
+    Конвейер роллаутов MCTSAgent.choose_action: синхронный leaf-режим против
+    tree-режима с разным числом листьев в задаче пула. Для каждого варианта -
+    симуляций в секунду, листьев на задачу, загрузка воркеров (доля их
+    времени в роллаутах) и простой основного процесса в ожидании результатов.
+    """
+    from mcts_agent import MCTSAgent
+
+    random.seed(seed)
+    positions: List[GameState] = []
+    with _quiet():
+        for g in range(games):
+            _play_round(lambda s, p: positions.append(s.copy()) if 2 <= s.street <= 4 else None, dealer_idx=g % 2)
+    positions = positions[:4]
+
+    variants = {'leaf': {'parallel': 'leaf'}}
+    variants.update({f'tree_batch_{size}': {'parallel': 'tree', 'leaf_batch_size': size} for size in (1, 2, 4, 8)})
+    results: Dict[str, Any] = {'positions': len(positions), 'seconds_per_position': seconds}
+    for name, options in variants.items():
+        with _quiet():
+            agent = MCTSAgent(rollouts_per_leaf=1, time_limit_ms=seconds * 1000, **options)
+            agent.warm_up()
+        totals = {'sims': 0, 'tasks': 0, 'leaves': 0, 'worker_busy': 0.0, 'parent_wait': 0.0, 'wall_time': 0.0}
+        for state in positions:
+            with _quiet():
+                agent.choose_action(state)
+            stats = agent.last_pipeline_stats
+            totals['sims'] += agent.last_simulations
+            for key in ('tasks', 'leaves', 'worker_busy', 'parent_wait', 'wall_time'): totals[key] += getattr(stats, key)
+        agent.close()
+        wall = max(totals['wall_time'], 1e-9)
+        results[name] = {'workers': agent.num_workers, 'sims_per_sec': totals['sims'] / wall,
+                         'leaves_per_task': totals['leaves'] / max(1, totals['tasks']),
+                         'worker_utilization': totals['worker_busy'] / (agent.num_workers * wall),
+                         'parent_idle': totals['parent_wait'] / wall}
+    return results
+
+
+def bench_transfer(games: int = 10, seed: int = 0) -> Dict[str, Any]:
+    """
+    Передача листа воркеру и результата обратно: словарь to_dict через pickle
+    (и from_dict в воркере) против слота кольца в разделяемой памяти
+    (state_codec). Микросекунды на лист в основном процессе и в воркере и
+    байты, которые уходят через очередь пула.
+    """
+    import pickle
+    from mcts_agent import run_ring_rollouts, run_rollout_batch
+    from rollout_ring import RolloutRing
+
+    random.seed(seed)
+    states: List[GameState] = []
+    with _quiet():
+        for g in range(games):
+            _play_round(lambda s, p: states.append(s.copy()), dealer_idx=g % 2)
+    with _quiet():
+        outcomes = [MCTSNode(state).rollout() for state in states]
+
+    def per_leaf(fn: Callable[[], Any]) -> float:
+        start = time.perf_counter()
+        with _quiet(): fn()
+        return 1e6 * (time.perf_counter() - start) / len(states)
+
+    payloads: List[bytes] = []
+    results: Dict[str, Any] = {'leaves': len(states)}
+    results['dict'] = {
+        'parent_send_us': per_leaf(lambda: payloads.extend(pickle.dumps((run_rollout_batch, ([state.to_dict()],))) for state in states)),
+        'worker_receive_us': per_leaf(lambda: [GameState.from_dict(pickle.loads(payload)[1][0][0]) for payload in payloads]),
+        'worker_reply_us': per_leaf(lambda: payloads.extend(pickle.dumps(([outcome], 0.0)) for outcome in outcomes)),
+        'parent_receive_us': per_leaf(lambda: [pickle.loads(payload) for payload in payloads[len(states):]]),
+        'task_bytes': sum(map(len, payloads[:len(states)])) / len(states),
+        'reply_bytes': sum(map(len, payloads[len(states):])) / len(states)}
+
+    ring = RolloutRing(len(states))
+    try:
+        slots = ring.acquire(len(states))
+        task_args = (ring.name, ring.num_slots, [0])
+        results['ring'] = {
+            'parent_send_us': per_leaf(lambda: [(ring.write_state(slot, state), pickle.dumps((run_ring_rollouts, task_args)))
+                                                for slot, state in zip(slots, states)]),
+            'worker_receive_us': per_leaf(lambda: [ring.read_state(slot) for slot in slots]),
+            'worker_reply_us': per_leaf(lambda: [(ring.write_result(slot, *outcome), pickle.dumps(0.0)) for slot, outcome in zip(slots, outcomes)]),
+            'parent_receive_us': per_leaf(lambda: [ring.read_result(slot, state.num_players) for slot, state in zip(slots, states)]),
+            'task_bytes': len(pickle.dumps((run_ring_rollouts, task_args))),
+            'reply_bytes': len(pickle.dumps(0.0))}
+    finally:
+        ring.close()
+    return results
+
+
+def bench_budget(games: int = 1, seed: int = 0, iterations: int = 200) -> Dict[str, Any]:
+    """
+    Бюджеты и воспроизводимость choose_action: при parallel='none' и бюджете
+    в итерациях поиск с одним seed повторяет решение и число симуляций,
+    с другим seed - нет; глобальные генераторы после поиска не меняются.
+    Плюс время поиска фиксированного объема по режимам (в tree/leaf решения
+    зависят еще и от порядка ответов пула).
+    """
+    from mcts_agent import MCTSAgent
+    from search_params import SearchBudget
+
+    random.seed(seed)
+    positions: List[GameState] = []
+    with _quiet():
+        for g in range(games):
+            _play_round(lambda s, p: positions.append(s.copy()) if 2 <= s.street <= 4 else None, dealer_idx=g % 2)
+    positions = positions[:4]
+    budget = SearchBudget(max_iterations=iterations)
+
+    results: Dict[str, Any] = {'positions': len(positions), 'iterations': iterations}
+    for store in ('nodes', 'arrays'):
+        with _quiet():
+            agent = MCTSAgent(parallel='none', tree_store=store, rollouts_per_leaf=1)
+        runs = []
+        for search_seed in (1, 1, 2):
+            decisions = []
+            for state in positions:
+                random_state = random.getstate()
+                with _quiet():
+                    decisions.append((agent.choose_action(state, budget=budget, seed=search_seed), agent.last_simulations))
+                assert random.getstate() == random_state
+            runs.append(decisions)
+        results[store] = {'same_seed_identical': runs[0] == runs[1],
+                          'other_seed_agreement': sum(a[0] == b[0] for a, b in zip(runs[0], runs[2])) / max(1, len(positions))}
+
+    for mode in ('none', 'leaf', 'tree', 'root'):
+        with _quiet():
+            agent = MCTSAgent(parallel=mode, rollouts_per_leaf=1)
+            agent.warm_up()
+        elapsed = 0.0; sims = 0
+        for state in positions:
+            start = time.perf_counter()
+            with _quiet():
+                agent.choose_action(state, budget=budget, seed=seed)
+            elapsed += time.perf_counter() - start
+            sims += agent.last_simulations
+        agent.close()
+        results[f'{mode}_fixed_work'] = {'ms_per_search': 1000 * elapsed / max(1, len(positions)),
+                                         'sims_per_search': sims / max(1, len(positions))}
+    return results
+
+
+def bench_time(games: int = 1, seed: int = 0, seconds: float = 1.0) -> Dict[str, Any]:
+    """
+    TimeManager против постоянного time_limit_ms при одинаковом времени на
+    раунд (seconds на решение в среднем): задержка решения по улицам,
+    причины остановки и совпадение решений с эталоном - поиском вдвое
+    дольше постоянного лимита.
+    """
+    from mcts_agent import MCTSAgent
+    from time_manager import TimeManager
+
+    random.seed(seed)
+    positions: List[GameState] = []
+    with _quiet():
+        for g in range(games):
+            _play_round(lambda s, p: positions.append(s.copy()) if p == 0 else None, dealer_idx=g % 2)
+
+    def run(time_limit: float, time_manager: Optional[TimeManager]) -> Tuple[List[float], List[Any], List[Optional[str]]]:
+        with _quiet():
+            agent = MCTSAgent(parallel='none', rollouts_per_leaf=1, time_limit_ms=time_limit * 1000, time_manager=time_manager)
+        latencies, decisions, reasons = [], [], []
+        for i, state in enumerate(positions):
+            start = time.perf_counter()
+            with _quiet():
+                decisions.append(agent.choose_action(state, seed=seed + i))
+            latencies.append(time.perf_counter() - start)
+            reasons.append(agent.last_clock.stop_reason if agent.last_clock is not None else None)
+        return latencies, decisions, reasons
+
+    _, reference, _ = run(2 * seconds, None)
+    results: Dict[str, Any] = {'positions': len(positions), 'seconds_per_decision': seconds}
+    for name, time_manager in (('fixed', None), ('adaptive', TimeManager(5 * seconds))):
+        latencies, decisions, reasons = run(seconds, time_manager)
+        per_street: Dict[int, List[float]] = {}
+        for state, latency in zip(positions, latencies): per_street.setdefault(state.street, []).append(latency)
+        results[name] = {'mean_latency_ms': 1000 * sum(latencies) / max(1, len(latencies)),
+                         'agreement_with_reference': sum(a == b for a, b in zip(decisions, reference)) / max(1, len(positions)),
+                         **{f'street_{street}_ms': 1000 * sum(values) / len(values) for street, values in sorted(per_street.items())}}
+        if time_manager is not None:
+            results[name]['stop_reasons'] = {str(reason): reasons.count(reason) for reason in sorted(set(reasons), key=str)}
+    return results
+
+
+def bench_service(games: int = 1, seed: int = 0, seconds: float = 1.0, clients: Tuple[int, ...] = (1, 2, 4)) -> Dict[str, Any]:
+    """
+    Сервис поиска (search_service) при одновременных решениях: clients
+    потоков одновременно запрашивают решения у одного SearchService (без
+    сокета). Для каждого числа клиентов и политики - средняя и худшая
+    задержка, симуляций на решение и доля времени в ожидании хода.
+    """
+    import threading
+    from mcts_agent import MCTSAgent
+    from search_service import SearchScheduler, SearchService
+
+    random.seed(seed)
+    positions: List[GameState] = []
+    with _quiet():
+        for g in range(games):
+            _play_round(lambda s, p: positions.append(s.copy()) if p == 0 and 2 <= s.street <= 4 else None, dealer_idx=g % 2)
+    results: Dict[str, Any] = {'positions': len(positions), 'seconds_per_decision': seconds}
+    for policy in SearchScheduler.POLICIES:
+        with _quiet():
+            service = SearchService(MCTSAgent(parallel='tree', rollouts_per_leaf=1, time_limit_ms=seconds * 1000), policy=policy)
+            service.agent.warm_up()
+        for count in clients:
+            latencies: List[float] = []
+            simulations: List[int] = []
+
+            def client(index: int):
+                for state in positions[index::count] or positions[:1]:
+                    start = time.perf_counter()
+                    _, report = service.choose_action(state, return_report=True)
+                    latencies.append(time.perf_counter() - start)
+                    simulations.append(report.simulations)
+
+            scheduler = service.scheduler
+            waited, elapsed = scheduler.total_waited, scheduler.total_elapsed
+            threads = [threading.Thread(target=client, args=(i,)) for i in range(count)]
+            with _quiet():
+                for thread in threads: thread.start()
+                for thread in threads: thread.join()
+            results[f'{policy}_{count}_clients'] = {'mean_latency_ms': 1000 * sum(latencies) / len(latencies),
+                                                    'max_latency_ms': 1000 * max(latencies),
+                                                    'sims_per_decision': sum(simulations) / len(simulations),
+                                                    'wait_share': (scheduler.total_waited - waited) / max(1e-9, scheduler.total_elapsed - elapsed)}
+        service.close()
+    return results
+
+
+def bench_solver(games: int = 4, seed: int = 0, seconds: float = 0.5, players: Tuple[int, ...] = (2, 3)) -> Dict[str, Any]:
+    """
+    MCTS-Solver на улицах 4-5: доля решений с решенным корнем, задержка и
+    итерации по улицам с солвером и без (итерации в решенные поддеревья
+    обходятся без роллаутов, решенный корень останавливает поиск). За столом
+    на 3 игрока последние раздачи перебираются целиком и узлы случая решаемы.
+    """
+    from mcts_agent import MCTSAgent
+
+    results: Dict[str, Any] = {'seconds_per_decision': seconds}
+    for num_players in players:
+        random.seed(seed)
+        positions: List[GameState] = []
+        with _quiet():
+            for g in range(games):
+                _play_round(lambda s, p: positions.append(s.copy()) if s.street >= 4 else None,
+                            dealer_idx=g % num_players, num_players=num_players)
+        table: Dict[str, Any] = {'positions': len(positions)}
+        for solver in (False, True):
+            with _quiet():
+                agent = MCTSAgent(parallel='none', rollouts_per_leaf=1, time_limit_ms=seconds * 1000, solver=solver)
+            per_street: Dict[int, List[Tuple[float, int]]] = {}
+            solved = 0
+            for i, state in enumerate(positions):
+                start = time.perf_counter()
+                with _quiet():
+                    _, report = agent.choose_action(state, seed=seed + i, return_report=True)
+                per_street.setdefault(state.street, []).append((time.perf_counter() - start, report.iterations))
+                solved += report.stop_reason == 'solved'
+            name = 'solver' if solver else 'no_solver'
+            table[name] = {'solved_roots': solved / max(1, len(positions))}
+            for street, values in sorted(per_street.items()):
+                table[name][f'street_{street}_ms'] = 1000 * sum(latency for latency, _ in values) / len(values)
+                table[name][f'street_{street}_iterations'] = sum(iterations for _, iterations in values) / len(values)
+        results[f'{num_players}_players'] = table
+    return results
+
+
+def bench_rave(games: int = 2, seed: int = 0, backprops: int = 2000) -> Dict[str, Any]:
+    """
+    Стоимость RAVE-обновления одного узла при обратном распространении:
+    массивы с scatter-add (MCTSNode.update_rave) против прежней схемы на
+    множествах (пересечение действий симуляции с детьми и неопробованными
+    действиями узла). Отдельно для корней улицы 1 (тысячи действий) и улиц 2-5.
+    """
+    from mcts_node import action_code_array
+
+    random.seed(seed)
+    positions: List[GameState] = []
+    with _quiet():
+        for g in range(games): _play_round(lambda s, p: positions.append(s.copy()), dealer_idx=g % 2)
+
+    def set_update(node: MCTSNode, rave: Dict[int, List[float]], simulation_actions: set, reward: float):
+        possible = set(node.children.keys())
+        if node.untried_actions: possible.update(node.untried_actions)
+        for action in simulation_actions.intersection(possible):
+            if action in rave: rave[action][0] += 1; rave[action][1] += reward
+
+    results: Dict[str, Any] = {'backprops_per_position': backprops}
+    for label, streets in (('street1', (1,)), ('streets2_5', (2, 3, 4, 5))):
+        nodes = []
+        for state in positions:
+            if state.street not in streets: continue
+            node = MCTSNode(state)
+            node.init_untried_actions()
+            nodes.append(node)
+        timings = {'sets': 0.0, 'arrays': 0.0}
+        for node in nodes:
+            # Симуляция играет ~10 действий, пара из них - действия этого узла
+            own = random.sample(node.untried_actions, min(2, len(node.untried_actions)))
+            sims = [set(own) | {random.getrandbits(50) << 2 for _ in range(8)} for _ in range(backprops)]
+            rave = {action: [0, 0.0] for action in node.untried_actions}
+            start = time.perf_counter()
+            for sim in sims: set_update(node, rave, sim, 1.0)
+            timings['sets'] += time.perf_counter() - start
+            codes = [action_code_array(sim) for sim in sims]
+            start = time.perf_counter()
+            for sim in codes: node.update_rave(sim, 1, 1.0)
+            timings['arrays'] += time.perf_counter() - start
+            assert all(rave[a][0] == v for a, v in zip(node.rave_actions.tolist(), node.rave_visits.tolist()))
+        count = max(1, len(nodes) * backprops)
+        results[label] = {'nodes': len(nodes),
+                          'mean_actions': sum(len(n.untried_actions) for n in nodes) / max(1, len(nodes)),
+                          'sets_us': 1e6 * timings['sets'] / count, 'arrays_us': 1e6 * timings['arrays'] / count,
+                          'speedup': timings['sets'] / max(timings['arrays'], 1e-12)}
+    return results
+
+
+def bench_gumbel(games: int = 1, seed: int = 0, simulations: Tuple[int, ...] = (200, 1000, 5000),
+                 eval_rollouts: int = 200) -> Dict[str, Any]:
+    """
+    Качество решения при малом бюджете симуляций: корень UCB1 + RAVE против
+    Gumbel-top-k + sequential halving (root_selection='gumbel'). Ценность
+    выбранного действия - средние очки ходящего в eval_rollouts роллаутах
+    после него (одни и те же раздачи для одного действия позиции); для
+    сравнения - лучшее по prior действие без поиска. Позиции - решения улиц 1-4.
+    """
+    from action_codec import encode_action
+    from action_prior import best_by_prior
+    from mcts_agent import MCTSAgent
+    from search_params import SearchBudget
+
+    random.seed(seed)
+    positions: List[Tuple[GameState, int]] = []
+    with _quiet():
+        for g in range(games):
+            _play_round(lambda s, p: positions.append((s.copy(), p)) if s.street <= 4 else None, dealer_idx=g % 2)
+
+    values: Dict[Tuple[int, int], float] = {} # (позиция, действие) -> оценка
+    def action_value(i: int, action: int) -> float:
+        if (i, action) not in values:
+            state, player = positions[i]
+            saved = random.getstate()
+            random.seed(seed * 7919 + i) # Общие раздачи для всех методов
+            with _quiet():
+                after = state.apply_action(player, action)
+                values[i, action] = sum(float(MCTSNode(after).rollout()[0][player]) for _ in range(eval_rollouts)) / eval_rollouts
+            random.setstate(saved)
+        return values[i, action]
+
+    results: Dict[str, Any] = {'positions': len(positions), 'eval_rollouts': eval_rollouts}
+    prior_actions = [best_by_prior(state, player, state.get_legal_action_codes_for_player(player)) for state, player in positions]
+    results['prior_value'] = sum(action_value(i, action) for i, action in enumerate(prior_actions)) / max(1, len(positions))
+    for root_selection in ('uct', 'gumbel'):
+        with _quiet():
+            agent = MCTSAgent(parallel='none', rollouts_per_leaf=1, root_selection=root_selection)
+        for sims in simulations:
+            total_value, elapsed, iterations = 0.0, 0.0, 0
+            for i, (state, player) in enumerate(positions):
+                start = time.perf_counter()
+                with _quiet():
+                    action, report = agent.choose_action(state, budget=SearchBudget(max_simulations=sims), seed=seed + i, return_report=True)
+                elapsed += time.perf_counter() - start
+                iterations += report.iterations
+                total_value += action_value(i, encode_action(action))
+            results[f'{root_selection}_{sims}'] = {'value': total_value / max(1, len(positions)),
+                                                   'ms': 1000 * elapsed / max(1, len(positions)),
+                                                   'iterations': iterations / max(1, len(positions))}
+    return results
+
+
+BENCHMARKS: Dict[str, Callable[..., Dict[str, Any]]] = {
+    'canonical': bench_canonical,
+    'batch': bench_batch,
+    'tree': bench_tree,
+    'transpositions': bench_transpositions,
+    'reuse': bench_reuse,
+    'ponder': bench_ponder,
+    'widening': bench_widening,
+    'puct': bench_puct,
+    'chance': bench_chance,
+    'parallel': bench_parallel,
+    'pool': bench_pool,
+    'pipeline': bench_pipeline,
+    'transfer': bench_transfer,
+    'budget': bench_budget,
+    'time': bench_time,
+    'service': bench_service,
+    'solver': bench_solver,
+    'rave': bench_rave,
+    'gumbel': bench_gumbel,
+}
+
+def _print_results(name: str, results: Dict[str, Any], indent: int = 0):
+    pad = "  " * indent
+    for key, value in results.items():
+        if isinstance(value, dict):
+            print(f"{pad}{key}:")
+            _print_results(name, value, indent + 1)
+        elif isinstance(value, float):
+            print(f"{pad}{key}: {value:.4f}")
+        else:
+            print(f"{pad}{key}: {value}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="OFC engine/search benchmarks")
+    parser.add_argument('name', choices=sorted(BENCHMARKS))
+    parser.add_argument('--games', type=int, default=None)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    kwargs: Dict[str, Any] = {'seed': args.seed}
+    if args.games is not None: kwargs['games'] = args.games
+    print(f"=== {args.name} ===")
+    _print_results(args.name, BENCHMARKS[args.name](**kwargs))
@@ -146,6 +146,10 @@ class PlayerBoard:
                  self._cached_ranks[row_name] = get_hand_rank_safe(cards)
         return self._cached_ranks[row_name]
 
+    def get_rank_vector(self) -> Tuple[int, int, int]:
+        """Ранги рядов (top, middle, bottom) для векторного подсчета очков."""
+        return (self._get_rank('top'), self._get_rank('middle'), self._get_rank('bottom'))
+
     def check_and_set_foul(self) -> bool:
         """Проверяет фол и устанавливает флаг is_foul. Вызывать только на полной доске."""
         if not self.is_complete():
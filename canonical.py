@@ -0,0 +1,138 @@
+# canonical.py
+"""
+Канонизация позиций OFC по изоморфизму мастей.
+
+Масти в OFC равноправны: позиции, отличающиеся только перестановкой мастей,
+имеют одинаковую ценность. Канонизатор переводит руку, пару (доска, рука)
+или GameState в ключ, общий для всех таких позиций, и возвращает
+перестановку мастей, чтобы результат (например, действие из кэша)
+можно было перевести обратно в исходные масти.
+
+Устройство ключа: позиция разбивается на упорядоченные зоны (ряды досок,
+руки, сбросы). Для каждой масти строится сигнатура - целое число, в котором
+для каждой зоны выделено 13 бит маски рангов (первая зона - старшие биты).
+Канонической считается перемаркировка, при которой сигнатуры мастей идут
+по возрастанию; кортеж сигнатур в этом порядке лексикографически минимален
+среди всех 24 перемаркировок. Масти с равными сигнатурами взаимозаменяемы,
+поэтому выбор между ними на ключ не влияет.
+Стоимость - один проход по картам и сортировка четырех чисел.
+"""
+from typing import TYPE_CHECKING, Any, Iterable, List, Optional, Sequence, Tuple
+
+from card import Card
+from card_index import CARD_TO_INDEX, INDEX_TO_CARD, NUM_RANKS, NUM_SUITS
+from action_codec import decode_action, encode_action
+
+if TYPE_CHECKING: # Только для аннотаций
+    from board import PlayerBoard
+    from game_state import GameState
+
+# perm[old_suit] = new_suit
+SuitPermutation = Tuple[int, int, int, int]
+IDENTITY_PERMUTATION: SuitPermutation = (0, 1, 2, 3)
+
+# Ключ: кортеж сигнатур мастей (+ скалярная часть для GameState)
+CanonicalKey = Tuple[Any, ...]
+
+
+def _suit_signatures(zones: Sequence[Iterable[Optional[Card]]]) -> List[int]:
+    """Строит сигнатуры 4 мастей по упорядоченным зонам (None игнорируются)."""
+    sigs = [0, 0, 0, 0]
+    num_zones = len(zones)
+    for z, zone in enumerate(zones):
+        shift = NUM_RANKS * (num_zones - 1 - z)
+        for card in zone:
+            if card is None: continue
+            idx = CARD_TO_INDEX[card]
+            sigs[idx & 3] |= 1 << ((idx >> 2) + shift)
+    return sigs
+
+def _canonicalize_zones(zones: Sequence[Iterable[Optional[Card]]],
+                        canonical: bool = True) -> Tuple[Tuple[int, ...], SuitPermutation]:
+    """Возвращает (кортеж сигнатур в каноническом порядке, перестановку мастей)."""
+    sigs = _suit_signatures(zones)
+    if not canonical:
+        return tuple(sigs), IDENTITY_PERMUTATION
+    order = sorted(range(NUM_SUITS), key=sigs.__getitem__) # order[new] = old
+    perm = [0, 0, 0, 0]
+    for new_suit, old_suit in enumerate(order):
+        perm[old_suit] = new_suit
+    return tuple(sigs[old] for old in order), tuple(perm)
+
+
+# --- Публичный API ---
+
+def canonicalize_hand(hand: Iterable[Card], canonical: bool = True) -> Tuple[CanonicalKey, SuitPermutation]:
+    """Канонический ключ набора карт (руки) и перестановка мастей."""
+    return _canonicalize_zones((hand,), canonical)
+
+def canonicalize_board_hand(board: 'PlayerBoard', hand: Optional[Iterable[Card]],
+                            canonical: bool = True) -> Tuple[CanonicalKey, SuitPermutation]:
+    """Канонический ключ пары (доска, рука). Позиции карт внутри ряда не учитываются."""
+    zones = (board.rows['top'], board.rows['middle'], board.rows['bottom'], hand or ())
+    return _canonicalize_zones(zones, canonical)
+
+def canonicalize_state(state: 'GameState', perspective_player: Optional[int] = None,
+                       canonical: bool = True) -> Tuple[CanonicalKey, SuitPermutation]:
+    """
+    Канонический ключ GameState.
+    Если perspective_player задан, учитывается только информация, видимая этому
+    игроку (чужие руки и сбросы скрыты). Иначе ключ описывает полное состояние.
+    """
+    zones: List[Iterable[Optional[Card]]] = []
+    for i, board in enumerate(state.boards):
+        zones.append(board.rows['top'])
+        zones.append(board.rows['middle'])
+        zones.append(board.rows['bottom'])
+        visible = perspective_player is None or perspective_player == i
+        zones.append((state.get_player_hand(i) or ()) if visible else ())
+        zones.append(state.private_discard[i] if visible else ())
+    sigs, perm = _canonicalize_zones(zones, canonical)
+    scalars = (state.dealer_idx, state.current_player_idx, state.street,
+               state.is_fantasyland_round,
+               tuple(state.fantasyland_status),
+               tuple(state.get_player_hand(i) is not None for i in range(len(state.boards))),
+               tuple(state._player_acted_this_street),
+               tuple(state._player_finished_round))
+    return (sigs, scalars), perm
+
+
+# --- Применение перестановок ---
+
+def invert_permutation(perm: SuitPermutation) -> SuitPermutation:
+    """Обратная перестановка мастей."""
+    inv = [0, 0, 0, 0]
+    for old_suit, new_suit in enumerate(perm):
+        inv[new_suit] = old_suit
+    return tuple(inv)
+
+def permute_card(card: Card, perm: SuitPermutation) -> Card:
+    """Переводит карту в новые масти: масть s становится perm[s]."""
+    idx = CARD_TO_INDEX[card]
+    return INDEX_TO_CARD[(idx & ~3) | perm[idx & 3]]
+
+def permute_cards(cards: Iterable[Optional[Card]], perm: SuitPermutation) -> List[Optional[Card]]:
+    """Переводит список карт в новые масти (None сохраняются)."""
+    return [permute_card(c, perm) if c is not None else None for c in cards]
+
+def permute_action(action: Any, perm: SuitPermutation) -> Any:
+    """
+    Переводит действие (int-код или вложенные кортежи/списки/словари с Card)
+    в новые масти. Для возврата действия из канонических мастей в исходные
+    передайте invert_permutation(perm).
+    """
+    if isinstance(action, int) and not isinstance(action, bool):
+        return encode_action(_permute_nested(decode_action(action), perm))
+    return _permute_nested(action, perm)
+
+def _permute_nested(item: Any, perm: SuitPermutation) -> Any:
+    """Рекурсивно заменяет Card во вложенных структурах (прочие значения не меняются)."""
+    if isinstance(item, Card):
+        return permute_card(item, perm)
+    if isinstance(item, tuple):
+        return tuple(_permute_nested(a, perm) for a in item)
+    if isinstance(item, list):
+        return [_permute_nested(a, perm) for a in item]
+    if isinstance(item, dict):
+        return {k: _permute_nested(v, perm) for k, v in item.items()}
+    return item
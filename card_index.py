@@ -0,0 +1,34 @@
+# card_index.py
+"""
+Плотная нумерация карт 0..51 (index = rank * 4 + suit).
+Используется для компактных ключей кэшей, упакованных действий и массивов.
+"""
+from typing import Dict, List
+from card import Card, card_from_str
+
+RANKS = '23456789TJQKA'
+SUITS = 'cdhs'
+NUM_RANKS = 13
+NUM_SUITS = 4
+NUM_CARDS = 52
+
+# Таблицы строятся один раз при импорте
+INDEX_TO_CARD: List[Card] = [card_from_str(r + s) for r in RANKS for s in SUITS]
+CARD_TO_INDEX: Dict[Card, int] = {card: i for i, card in enumerate(INDEX_TO_CARD)}
+
+
+def card_to_index(card: Card) -> int:
+    """Возвращает индекс карты 0..51."""
+    return CARD_TO_INDEX[card]
+
+def index_to_card(index: int) -> Card:
+    """Возвращает объект Card по индексу 0..51."""
+    return INDEX_TO_CARD[index]
+
+def index_rank(index: int) -> int:
+    """Ранг карты по индексу: 0 (двойка) .. 12 (туз)."""
+    return index >> 2
+
+def index_suit(index: int) -> int:
+    """Масть карты по индексу: 0..3 в порядке SUITS."""
+    return index & 3
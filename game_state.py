@@ -1,7 +1,7 @@
 # game_state.py
 """
 Определяет класс GameState, управляющий полным состоянием игры
-OFC Pineapple для двух игроков.
+OFC Pineapple для 2-3 игроков.
 """
 import copy
 import random
@@ -14,10 +14,19 @@ from typing import List, Tuple, Optional, Set, Dict, Any
 from card import Card, card_to_str, card_from_str
 from deck import Deck
 from board import PlayerBoard
-from scoring import calculate_headsup_score # Функция подсчета очков
+import numpy as np
+from scoring import calculate_scores # Векторный подсчет очков всех игроков
+from card_index import CARD_TO_INDEX
+from action_codec import decode_action, slot_of, street1_codes, pineapple_codes
+
+# Фазы хода (GameState.phase())
+PHASE_ACT = 'act'                   # Игрок next_to_act() получил карты и должен ходить
+PHASE_PENDING_DEAL = 'pending_deal' # Ход за игроком, но карты еще не розданы (см. advance())
+PHASE_ROUND_OVER = 'round_over'
 
 class GameState:
-    NUM_PLAYERS = 2
+    NUM_PLAYERS = 2 # Число игроков по умолчанию
+    MAX_PLAYERS = 3 # 17 карт на игрока за раунд: больше трех не хватит колоды
 
     def __init__(self,
                  boards: Optional[List[PlayerBoard]] = None,
@@ -33,22 +42,32 @@ class GameState:
                  is_fantasyland_round: bool = False,
                  fantasyland_hands: Optional[List[Optional[List[Card]]]] = None,
                  _player_acted_this_street: Optional[List[bool]] = None,
-                 _player_finished_round: Optional[List[bool]] = None):
-
-        self.boards: List[PlayerBoard] = boards if boards is not None else [PlayerBoard() for _ in range(self.NUM_PLAYERS)]
+                 _player_finished_round: Optional[List[bool]] = None,
+                 _turn_pos: Optional[int] = None,
+                 num_players: Optional[int] = None):
+
+        if num_players is None: num_players = len(boards) if boards is not None else self.NUM_PLAYERS
+        if not 2 <= num_players <= self.MAX_PLAYERS:
+            raise ValueError(f"Unsupported number of players: {num_players} (2-{self.MAX_PLAYERS})")
+        self.num_players: int = num_players
+        self.boards: List[PlayerBoard] = boards if boards is not None else [PlayerBoard() for _ in range(num_players)]
         self.deck: Deck = deck if deck is not None else Deck()
-        self.private_discard: List[List[Card]] = private_discard if private_discard is not None else [[] for _ in range(self.NUM_PLAYERS)]
+        self.private_discard: List[List[Card]] = private_discard if private_discard is not None else [[] for _ in range(self.num_players)]
         self.dealer_idx: int = dealer_idx
-        self.current_player_idx: int = (1 - dealer_idx) if current_player_idx is None else current_player_idx
+        self.current_player_idx: int = (dealer_idx + 1) % num_players if current_player_idx is None else current_player_idx
         self.street: int = street
-        self.current_hands: Dict[int, Optional[List[Card]]] = current_hands if current_hands is not None else {i: None for i in range(self.NUM_PLAYERS)}
-        self.fantasyland_status: List[bool] = fantasyland_status if fantasyland_status is not None else [False] * self.NUM_PLAYERS
-        self.next_fantasyland_status: List[bool] = next_fantasyland_status if next_fantasyland_status is not None else [False] * self.NUM_PLAYERS
-        self.fantasyland_cards_to_deal: List[int] = fantasyland_cards_to_deal if fantasyland_cards_to_deal is not None else [0] * self.NUM_PLAYERS
+        self.current_hands: Dict[int, Optional[List[Card]]] = current_hands if current_hands is not None else {i: None for i in range(self.num_players)}
+        self.fantasyland_status: List[bool] = fantasyland_status if fantasyland_status is not None else [False] * self.num_players
+        self.next_fantasyland_status: List[bool] = next_fantasyland_status if next_fantasyland_status is not None else [False] * self.num_players
+        self.fantasyland_cards_to_deal: List[int] = fantasyland_cards_to_deal if fantasyland_cards_to_deal is not None else [0] * self.num_players
         self.is_fantasyland_round: bool = is_fantasyland_round
-        self.fantasyland_hands: List[Optional[List[Card]]] = fantasyland_hands if fantasyland_hands is not None else [None] * self.NUM_PLAYERS
-        self._player_acted_this_street: List[bool] = _player_acted_this_street if _player_acted_this_street is not None else [False] * self.NUM_PLAYERS
-        self._player_finished_round: List[bool] = _player_finished_round if _player_finished_round is not None else [False] * self.NUM_PLAYERS
+        self.fantasyland_hands: List[Optional[List[Card]]] = fantasyland_hands if fantasyland_hands is not None else [None] * self.num_players
+        self._player_acted_this_street: List[bool] = _player_acted_this_street if _player_acted_this_street is not None else [False] * self.num_players
+        self._player_finished_round: List[bool] = _player_finished_round if _player_finished_round is not None else [False] * self.num_players
+        # Очередность ходов: таблица (улица, игрок) и позиция в ней
+        self._turn_table: Tuple[Tuple[int, int], ...] = self._build_turn_table()
+        self._turn_pos: int = _turn_pos if _turn_pos is not None else self._restore_turn_pos()
+        self._sync_turn()
 
     def get_player_board(self, player_idx: int) -> PlayerBoard:
         return self.boards[player_idx]
@@ -66,7 +85,8 @@ class GameState:
         # Сбрасываем состояние, передавая сохраненный статус ФЛ
         self.__init__(dealer_idx=dealer_button_idx,
                       fantasyland_status=current_fl_status,
-                      fantasyland_cards_to_deal=current_fl_cards)
+                      fantasyland_cards_to_deal=current_fl_cards,
+                      num_players=self.num_players)
         self.is_fantasyland_round = any(self.fantasyland_status)
 
         # --- ЛОГИРОВАНИЕ ---
@@ -74,25 +94,98 @@ class GameState:
         sys.stdout.flush(); sys.stderr.flush()
         # --------------------
 
+        self._turn_table = self._build_turn_table()
+        self._turn_pos = 0
+        self._sync_turn()
         if self.is_fantasyland_round:
             self._deal_fantasyland_hands()
-            # Раздаем карты 1й улицы не-ФЛ игрокам сразу
-            for i in range(self.NUM_PLAYERS):
-                if not self.fantasyland_status[i]:
-                    # --- ЛОГИРОВАНИЕ ---
-                    print(f"DEBUG start_new_round: Calling _deal_street_to_player for non-FL player {i}")
-                    sys.stdout.flush(); sys.stderr.flush()
-                    # --------------------
-                    self._deal_street_to_player(i) # Раздаем 5 карт
-        else:
-            # Обычный раунд, раздаем первому игроку
-            first_player = 1 - self.dealer_idx
-            self.current_player_idx = first_player # Устанавливаем, кто ходит первым
-            # --- ЛОГИРОВАНИЕ ---
-            print(f"DEBUG start_new_round: Calling _deal_street_to_player for first player {first_player}")
-            sys.stdout.flush(); sys.stderr.flush()
-            # --------------------
-            self._deal_street_to_player(first_player)
+        # Раздаем карты первому по очереди игроку
+        self.advance()
+
+    # --- Очередность ходов ---
+
+    def _build_turn_table(self) -> Tuple[Tuple[int, int], ...]:
+        """
+        Таблица ходов раунда: (улица, игрок) в порядке очереди.
+        Сначала игроки в Фантазии (улица 0, одно размещение), затем улицы 1-5
+        для остальных игроков, начиная со следующего за дилером.
+        """
+        order = [(self.dealer_idx + 1 + k) % self.num_players for k in range(self.num_players)]
+        in_fl = [self.is_fantasyland_round and self.fantasyland_status[p] for p in range(self.num_players)]
+        table = [(0, p) for p in order if in_fl[p]]
+        table += [(street, p) for street in range(1, 6) for p in order if not in_fl[p]]
+        return tuple(table)
+
+    def _restore_turn_pos(self) -> int:
+        """Восстанавливает позицию в таблице ходов по флагам (для состояний без turn_pos)."""
+        for pos, (street, p) in enumerate(self._turn_table):
+            if self._player_finished_round[p]: continue
+            if street == 0: return pos
+            if street > self.street or (street == self.street and not self._player_acted_this_street[p]): return pos
+        return len(self._turn_table)
+
+    def _sync_turn(self):
+        """Пропускает ходы завершивших игроков и обновляет street/current_player_idx."""
+        table = self._turn_table
+        while self._turn_pos < len(table) and self._player_finished_round[table[self._turn_pos][1]]:
+            self._turn_pos += 1
+        if self._turn_pos >= len(table): return
+        street, player = table[self._turn_pos]
+        if street > self.street:
+            self.street = street
+            self._player_acted_this_street = [False] * self.num_players
+        self.current_player_idx = player
+
+    def _finish_turn(self, player_idx: int):
+        """Завершает ход игрока и передает очередь дальше по таблице."""
+        if self.next_to_act() == player_idx:
+            self._turn_pos += 1
+        self._sync_turn()
+
+    def next_to_act(self) -> int:
+        """Игрок, который ходит следующим (-1, если раунд окончен)."""
+        if self._turn_pos >= len(self._turn_table): return -1
+        return self._turn_table[self._turn_pos][1]
+
+    def phase(self) -> str:
+        """Текущая фаза: PHASE_ACT, PHASE_PENDING_DEAL или PHASE_ROUND_OVER."""
+        player = self.next_to_act()
+        if player == -1: return PHASE_ROUND_OVER
+        return PHASE_PENDING_DEAL if self.get_player_hand(player) is None else PHASE_ACT
+
+    def advance(self) -> int:
+        """
+        Выполняет отложенную раздачу (на месте) и возвращает игрока,
+        который должен ходить (-1, если раунд окончен).
+        """
+        player = self.next_to_act()
+        if player != -1 and self.get_player_hand(player) is None:
+            if self.is_fantasyland_round and self.fantasyland_status[player]: self._deal_fantasyland_hands()
+            else: self._deal_street_to_player(player)
+        return player
+
+    def deal_ahead(self, player_idx: int, cards: Optional[List[Card]] = None) -> bool:
+        """
+        Раздает игроку карты текущей улицы заранее (на месте), если он ходит
+        на ней позже, - как в живой игре, где карты улицы получают все сразу.
+        Распределение карт не меняется; advance потом раздачу пропустит.
+        cards - заданные карты (раздача, сохраненная вне состояния); их не
+        должно быть вне колоды. True - карты розданы.
+        """
+        if self.is_fantasyland_round and self.fantasyland_status[player_idx]: return False
+        if self._player_finished_round[player_idx] or self.get_player_hand(player_idx) is not None: return False
+        if (self.street, player_idx) not in self._turn_table[self._turn_pos + 1:]: return False
+        if cards is None: self._deal_street_to_player(player_idx)
+        elif len(cards) == self.street_deal_size() and all(card in self.deck.cards for card in cards):
+            self.deal_street_cards(player_idx, cards)
+        return self.get_player_hand(player_idx) is not None
+
+    def upcoming_players(self) -> List[int]:
+        """Игроки, которые еще будут ходить в раунде после текущего хода, в порядке очереди."""
+        players: List[int] = []
+        for _, player in self._turn_table[self._turn_pos + 1:]:
+            if player not in players and not self._player_finished_round[player]: players.append(player)
+        return players
 
     def _deal_street_to_player(self, player_idx: int):
         """Раздает карты для текущей улицы указанному игроку."""
@@ -139,9 +232,9 @@ class GameState:
 
 
     def _deal_fantasyland_hands(self):
-        """Раздает N карт игрокам в статусе Фантазии."""
-        for i in range(self.NUM_PLAYERS):
-            if self.fantasyland_status[i]:
+        """Раздает N карт игрокам в статусе Фантазии (еще не получившим руку)."""
+        for i in range(self.num_players):
+            if self.fantasyland_status[i] and self.fantasyland_hands[i] is None and not self._player_finished_round[i]:
                 num_cards = self.fantasyland_cards_to_deal[i]
                 if num_cards == 0: num_cards = 14 # Стандарт по умолчанию
                 try:
@@ -157,6 +250,33 @@ class GameState:
                     sys.stdout.flush(); sys.stderr.flush()
                     self.fantasyland_hands[i] = []
 
+    def street_deal_size(self) -> int:
+        """Сколько карт раздается игроку на текущей улице."""
+        return 5 if self.street == 1 else 3
+
+    def deal_street_cards(self, player_idx: int, cards: Optional[List[Card]] = None) -> List[Card]:
+        """
+        Раздает игроку карты текущей улицы без отладочного вывода (для поиска):
+        заданные cards (исход узла случая MCTS) или случайные из колоды.
+        Возвращает розданные карты.
+        """
+        if cards is None: cards = random.sample(self.deck.get_remaining_cards(), self.street_deal_size())
+        self.deck.remove(cards)
+        self.current_hands[player_idx] = list(cards)
+        self._player_acted_this_street[player_idx] = False
+        return cards
+
+    def redeal_hand(self, player_idx: int) -> Optional[List[Card]]:
+        """
+        Возвращает руку игрока в колоду и раздает ему новую того же размера
+        (на месте; для поиска за другого игрока, которому эта рука не видна).
+        None - руки нет.
+        """
+        hand = self.current_hands.get(player_idx)
+        if not hand: return None
+        self.deck.add(hand)
+        return self.deal_street_cards(player_idx, random.sample(self.deck.get_remaining_cards(), len(hand)))
+
     def get_legal_actions_for_player(self, player_idx: int) -> List[Any]:
         """Возвращает легальные действия для указанного игрока."""
         if self._player_finished_round[player_idx]: return []
@@ -170,6 +290,27 @@ class GameState:
         else:
             return self._get_legal_actions_pineapple(player_idx, hand) if len(hand) == 3 else []
 
+    def get_legal_action_codes_for_player(self, player_idx: int) -> List[int]:
+        """
+        Возвращает легальные действия игрока в виде упакованных int-кодов (action_codec).
+        Для игроков в Фантазии возвращает [] - их ход решает FantasylandSolver.
+        """
+        if self._player_finished_round[player_idx]: return []
+        if self.is_fantasyland_round and self.fantasyland_status[player_idx]: return []
+        hand = self.current_hands.get(player_idx)
+        if not hand: return []
+        free_slots = [slot_of(row_name, idx) for row_name, idx in self.boards[player_idx].get_available_slots()]
+        card_idxs = [CARD_TO_INDEX[c] for c in hand]
+        if self.street == 1:
+            if len(hand) != 5 or len(free_slots) < 5: return []
+            slot_combinations = list(combinations(free_slots, 5))
+            MAX_SLOT_COMBOS = 1000
+            if len(slot_combinations) > MAX_SLOT_COMBOS:
+                 slot_combinations = random.sample(slot_combinations, MAX_SLOT_COMBOS)
+            return street1_codes(card_idxs, slot_combinations)
+        if len(hand) != 3 or len(free_slots) < 2: return []
+        return pineapple_codes(card_idxs, free_slots)
+
     def _get_legal_actions_street1(self, player_idx: int, hand: List[Card]) -> List[Tuple[List[Tuple[Card, str, int]], List[Card]]]:
         """Генерирует ВСЕ легальные действия для первой улицы (размещение 5 карт)."""
         board = self.boards[player_idx]
@@ -219,57 +360,88 @@ class GameState:
     def apply_action(self, player_idx: int, action: Any):
         """
         Применяет легальное действие для УКАЗАННОГО игрока.
-        Возвращает НОВОЕ состояние игры.
-        ВАЖНО: Эта функция НЕ управляет очередностью ходов или завершением раунда.
+        Действие может быть кортежем или int-кодом из action_codec.
+        Возвращает НОВОЕ состояние игры, в котором очередь передана следующему
+        игроку. Карты следующему игроку не раздаются - см. advance().
         """
         new_state = self.copy()
-        board = new_state.boards[player_idx]
         if new_state.is_fantasyland_round and new_state.fantasyland_status[player_idx]:
              print(f"Warning: apply_action called for Fantasyland player {player_idx}.")
              new_state._player_finished_round[player_idx] = True
              new_state.fantasyland_hands[player_idx] = None
+             new_state._finish_turn(player_idx)
              return new_state
-        current_hand = new_state.current_hands.get(player_idx)
-        if not current_hand: print(f"Error: apply_action called for player {player_idx} but no hand found."); return self
-        if new_state.street == 1:
-            if len(current_hand) != 5: return self
+        if new_state.apply_action_inplace(player_idx, action) is None: return self
+        return new_state
+
+    def apply_action_inplace(self, player_idx: int, action: Any) -> Optional[tuple]:
+        """
+        Применяет обычное (не Фантазия) действие К ЭТОМУ состоянию.
+        Возвращает запись для undo_action() или None, если действие не применено
+        (состояние при этом не меняется).
+        """
+        if isinstance(action, int): action = decode_action(action)
+        if self.is_fantasyland_round and self.fantasyland_status[player_idx]: return None
+        board = self.boards[player_idx]
+        current_hand = self.current_hands.get(player_idx)
+        if not current_hand: print(f"Error: apply_action called for player {player_idx} but no hand found."); return None
+        placed: List[Tuple[str, int]] = []
+        if self.street == 1:
+            if len(current_hand) != 5: return None
             placements, _ = action
-            if len(placements) != 5: return self
-            success = True
+            if len(placements) != 5: return None
             placed_cards_in_action = set()
             for card, row, index in placements:
-                if card not in current_hand or card in placed_cards_in_action: success = False; break
-                if not board.add_card(card, row, index): success = False; break
+                if card not in current_hand or card in placed_cards_in_action or not board.add_card(card, row, index):
+                    print(f"Error applying street 1 action for player {player_idx}.")
+                    for r, i in placed: board.remove_card(r, i)
+                    return None
+                placed.append((row, index))
                 placed_cards_in_action.add(card)
-            if not success: print(f"Error applying street 1 action for player {player_idx}."); return self
-            new_state.current_hands[player_idx] = None
-            new_state._player_acted_this_street[player_idx] = True
-            if board.is_complete(): new_state._player_finished_round[player_idx] = True; new_state._check_foul_and_update_fl_status(player_idx)
+            discarded_card = None
         else: # Улицы 2-5 (Pineapple)
-            if len(current_hand) != 3: return self
+            if len(current_hand) != 3: return None
             place1, place2, discarded_card = action
             card1, row1, idx1 = place1
             card2, row2, idx2 = place2
             action_cards = {card1, card2, discarded_card}
-            if len(action_cards) != 3 or not action_cards.issubset(set(current_hand)): print(f"Error: Action cards mismatch hand for player {player_idx}."); return self
+            if len(action_cards) != 3 or not action_cards.issubset(set(current_hand)): print(f"Error: Action cards mismatch hand for player {player_idx}."); return None
 
             success1 = board.add_card(card1, row1, idx1)
-            success2 = board.add_card(card2, row2, idx2)
-
-            # --- ИСПРАВЛЕННЫЙ БЛОК ОБРАБОТКИ ОШИБКИ ---
-            if not success1 or not success2:
+            success2 = success1 and board.add_card(card2, row2, idx2)
+            if not success2:
                 print(f"Error applying pineapple action for player {player_idx}: failed to add cards.")
-                # Откатываем первое добавление, если оно было успешным, а второе нет
-                if success1 and not success2:
-                    board.remove_card(row1, idx1) # Откатываем только если первая карта была добавлена
-                return self # Возвращаем старое состояние при любой ошибке добавления
-            # ------------------------------------------
-
-            new_state.private_discard[player_idx].append(discarded_card)
-            new_state.current_hands[player_idx] = None
-            new_state._player_acted_this_street[player_idx] = True
-            if board.is_complete(): new_state._player_finished_round[player_idx] = True; new_state._check_foul_and_update_fl_status(player_idx)
-        return new_state
+                if success1: board.remove_card(row1, idx1) # Откатываем первую карту
+                return None
+            placed = [(row1, idx1), (row2, idx2)]
+
+        # Все, что меняется ниже, сохраняется для undo_action()
+        undo = (player_idx, placed, current_hand, len(self.private_discard[player_idx]),
+                list(self._player_acted_this_street), self._player_finished_round[player_idx],
+                self.next_fantasyland_status[player_idx], self.fantasyland_cards_to_deal[player_idx],
+                self.street, self.current_player_idx, self._turn_pos)
+        if discarded_card is not None: self.private_discard[player_idx].append(discarded_card)
+        self.current_hands[player_idx] = None
+        self._player_acted_this_street[player_idx] = True
+        if board.is_complete(): self._player_finished_round[player_idx] = True; self._check_foul_and_update_fl_status(player_idx)
+        self._finish_turn(player_idx)
+        return undo
+
+    def undo_action(self, undo: tuple):
+        """Отменяет действие, примененное apply_action_inplace() (в обратном порядке применения)."""
+        (player_idx, placed, hand, discard_len, acted, finished, next_fl, fl_cards,
+         street, current_player_idx, turn_pos) = undo
+        board = self.boards[player_idx]
+        for row, index in placed: board.remove_card(row, index)
+        del self.private_discard[player_idx][discard_len:]
+        self.current_hands[player_idx] = hand
+        self._player_acted_this_street = acted
+        self._player_finished_round[player_idx] = finished
+        self.next_fantasyland_status[player_idx] = next_fl
+        self.fantasyland_cards_to_deal[player_idx] = fl_cards
+        self.street = street
+        self.current_player_idx = current_player_idx
+        self._turn_pos = turn_pos
 
     def apply_fantasyland_placement(self, player_idx: int, placement: Dict[str, List[Card]], discarded: List[Card]):
         """Применяет результат FantasylandSolver к доске игрока."""
@@ -286,6 +458,7 @@ class GameState:
         new_state.fantasyland_hands[player_idx] = None
         new_state._player_finished_round[player_idx] = True
         new_state._check_foul_and_update_fl_status(player_idx)
+        new_state._finish_turn(player_idx)
         return new_state
 
     def apply_fantasyland_foul(self, player_idx: int, hand_to_discard: List[Card]):
@@ -298,6 +471,23 @@ class GameState:
         new_state._player_finished_round[player_idx] = True
         new_state.next_fantasyland_status[player_idx] = False
         new_state.fantasyland_cards_to_deal[player_idx] = 0
+        new_state._finish_turn(player_idx)
+        return new_state
+
+    def apply_foul(self, player_idx: int):
+        """
+        Фол игрока, который не может или не смог сходить: рука уходит в сброс,
+        игрок завершает раунд. Для игрока в Фантазии - apply_fantasyland_foul.
+        """
+        if self.is_fantasyland_round and self.fantasyland_status[player_idx]:
+            return self.apply_fantasyland_foul(player_idx, self.fantasyland_hands[player_idx] or [])
+        new_state = self.copy()
+        new_state.boards[player_idx].is_foul = True
+        hand = new_state.current_hands.get(player_idx)
+        if hand: new_state.private_discard[player_idx].extend(hand)
+        new_state.current_hands[player_idx] = None
+        new_state._player_finished_round[player_idx] = True
+        new_state._finish_turn(player_idx)
         return new_state
 
     def _check_foul_and_update_fl_status(self, player_idx: int):
@@ -318,12 +508,14 @@ class GameState:
         """Проверяет, завершили ли все игроки свою часть раунда."""
         return all(self._player_finished_round)
 
+    def get_terminal_scores(self) -> np.ndarray:
+        """Итоговые очки раунда каждого игрока против всех остальных (вектор длины num_players)."""
+        if not self.is_round_over(): return np.zeros(self.num_players, dtype=np.int32)
+        return calculate_scores(self.boards)
+
     def get_terminal_score(self) -> int:
         """Возвращает счет раунда с точки зрения Игрока 0."""
-        if not self.is_round_over(): return 0
-        for board in self.boards:
-             if board.is_complete(): board.check_and_set_foul()
-        return calculate_headsup_score(self.boards[0], self.boards[1])
+        return int(self.get_terminal_scores()[0])
 
     def get_known_dead_cards(self, perspective_player_idx: int) -> Set[Card]:
          """Возвращает набор карт, известных игроку как вышедшие из игры."""
@@ -388,6 +580,7 @@ class GameState:
             "fantasyland_hands": [[card_to_str(c) for c in hand] if hand else None for hand in self.fantasyland_hands], # И здесь
             "_player_acted_this_street": self._player_acted_this_street,
             "_player_finished_round": self._player_finished_round,
+            "turn_pos": self._turn_pos,
         }
 
     @classmethod
@@ -419,8 +612,9 @@ class GameState:
             board._is_complete = board_data.get('_is_complete', board._cards_placed == 13)
             boards.append(board)
 
+        num_players = len(boards)
         private_discard = []
-        for p_discard_strs in data.get("private_discard", [[] for _ in range(cls.NUM_PLAYERS)]):
+        for p_discard_strs in data.get("private_discard", [[] for _ in range(num_players)]):
             p_discard = []
             for cs in p_discard_strs:
                  try: p_discard.append(card_from_str(cs)); all_known_cards_strs.add(cs)
@@ -442,11 +636,11 @@ class GameState:
                        except ValueError: print(f"Warning: Invalid card string '{cs}' in saved current hand.")
                   current_hands[idx] = hand
              else: current_hands[idx] = None
-        for i in range(cls.NUM_PLAYERS):
+        for i in range(num_players):
              if i not in current_hands: current_hands[i] = None
 
         fantasyland_hands = []
-        for hand_strs in data.get("fantasyland_hands", [None]*cls.NUM_PLAYERS):
+        for hand_strs in data.get("fantasyland_hands", [None]*num_players):
             if hand_strs:
                 hand = []
                 for cs in hand_strs:
@@ -467,7 +661,6 @@ class GameState:
         remaining_cards = Deck.FULL_DECK_CARDS - known_cards
         deck = Deck(cards=remaining_cards)
 
-        num_players = len(boards)
         default_bool_list = [False] * num_players
         default_int_list = [0] * num_players
 
@@ -483,5 +676,6 @@ class GameState:
             is_fantasyland_round=data.get("is_fantasyland_round", False),
             fantasyland_hands=fantasyland_hands,
             _player_acted_this_street=data.get("_player_acted_this_street", list(default_bool_list)),
-            _player_finished_round=data.get("_player_finished_round", list(default_bool_list))
+            _player_finished_round=data.get("_player_finished_round", list(default_bool_list)),
+            _turn_pos=data.get("turn_pos") # Нет в старых сохранениях - восстанавливается по флагам
         )
@@ -0,0 +1,452 @@
+# game_state_batch.py
+"""
+Пакет из N независимых игр OFC Pineapple в виде struct-of-arrays (NumPy).
+
+Назначение - массовые симуляции (роллауты, бенчмарки), где скалярный
+GameState с объектами Card слишком дорог. Все поля - плотные массивы:
+
+    boards   (N, P, 13) int8   индекс карты (card_index) по слотам, -1 - пусто
+    hands    (N, P, 5)  int8   карты на руке (5 на улице 1, 3 на улицах 2-5)
+    discards (N, P, 4)  int8   сброшенные карты (по одной за улицы 2-5)
+    deck     (N, 52)    int8   перемешанные оставшиеся карты; раздача с deck_pos
+    street, current_player, dealer (N,) ; acted, finished (N, P) bool
+
+Действия - int-коды action_codec (STREET1 и PINEAPPLE) и применяются
+сразу ко всем играм пакета. Ранги рядов считаются по таблицам, построенным
+один раз из скалярных get_hand_rank_safe / get_row_royalty, поэтому
+результаты совпадают со скалярным движком.
+
+Поддерживаются только обычные раунды (без Фантазии): ходы Фантазии решает
+FantasylandSolver, а не симуляции.
+Проверка соответствия скалярному движку: python game_state_batch.py
+"""
+from itertools import combinations, combinations_with_replacement
+from typing import TYPE_CHECKING, List, Optional, Sequence
+
+import numpy as np
+
+from card_index import CARD_TO_INDEX, INDEX_TO_CARD, NUM_CARDS, NUM_RANKS
+from action_codec import (ACTION_STREET1, ACTION_PINEAPPLE, TAG_MASK, CARD_BITS, CARD_MASK,
+                          SLOT_MASK, PLACEMENT_BITS, NUM_SLOTS, SLOT_TO_ROW_INDEX,
+                          _P_CARD1, _P_SLOT1, _P_CARD2, _P_SLOT2, _P_DISCARD, TAG_BITS)
+from scoring import get_hand_rank_safe, get_row_royalty, score_matrix, RANK_CLASS_HIGH_CARD
+
+if TYPE_CHECKING: # Только для аннотаций: во время работы импорт локальный (to_states)
+    from game_state import GameState
+
+EMPTY = -1
+HAND_SIZE = 5
+MAX_DISCARDS = 4
+ROW_SLICES = {'top': slice(0, 3), 'middle': slice(3, 8), 'bottom': slice(8, 13)}
+
+# --- Таблицы рангов и роялти (строятся лениво при первом подсчете) ---
+
+_TABLES: Optional[dict] = None
+
+def _rank_key5(ranks_desc: np.ndarray) -> np.ndarray:
+    """Ключ 5 рангов, отсортированных по убыванию: число в системе счисления 13."""
+    key = ranks_desc[..., 0].astype(np.int32)
+    for k in range(1, 5): key = key * NUM_RANKS + ranks_desc[..., k]
+    return key
+
+def _rank_key3(ranks_desc: np.ndarray) -> np.ndarray:
+    key = ranks_desc[..., 0].astype(np.int32)
+    for k in range(1, 3): key = key * NUM_RANKS + ranks_desc[..., k]
+    return key
+
+def _cards_for_ranks(ranks: Sequence[int], allow_flush: bool):
+    """Подбирает масти к мультимножеству рангов: i-е вхождение ранга получает масть i."""
+    seen = {}
+    idxs = []
+    for r in ranks:
+        s = seen.get(r, 0); seen[r] = s + 1
+        idxs.append(r * 4 + s)
+    if not allow_flush and len(set(i & 3 for i in idxs)) == 1:
+        idxs[-1] += 1 # Все ранги разные -> все масти 0; ломаем флеш
+    return [INDEX_TO_CARD[i] for i in idxs]
+
+def _build_tables() -> dict:
+    """Перебирает все классы рядов и считает ранг и роялти скалярными функциями."""
+    size5 = NUM_RANKS ** 5
+    rank5 = np.full(size5, RANK_CLASS_HIGH_CARD, dtype=np.int16)
+    roy_mid5 = np.zeros(size5, dtype=np.int8)
+    roy_bot5 = np.zeros(size5, dtype=np.int8)
+    for ranks in combinations_with_replacement(range(NUM_RANKS - 1, -1, -1), 5):
+        if max(ranks.count(r) for r in set(ranks)) > 4: continue
+        cards = _cards_for_ranks(ranks, allow_flush=False)
+        key = int(_rank_key5(np.array(ranks)))
+        rank5[key] = get_hand_rank_safe(cards)
+        roy_mid5[key] = get_row_royalty(cards, 'middle')
+        roy_bot5[key] = get_row_royalty(cards, 'bottom')
+
+    size_mask = 1 << NUM_RANKS
+    rank_flush = np.full(size_mask, RANK_CLASS_HIGH_CARD, dtype=np.int16)
+    roy_mid_flush = np.zeros(size_mask, dtype=np.int8)
+    roy_bot_flush = np.zeros(size_mask, dtype=np.int8)
+    for ranks in combinations(range(NUM_RANKS), 5):
+        cards = [INDEX_TO_CARD[r * 4] for r in ranks]
+        mask = sum(1 << r for r in ranks)
+        rank_flush[mask] = get_hand_rank_safe(cards)
+        roy_mid_flush[mask] = get_row_royalty(cards, 'middle')
+        roy_bot_flush[mask] = get_row_royalty(cards, 'bottom')
+
+    size3 = NUM_RANKS ** 3
+    rank3 = np.full(size3, RANK_CLASS_HIGH_CARD, dtype=np.int16)
+    roy_top3 = np.zeros(size3, dtype=np.int8)
+    for ranks in combinations_with_replacement(range(NUM_RANKS - 1, -1, -1), 3):
+        cards = _cards_for_ranks(ranks, allow_flush=False)
+        key = int(_rank_key3(np.array(ranks)))
+        rank3[key] = get_hand_rank_safe(cards)
+        roy_top3[key] = get_row_royalty(cards, 'top')
+
+    return {'rank5': rank5, 'roy_mid5': roy_mid5, 'roy_bot5': roy_bot5,
+            'rank_flush': rank_flush, 'roy_mid_flush': roy_mid_flush, 'roy_bot_flush': roy_bot_flush,
+            'rank3': rank3, 'roy_top3': roy_top3}
+
+def get_tables() -> dict:
+    """Возвращает таблицы рангов/роялти, строя их при первом вызове."""
+    global _TABLES
+    if _TABLES is None: _TABLES = _build_tables()
+    return _TABLES
+
+
+def evaluate_rows(boards: np.ndarray):
+    """
+    Векторная оценка рядов для массива досок (..., 13).
+    Возвращает (ranks (..., 3) int32, royalties (..., 3) int32) в порядке top/middle/bottom.
+    Неполные ряды получают "худший" ранг, как PlayerBoard._get_rank, и 0 роялти.
+    """
+    t = get_tables()
+    cards = boards.astype(np.int16)
+    present = cards >= 0
+    safe = np.where(present, cards, 0)
+    r = safe >> 2
+    s = safe & 3
+    ranks = np.empty(boards.shape[:-1] + (3,), dtype=np.int32)
+    royalties = np.zeros(boards.shape[:-1] + (3,), dtype=np.int32)
+
+    top_r = -np.sort(-r[..., 0:3], axis=-1)
+    key3 = _rank_key3(top_r)
+    ranks[..., 0] = t['rank3'][key3]
+    royalties[..., 0] = t['roy_top3'][key3]
+
+    for col, row_name, roy_name in ((1, 'middle', 'mid'), (2, 'bottom', 'bot')):
+        sl = ROW_SLICES[row_name]
+        rr = r[..., sl]; ss = s[..., sl]
+        key5 = _rank_key5(-np.sort(-rr, axis=-1))
+        flush = (ss == ss[..., :1]).all(axis=-1)
+        mask = (np.left_shift(1, rr)).sum(axis=-1) & ((1 << NUM_RANKS) - 1)
+        ranks[..., col] = np.where(flush, t['rank_flush'][mask], t['rank5'][key5])
+        royalties[..., col] = np.where(flush, t[f'roy_{roy_name}_flush'][mask], t[f'roy_{roy_name}5'][key5])
+
+    for col, row_name in enumerate(('top', 'middle', 'bottom')):
+        sl = ROW_SLICES[row_name]
+        missing = (~present[..., sl]).sum(axis=-1)
+        incomplete = missing > 0
+        ranks[..., col] = np.where(incomplete, RANK_CLASS_HIGH_CARD + 10 + missing, ranks[..., col])
+        royalties[..., col] = np.where(incomplete, 0, royalties[..., col])
+    return ranks, royalties
+
+
+class GameStateBatch:
+    """N игр обычного раунда OFC Pineapple, хранимых и обновляемых массивами."""
+
+    def __init__(self, num_games: int, num_players: int = 2, dealer_idx: int = 0,
+                 rng: Optional[np.random.Generator] = None):
+        self.num_games = num_games
+        self.num_players = num_players
+        self.rng = rng if rng is not None else np.random.default_rng()
+        n, p = num_games, num_players
+        self.boards = np.full((n, p, NUM_SLOTS), EMPTY, dtype=np.int8)
+        self.hands = np.full((n, p, HAND_SIZE), EMPTY, dtype=np.int8)
+        self.discards = np.full((n, p, MAX_DISCARDS), EMPTY, dtype=np.int8)
+        self.num_discards = np.zeros((n, p), dtype=np.int8)
+        self.deck = np.argsort(self.rng.random((n, NUM_CARDS)), axis=1).astype(np.int8)
+        self.deck_size = np.full(n, NUM_CARDS, dtype=np.int16)
+        self.deck_pos = np.zeros(n, dtype=np.int16)
+        self.street = np.ones(n, dtype=np.int8)
+        self.dealer = np.full(n, dealer_idx, dtype=np.int8)
+        self.current_player = ((self.dealer + 1) % p).astype(np.int8)
+        self.acted = np.zeros((n, p), dtype=bool)
+        self.finished = np.zeros((n, p), dtype=bool)
+
+    # --- Очередность ходов ---
+
+    def first_player(self) -> np.ndarray:
+        """Игрок, открывающий каждую улицу (следующий за дилером)."""
+        return ((self.dealer + 1) % self.num_players).astype(np.int8)
+
+    def is_round_over(self) -> np.ndarray:
+        """(N,) bool: все игроки заполнили доски."""
+        return self.finished.all(axis=1)
+
+    def _advance_turn(self, games: np.ndarray):
+        """
+        Передает ход следующему игроку; после последнего игрока улицы - новая улица.
+        После последнего хода улицы 5 поля не меняются (как в GameState).
+        """
+        p = self.num_players
+        first = self.first_player()[games]
+        cur = self.current_player[games]
+        last = ((cur.astype(np.int16) - first) % p) == p - 1
+        over = last & (self.street[games] >= 5)
+        new_street = games[last & ~over]
+        self.street[new_street] += 1
+        self.acted[new_street] = False
+        self.current_player[games] = np.where(over, cur, np.where(last, first, (cur + 1) % p))
+
+    # --- Раздача ---
+
+    def needs_deal(self) -> np.ndarray:
+        """(N,) bool: у игрока, который ходит, еще нет карт улицы."""
+        g = np.arange(self.num_games)
+        cur = self.current_player.astype(np.intp)
+        return (~self.is_round_over()) & (~self.finished[g, cur]) & (self.hands[g, cur, 0] == EMPTY)
+
+    def deal(self) -> np.ndarray:
+        """Раздает карты улицы ходящему игроку во всех играх, где это нужно. Возвращает маску игр."""
+        mask = self.needs_deal()
+        games = np.nonzero(mask)[0]
+        if games.size == 0: return mask
+        cur = self.current_player[games].astype(np.intp)
+        count = np.where(self.street[games] == 1, 5, 3)
+        cols = np.arange(HAND_SIZE)
+        idx = self.deck_pos[games, None] + cols
+        valid = (cols < count[:, None]) & (idx < self.deck_size[games, None])
+        dealt = np.take_along_axis(self.deck[games], np.minimum(idx, NUM_CARDS - 1), axis=1)
+        self.hands[games, cur] = np.where(valid, dealt, EMPTY)
+        self.deck_pos[games] += valid.sum(axis=1).astype(np.int16)
+        return mask
+
+    # --- Действия ---
+
+    def sample_random_actions(self) -> np.ndarray:
+        """
+        Случайное легальное действие (int-код) для ходящего игрока каждой игры.
+        Для игр без хода (раунд окончен или нет карт) возвращает -1.
+        """
+        n = self.num_games
+        codes = np.full(n, -1, dtype=np.int64)
+        g = np.arange(n)
+        cur = self.current_player.astype(np.intp)
+        hands = self.hands[g, cur].astype(np.int64)
+        active = (~self.is_round_over()) & (hands[:, 0] != EMPTY)
+
+        # Случайный порядок свободных слотов: занятые уходят в конец
+        keys = self.rng.random((n, NUM_SLOTS))
+        keys[self.boards[g, cur] != EMPTY] = 2.0
+        slot_order = np.argsort(keys, axis=1).astype(np.int64)
+
+        s1 = np.nonzero(active & (self.street == 1))[0]
+        if s1.size:
+            slots = slot_order[s1, :5]
+            perm = np.argsort(self.rng.random((s1.size, 5)), axis=1)
+            cards = np.take_along_axis(hands[s1], perm, axis=1)
+            by_slot = np.argsort(slots, axis=1)
+            slots = np.take_along_axis(slots, by_slot, axis=1)
+            cards = np.take_along_axis(cards, by_slot, axis=1)
+            code = np.full(s1.size, ACTION_STREET1, dtype=np.int64)
+            for k in range(5):
+                code |= (cards[:, k] | (slots[:, k] << CARD_BITS)) << (TAG_BITS + k * PLACEMENT_BITS)
+            codes[s1] = code
+
+        pa = np.nonzero(active & (self.street > 1))[0]
+        if pa.size:
+            discard_pos = self.rng.integers(0, 3, size=pa.size)
+            keep = np.array([[1, 2], [0, 2], [0, 1]])[discard_pos]
+            cards = np.take_along_axis(hands[pa, :3], keep, axis=1)
+            discard = hands[pa, discard_pos]
+            slots = np.sort(slot_order[pa, :2], axis=1)
+            codes[pa] = (ACTION_PINEAPPLE | (cards[:, 0] << _P_CARD1) | (slots[:, 0] << _P_SLOT1)
+                         | (cards[:, 1] << _P_CARD2) | (slots[:, 1] << _P_SLOT2) | (discard << _P_DISCARD))
+        return codes
+
+    def apply_actions(self, codes: np.ndarray):
+        """
+        Применяет int-коды к ходящему игроку каждой игры (код -1 - пропуск).
+        Проверка легальности не выполняется: коды должны быть получены
+        из sample_random_actions или get_legal_action_codes_for_player.
+        """
+        codes = np.asarray(codes, dtype=np.int64)
+        games = np.nonzero(codes >= 0)[0]
+        if games.size == 0: return
+        c = codes[games]
+        cur = self.current_player[games].astype(np.intp)
+        kind = c & TAG_MASK
+
+        s1 = kind == ACTION_STREET1
+        for k in range(5):
+            field = c[s1] >> (TAG_BITS + k * PLACEMENT_BITS)
+            self.boards[games[s1], cur[s1], (field >> CARD_BITS) & SLOT_MASK] = field & CARD_MASK
+
+        pa = kind == ACTION_PINEAPPLE
+        if pa.any():
+            g, p, cp = games[pa], cur[pa], c[pa]
+            self.boards[g, p, (cp >> _P_SLOT1) & SLOT_MASK] = (cp >> _P_CARD1) & CARD_MASK
+            self.boards[g, p, (cp >> _P_SLOT2) & SLOT_MASK] = (cp >> _P_CARD2) & CARD_MASK
+            self.discards[g, p, self.num_discards[g, p]] = (cp >> _P_DISCARD) & CARD_MASK
+            self.num_discards[g, p] += 1
+
+        self.hands[games, cur] = EMPTY
+        self.acted[games, cur] = True
+        self.finished[games, cur] |= (self.boards[games, cur] != EMPTY).all(axis=1)
+        self._advance_turn(games)
+
+    def play_random(self) -> int:
+        """Доигрывает все игры случайными действиями. Возвращает число сделанных шагов."""
+        steps = 0
+        while not self.is_round_over().all():
+            self.deal()
+            self.apply_actions(self.sample_random_actions())
+            steps += 1
+        return steps
+
+    # --- Подсчет ---
+
+    def fouls(self) -> np.ndarray:
+        """(N, P) bool: полная доска с нарушенным порядком рядов."""
+        ranks, _ = evaluate_rows(self.boards)
+        complete = (self.boards != EMPTY).all(axis=-1)
+        return complete & ~((ranks[..., 2] <= ranks[..., 1]) & (ranks[..., 1] <= ranks[..., 0]))
+
+    def royalties(self) -> np.ndarray:
+        """(N, P) суммарные роялти (0 для фола)."""
+        ranks, roy = evaluate_rows(self.boards)
+        complete = (self.boards != EMPTY).all(axis=-1)
+        foul = complete & ~((ranks[..., 2] <= ranks[..., 1]) & (ranks[..., 1] <= ranks[..., 0]))
+        return np.where(foul, 0, roy.sum(axis=-1))
+
+    def terminal_scores(self) -> np.ndarray:
+        """
+        (N, P) счет каждого игрока против всех остальных (scoring.score_matrix,
+        как GameState.get_terminal_scores()).
+        """
+        ranks, roy = evaluate_rows(self.boards)
+        complete = (self.boards != EMPTY).all(axis=-1)
+        foul = complete & ~((ranks[..., 2] <= ranks[..., 1]) & (ranks[..., 1] <= ranks[..., 0]))
+        total_roy = np.where(foul, 0, roy.sum(axis=-1))
+        return score_matrix(ranks, total_roy, foul).sum(axis=-1)
+
+    # --- Преобразование в/из GameState ---
+
+    @classmethod
+    def from_states(cls, states: List['GameState'], rng: Optional[np.random.Generator] = None) -> 'GameStateBatch':
+        """Упаковывает список GameState (обычные раунды) в пакет. Колода каждой игры перемешивается."""
+        if not states: raise ValueError("from_states: empty list of states")
+        num_players = len(states[0].boards)
+        batch = cls(len(states), num_players, rng=rng)
+        batch.deck.fill(EMPTY)
+        for gi, state in enumerate(states):
+            if state.is_fantasyland_round:
+                raise ValueError("GameStateBatch supports only regular (non-Fantasyland) rounds")
+            for pi, board in enumerate(state.boards):
+                for slot, (row_name, idx) in enumerate(SLOT_TO_ROW_INDEX):
+                    card = board.rows[row_name][idx]
+                    batch.boards[gi, pi, slot] = CARD_TO_INDEX[card] if card is not None else EMPTY
+                hand = state.current_hands.get(pi)
+                if hand:
+                    batch.hands[gi, pi, :len(hand)] = [CARD_TO_INDEX[c] for c in hand]
+                discard = state.private_discard[pi][:MAX_DISCARDS]
+                batch.discards[gi, pi, :len(discard)] = [CARD_TO_INDEX[c] for c in discard]
+                batch.num_discards[gi, pi] = len(discard)
+            remaining = np.array(sorted(CARD_TO_INDEX[c] for c in state.deck.cards), dtype=np.int8)
+            batch.deck[gi, :remaining.size] = batch.rng.permutation(remaining)
+            batch.deck_size[gi] = remaining.size
+            batch.street[gi] = state.street
+            batch.dealer[gi] = state.dealer_idx
+            batch.current_player[gi] = state.current_player_idx
+            batch.acted[gi] = state._player_acted_this_street
+            batch.finished[gi] = state._player_finished_round
+        batch.deck_pos[:] = 0
+        return batch
+
+    def to_states(self) -> List['GameState']:
+        """Распаковывает пакет в список GameState (оставшаяся колода - множество карт)."""
+        from game_state import GameState
+        from board import PlayerBoard
+        from deck import Deck
+        states = []
+        for gi in range(self.num_games):
+            boards = []
+            for pi in range(self.num_players):
+                board = PlayerBoard()
+                for slot, (row_name, idx) in enumerate(SLOT_TO_ROW_INDEX):
+                    c = int(self.boards[gi, pi, slot])
+                    if c != EMPTY: board.add_card(INDEX_TO_CARD[c], row_name, idx)
+                if board.is_complete(): board.check_and_set_foul()
+                boards.append(board)
+            hands = {}
+            for pi in range(self.num_players):
+                hand = [INDEX_TO_CARD[int(c)] for c in self.hands[gi, pi] if c != EMPTY]
+                hands[pi] = hand if hand else None
+            discards = [[INDEX_TO_CARD[int(c)] for c in self.discards[gi, pi, :self.num_discards[gi, pi]]]
+                        for pi in range(self.num_players)]
+            remaining = self.deck[gi, self.deck_pos[gi]:self.deck_size[gi]]
+            state = GameState(boards=boards, deck=Deck(cards={INDEX_TO_CARD[int(c)] for c in remaining}),
+                              private_discard=discards, dealer_idx=int(self.dealer[gi]),
+                              current_player_idx=int(self.current_player[gi]), street=int(self.street[gi]),
+                              current_hands=hands,
+                              _player_acted_this_street=[bool(x) for x in self.acted[gi]],
+                              _player_finished_round=[bool(x) for x in self.finished[gi]])
+            for pi in range(self.num_players):
+                if state._player_finished_round[pi]: state._check_foul_and_update_fl_status(pi)
+            states.append(state)
+        return states
+
+
+# --- Сверка со скалярным движком ---
+
+def _cross_check(num_games: int = 200, seed: int = 0, num_players: int = 2) -> int:
+    """
+    Играет num_games случайных раундов пакетом и параллельно повторяет каждый
+    ход в скалярных GameState. Сравнивает доски, фолы, роялти и итоговый счет.
+    Возвращает число расхождений.
+    """
+    import contextlib, io
+
+    batch = GameStateBatch(num_games, num_players, dealer_idx=0, rng=np.random.default_rng(seed))
+    batch.dealer[:] = np.arange(num_games) % num_players
+    batch.current_player[:] = batch.first_player()
+    with contextlib.redirect_stdout(io.StringIO()):
+        states = batch.to_states()
+        while not batch.is_round_over().all():
+            dealt = np.nonzero(batch.deal())[0]
+            for gi in dealt:
+                p = int(batch.current_player[gi])
+                hand = [INDEX_TO_CARD[int(c)] for c in batch.hands[gi, p] if c != EMPTY]
+                states[gi].deck.cards.difference_update(hand)
+                states[gi].current_hands[p] = hand
+            codes = batch.sample_random_actions()
+            for gi in np.nonzero(codes >= 0)[0]:
+                states[gi] = states[gi].apply_action(states[gi].next_to_act(), int(codes[gi]))
+            batch.apply_actions(codes)
+
+        mismatches = []
+        scores = batch.terminal_scores()
+        royalties = batch.royalties()
+        fouls = batch.fouls()
+        unpacked = batch.to_states()
+        for gi, s in enumerate(states):
+            checks = [
+                scores[gi].tolist() == s.get_terminal_scores().tolist(),
+                all(bool(fouls[gi, p]) == s.boards[p].is_foul for p in range(num_players)),
+                all(int(royalties[gi, p]) == s.boards[p].get_total_royalty() for p in range(num_players)),
+                unpacked[gi].get_state_representation() == s.get_state_representation(),
+                unpacked[gi].deck.cards == s.deck.cards,
+            ]
+            if not all(checks): mismatches.append((gi, checks))
+    for gi, checks in mismatches[:5]: print(f"Mismatch in game {gi}: {checks}")
+    return len(mismatches)
+
+
+if __name__ == '__main__':
+    import argparse
+    import time
+    parser = argparse.ArgumentParser(description="GameStateBatch self-check against scalar GameState")
+    parser.add_argument('--games', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--players', type=int, default=2)
+    args = parser.parse_args()
+    start = time.perf_counter()
+    bad = _cross_check(args.games, args.seed, args.players)
+    print(f"Cross-check: {args.games} games x {args.players} players, {bad} mismatches ({time.perf_counter() - start:.2f}s)")
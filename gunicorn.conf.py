@@ -0,0 +1,62 @@
+# gunicorn.conf.py
+"""
+Хуки gunicorn для app.py (см. Dockerfile).
+
+У каждого процесса gunicorn свой агент MCTS (app.ai_agent) с постоянным
+пулом воркеров: пул прогревается до первого запроса и останавливается при
+выходе процесса, чтобы не оставлять процессы-сироты.
+
+Если задан MCTS_SERVICE, мастер gunicorn запускает один сервис поиска
+(search_service.py) по этому адресу, а агенты процессов - его клиенты:
+пул воркеров один на хост, и поиски разных партий чередуются в сервисе.
+Без MCTS_SERVICE_AUTHKEY мастер генерирует случайный ключ: сервис и
+процессы приложения получают его через окружение.
+"""
+import multiprocessing
+import os
+import secrets
+import sys
+
+SERVICE_STOP_TIMEOUT = 5.0 # Секунд на штатную остановку сервиса поиска
+_service_process = None
+
+
+def _app_agent():
+    """Агент загруженного приложения или None."""
+    app_module = sys.modules.get('app')
+    return getattr(app_module, 'ai_agent', None) if app_module is not None else None
+
+
+def on_starting(server):
+    global _service_process
+    address = os.environ.get('MCTS_SERVICE')
+    if not address: return
+    from search_service import parse_address, run_service
+    # Запускаемые после хука сервис и процессы приложения наследуют окружение мастера
+    os.environ.setdefault('MCTS_SERVICE_AUTHKEY', secrets.token_hex(32))
+    # Не демон: у сервиса свои дочерние процессы (пул воркеров)
+    _service_process = multiprocessing.get_context('spawn').Process(target=run_service, args=(parse_address(address),),
+                                                                    name="mcts-search-service")
+    _service_process.start()
+    server.log.info(f"MCTS search service started (pid {_service_process.pid}) at {address}")
+
+
+def on_exit(server):
+    if _service_process is None or not _service_process.is_alive(): return
+    _service_process.terminate() # SIGTERM: сервис останавливает пул и удаляет кольцо
+    _service_process.join(SERVICE_STOP_TIMEOUT)
+    if _service_process.is_alive(): _service_process.kill()
+
+
+def post_worker_init(worker):
+    agent = _app_agent()
+    if agent is None: return
+    try:
+        agent.warm_up()
+    except Exception as e:
+        worker.log.warning(f"MCTS pool warm-up failed: {e}")
+
+
+def worker_exit(server, worker):
+    agent = _app_agent()
+    if agent is not None: agent.close()
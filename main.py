@@ -1,10 +1,13 @@
 # main.py
+import os
 import time
 import random
-from typing import List, Set, Optional, Tuple, Any
+from typing import Dict, List, Set, Optional, Tuple, Any
 from card import card_from_str, card_to_str, Card
 from game_state import GameState
 from mcts_agent import MCTSAgent
+from agent_config import agent_from_env
+from search_report import log_report, report_stream
 from fantasyland_solver import FantasylandSolver # Используется агентом
 # Добавим импорт для проверки фола в get_human_fantasyland_placement
 from scoring import check_board_foul
@@ -314,22 +317,16 @@ def get_human_fantasyland_placement(hand: List[Card]) -> Tuple[Optional[Dict[str
 
 def play_game():
     """Основной цикл игры в консоли."""
-    num_players = 2
+    num_players = int(os.environ.get('NUM_PLAYERS', GameState.NUM_PLAYERS)) # 2 или 3
     human_player_idx = 0 # 0 или 1, или None для AI vs AI
-    # Параметры AI можно задать здесь или через переменные окружения
-    ai_time_limit = int(os.environ.get('MCTS_TIME_LIMIT_MS', 5000))
-    ai_rave_k = int(os.environ.get('MCTS_RAVE_K', 500))
-    ai_workers = int(os.environ.get('NUM_WORKERS', MCTSAgent.DEFAULT_NUM_WORKERS))
-    ai_rollouts_leaf = int(os.environ.get('ROLLOUTS_PER_LEAF', MCTSAgent.DEFAULT_ROLLOUTS_PER_LEAF))
-
-    ai_player = MCTSAgent(time_limit_ms=ai_time_limit,
-                          rave_k=ai_rave_k,
-                          num_workers=ai_workers,
-                          rollouts_per_leaf=ai_rollouts_leaf)
+    # Параметры AI - переменные окружения (agent_config); консольная игра
+    # по умолчанию занимает все ядра и не обдумывает
+    ai_player = agent_from_env(num_workers=MCTSAgent.DEFAULT_NUM_WORKERS, ponder_share=0.0)
+    search_log = report_stream(os.environ.get('MCTS_SEARCH_LOG')) # Отчеты о поиске строками JSON
     # fl_solver не нужен отдельно, т.к. используется внутри MCTSAgent
 
-    game_score = [0, 0]
-    dealer_idx = random.choice([0, 1])
+    game_score = [0] * num_players
+    dealer_idx = random.randrange(num_players)
     # Сохраняем статус ФЛ и кол-во карт между раундами
     fantasyland_status_carryover = [False] * num_players
     fantasyland_cards_carryover = [0] * num_players
@@ -338,184 +335,103 @@ def play_game():
     while True:
         round_num += 1
         print(f"\n{'='*10} РАУНД {round_num} {'='*10}")
-        dealer_idx = 1 - dealer_idx # Меняем дилера
+        dealer_idx = (dealer_idx + 1) % num_players # Меняем дилера
         print(f"Дилер: Игрок {dealer_idx}")
 
         # Инициализация состояния раунда
         current_state = GameState(dealer_idx=dealer_idx,
                                   fantasyland_status=list(fantasyland_status_carryover),
-                                  fantasyland_cards_to_deal=list(fantasyland_cards_carryover))
+                                  fantasyland_cards_to_deal=list(fantasyland_cards_carryover),
+                                  num_players=num_players)
         current_state.start_new_round(dealer_idx) # Раздает карты ФЛ и/или 1й улицы
         print(f"Статус Фантазии: {current_state.fantasyland_status}")
         if current_state.is_fantasyland_round: print("--- Раунд Фантазии ---")
         else: print("--- Обычный раунд ---")
 
-        # Основной цикл раунда
+        # Основной цикл раунда: очередь и раздачу ведет GameState
         while not current_state.is_round_over():
-            made_move_in_loop = False
-            # Пытаемся сделать ход для каждого игрока
-            for p_idx in range(num_players):
-                if current_state._player_finished_round[p_idx]:
-                    continue # Игрок уже закончил
-
-                action = None
-                is_fantasyland_turn = current_state.is_fantasyland_round and current_state.fantasyland_status[p_idx]
-
-                # --- Определяем, может ли игрок ходить ---
-                can_play = False
-                if is_fantasyland_turn:
-                     can_play = current_state.fantasyland_hands[p_idx] is not None
-                else: # Обычный ход
-                     # В обычном раунде ходит current_player_idx
-                     # В FL раунде не-FL игрок ходит, когда у него есть карты
-                     if not current_state.is_fantasyland_round:
-                          can_play = (current_state.current_player_idx == p_idx and
-                                      current_state.current_hands.get(p_idx) is not None)
-                     else: # Не-FL игрок в FL раунде
-                          can_play = current_state.current_hands.get(p_idx) is not None
-
-                if not can_play:
-                     continue # Игрок не может ходить сейчас
-
-                # --- Получение действия ---
-                print(f"\n--- Ход Игрока {p_idx} ---")
-                if is_fantasyland_turn:
-                     print("(Фантазия)")
-                     hand = current_state.fantasyland_hands[p_idx]
-                     if p_idx == human_player_idx:
-                          placement, discarded = None, None
-                          # Даем несколько попыток разместить без фола
-                          for attempt in range(3):
-                               placement, discarded = get_human_fantasyland_placement(hand)
-                               if placement: break # Успешно разместили
-                               print("Попробуйте разместить снова.")
-                          if placement:
-                               action = ("FANTASYLAND_PLACEMENT", placement, discarded)
-                          else:
-                               print("Не удалось разместить Фантазию без фола.")
-                               action = ("FANTASYLAND_FOUL", hand)
-                     else: # AI
-                          print(f"AI Игрок {p_idx} решает Фантазию...")
-                          action = ai_player.choose_action(current_state) # Делегирует солверу
-                else: # Обычный ход
-                     print(f"(Улица {current_state.street})")
-                     hand = current_state.current_hands[p_idx]
-                     board = current_state.boards[p_idx]
-                     if p_idx == human_player_idx:
-                          if current_state.street == 1:
-                               action = get_human_action_street1(hand, board)
-                          else:
-                               action = get_human_action_pineapple(hand, board)
-                     else: # AI
-                          print(f"AI Игрок {p_idx} думает...")
-                          action = ai_player.choose_action(current_state) # MCTS
-                          print(f"AI выбрал: {ai_player._format_action(action)}")
-
-                # --- Применение действия ---
-                if action is None:
-                     # Если игрок не смог сделать ход (например, ошибка ввода у человека)
-                     # Или AI не смог выбрать действие (маловероятно после исправлений)
-                     print(f"Ошибка: Игрок {p_idx} не смог сделать ход. Считаем фолом.")
-                     if is_fantasyland_turn:
-                          current_state = current_state.apply_fantasyland_foul(p_idx, hand)
-                     else:
-                          # Фол в обычном режиме
-                          current_state.boards[p_idx].is_foul = True
-                          current_state._player_finished_round[p_idx] = True
-                          if current_state.current_hands.get(p_idx): # Сбрасываем руку
-                               current_state.private_discard[p_idx].extend(current_state.current_hands[p_idx])
-                               current_state.current_hands[p_idx] = None
-                     made_move_in_loop = True
-                else:
-                     # Применяем действие
-                     if isinstance(action, tuple) and action[0] == "FANTASYLAND_PLACEMENT":
-                          _, placement, discarded = action
-                          current_state = current_state.apply_fantasyland_placement(p_idx, placement, discarded)
-                     elif isinstance(action, tuple) and action[0] == "FANTASYLAND_FOUL":
-                          _, hand_to_discard = action
-                          current_state = current_state.apply_fantasyland_foul(p_idx, hand_to_discard)
-                     else: # Обычное действие
-                          current_state = current_state.apply_action(p_idx, action)
-                     made_move_in_loop = True
-
-                # Отображаем доску после хода
-                print(f"Доска Игрока {p_idx} после хода:")
-                print(current_state.boards[p_idx])
-                if current_state._player_finished_round[p_idx]:
-                     print(f"Игрок {p_idx} завершил раунд.")
-
-
-            # --- Логика после попытки хода всех игроков ---
-            if not current_state.is_round_over() and made_move_in_loop:
-                 # Переход улицы / Раздача карт (только для обычного раунда)
-                 if not current_state.is_fantasyland_round and all(current_state._player_acted_this_street):
-                      current_state.street += 1
-                      if current_state.street <= 5:
-                           print(f"\n--- Переход на Улицу {current_state.street} ---")
-                           current_state._player_acted_this_street = [False] * num_players
-                           current_state.current_player_idx = 1 - current_state.dealer_idx
-                           current_state._deal_street_to_player(current_state.current_player_idx)
-                      # else: Раунд закончится на следующей итерации
-
-                 # Передача хода / Раздача (обычный раунд)
-                 elif not current_state.is_fantasyland_round and not all(current_state._player_acted_this_street):
-                      next_player = 1 - current_state.current_player_idx
-                      if not current_state._player_acted_this_street[next_player]:
-                           current_state.current_player_idx = next_player
-                           if current_state.current_hands.get(next_player) is None:
-                                current_state._deal_street_to_player(next_player)
-
-                 # Раздача карт в FL раунде (не-FL игрокам)
-                 elif current_state.is_fantasyland_round:
-                      for p_idx_deal in range(num_players):
-                           if not current_state.fantasyland_status[p_idx_deal] and \
-                              not current_state._player_finished_round[p_idx_deal] and \
-                              current_state.current_hands.get(p_idx_deal) is None:
-                                   # Пытаемся раздать следующую улицу
-                                   # Нужна более точная логика отслеживания улицы для не-FL игрока
-                                   current_state._deal_street_to_player(p_idx_deal)
-
-
-            # Защита от зацикливания, если никто не смог сходить
-            elif not current_state.is_round_over() and not made_move_in_loop:
-                 print("Предупреждение: Ни один игрок не смог сделать ход. Проверка состояния...")
-                 # Проверяем, ждут ли все игроки карт
-                 all_waiting = True
-                 for p_idx_wait in range(num_players):
-                      if not current_state._player_finished_round[p_idx_wait]:
-                           if current_state.is_fantasyland_round and current_state.fantasyland_status[p_idx_wait]:
-                                if current_state.fantasyland_hands[p_idx_wait] is not None:
-                                     all_waiting = False; break # Есть рука ФЛ
-                           elif current_state.current_hands.get(p_idx_wait) is not None:
-                                all_waiting = False; break # Есть обычная рука
-                 if all_waiting:
-                      print("Все активные игроки ждут карт. Попытка раздачи...")
-                      # Пытаемся раздать (логика раздачи должна справиться)
-                      if not current_state.is_fantasyland_round:
-                           current_state._deal_street_to_player(current_state.current_player_idx)
+            p_idx = current_state.advance() # Раздает карты игроку, если нужно
+            if p_idx == -1: break
+
+            action = None
+            is_fantasyland_turn = current_state.is_fantasyland_round and current_state.fantasyland_status[p_idx]
+            hand = current_state.get_player_hand(p_idx)
+
+            # --- Получение действия ---
+            print(f"\n--- Ход Игрока {p_idx} ---")
+            if is_fantasyland_turn:
+                 print("(Фантазия)")
+                 if p_idx == human_player_idx:
+                      placement, discarded = None, None
+                      # Даем несколько попыток разместить без фола
+                      for attempt in range(3):
+                           placement, discarded = get_human_fantasyland_placement(hand)
+                           if placement: break # Успешно разместили
+                           print("Попробуйте разместить снова.")
+                      if placement:
+                           action = ("FANTASYLAND_PLACEMENT", placement, discarded)
                       else:
-                           for p_idx_deal in range(num_players):
-                                if not current_state.fantasyland_status[p_idx_deal] and not current_state._player_finished_round[p_idx_deal]:
-                                     current_state._deal_street_to_player(p_idx_deal)
-                 else:
-                      print("Ошибка: Зацикливание в раунде. Прерывание.")
-                      break # Прерываем раунд
-
+                           print("Не удалось разместить Фантазию без фола.")
+                           action = ("FANTASYLAND_FOUL", hand)
+                 else: # AI
+                      print(f"AI Игрок {p_idx} решает Фантазию...")
+                      action = ai_player.choose_action(current_state) # Делегирует солверу
+            else: # Обычный ход
+                 print(f"(Улица {current_state.street})")
+                 board = current_state.boards[p_idx]
+                 if p_idx == human_player_idx:
+                      if current_state.street == 1:
+                           action = get_human_action_street1(hand, board)
+                      else:
+                           action = get_human_action_pineapple(hand, board)
+                 else: # AI
+                      print(f"AI Игрок {p_idx} думает...")
+                      if search_log is not None:
+                           action, report = ai_player.choose_action(current_state, session_id=round_num, return_report=True)
+                           log_report(report, search_log, round=round_num)
+                      else:
+                           action = ai_player.choose_action(current_state, session_id=round_num) # MCTS, дерево переиспользуется в раунде
+                      print(f"AI выбрал: {ai_player._format_action(action)}")
+
+            # --- Применение действия ---
+            if action is None:
+                 # Если игрок не смог сделать ход (например, ошибка ввода у человека)
+                 print(f"Ошибка: Игрок {p_idx} не смог сделать ход. Считаем фолом.")
+                 current_state = current_state.apply_foul(p_idx)
+            elif isinstance(action, tuple) and action[0] == "FANTASYLAND_PLACEMENT":
+                 _, placement, discarded = action
+                 current_state = current_state.apply_fantasyland_placement(p_idx, placement, discarded)
+            elif isinstance(action, tuple) and action[0] == "FANTASYLAND_FOUL":
+                 _, hand_to_discard = action
+                 current_state = current_state.apply_fantasyland_foul(p_idx, hand_to_discard)
+            else: # Обычное действие
+                 new_state = current_state.apply_action(p_idx, action)
+                 if new_state is current_state:
+                      print(f"Ошибка: ход Игрока {p_idx} не применен. Считаем фолом.")
+                      new_state = current_state.apply_foul(p_idx)
+                 current_state = new_state
+
+            # Отображаем доску после хода
+            print(f"Доска Игрока {p_idx} после хода:")
+            print(current_state.boards[p_idx])
+            if current_state._player_finished_round[p_idx]:
+                 print(f"Игрок {p_idx} завершил раунд.")
+
+
+        ai_player.release_session(round_num)
 
         # --- Подсчет очков раунда ---
         if current_state.is_round_over():
              print("\n--- Раунд Завершен ---")
              print("Финальные доски:")
-             print("Игрок 0:")
-             print(current_state.boards[0])
-             print("Игрок 1:")
-             print(current_state.boards[1])
+             for p_idx in range(num_players):
+                  print(f"Игрок {p_idx}:")
+                  print(current_state.boards[p_idx])
 
-             score_diff = current_state.get_terminal_score()
-             print(f"Счет за раунд (P0 vs P1): {score_diff}")
-             game_score[0] += score_diff
-             game_score[1] -= score_diff
-             print(f"Общий счет: P0={game_score[0]}, P1={game_score[1]}")
+             round_scores = current_state.get_terminal_scores()
+             for p_idx in range(num_players): game_score[p_idx] += int(round_scores[p_idx])
+             print("Счет за раунд: " + ", ".join(f"P{i}={int(sc)}" for i, sc in enumerate(round_scores)))
+             print("Общий счет: " + ", ".join(f"P{i}={sc}" for i, sc in enumerate(game_score)))
 
              # Обновляем статус ФЛ для СЛЕДУЮЩЕГО раунда
              fantasyland_status_carryover = list(current_state.next_fantasyland_status)
@@ -533,7 +449,8 @@ def play_game():
             break
 
     print("\n===== ИГРА ОКОНЧЕНА =====")
-    print(f"Финальный счет: Игрок 0: {game_score[0]}, Игрок 1: {game_score[1]}")
+    print("Финальный счет: " + ", ".join(f"Игрок {i}: {sc}" for i, sc in enumerate(game_score)))
+    ai_player.close() # Останавливаем пул воркеров MCTS
 
 if __name__ == "__main__":
     # Установка кодировки для Windows, если необходимо
@@ -1,35 +1,161 @@
 # mcts_agent.py
-import math
+import contextlib
+import copy
+import io
 import time
 import random
 import multiprocessing # Добавляем импорт
+import multiprocessing.pool
+import queue
+import threading
+import weakref
 import traceback # Для отладки ошибок
-from typing import Optional, Any, List, Tuple, Set
-from mcts_node import MCTSNode # Импортируем обновленный MCTSNode
+import numpy as np
+from typing import Callable, Optional, Any, Dict, List, Tuple
+from mcts_node import MCTSNode, action_code_array # Импортируем обновленный MCTSNode
+from mcts_tree import ArrayTree, NO_NODE
+from transposition import TranspositionTable
+from mcts_session import SearchSession, count_nodes, decision_key
+from collections import OrderedDict
+from search_params import SearchBudget, StreetParams, resolve_street_params, widening_limit
+from action_prior import action_priors, best_by_prior
 from game_state import GameState
 from fantasyland_solver import FantasylandSolver
-from card import card_to_str # Импортируем для форматирования
+from action_codec import decode_action, format_action
+from rollout_ring import RolloutRing, attach as attach_ring
+from time_manager import ChildStats, DecisionClock, TimeManager
+from search_report import ChildReport, PhaseTimes, SearchReport
+from ponder import PonderTask
+from sequential_halving import SequentialHalving
+
+def init_pool_worker():
+    """
+    Инициализатор процесса пула: модули с таблицами (колода, индексы карт,
+    оценщик рук, кодек действий) уже загружены импортом, а пробный роллаут
+    прогревает их, чтобы первая задача поиска не платила за это.
+    """
+    try:
+        with contextlib.redirect_stdout(io.StringIO()): # DEBUG-вывод раздачи не нужен
+            state = GameState()
+            state.start_new_round(0)
+            MCTSNode(state).rollout()
+    except Exception as e:
+        print(f"Warning: pool worker warm-up failed: {e}")
+
+def ping_pool_worker(_: int) -> int:
+    """Пустая задача: выполняется, когда воркер закончил инициализацию (см. MCTSAgent._get_pool)."""
+    return 0
+
+def _shutdown_pool(pool: multiprocessing.pool.Pool, ring: RolloutRing, timeout: float):
+    """
+    Останавливает пул, не дожидаясь задач в работе, и удаляет его кольцо в
+    разделяемой памяти. Если воркер умер, держа блокировку очереди пула,
+    terminate() зависает: тогда через timeout секунд процессы убиваются, а
+    фоновый поток остановки остается висеть.
+    """
+    stopper = threading.Thread(target=pool.terminate, daemon=True)
+    stopper.start()
+    stopper.join(timeout)
+    if stopper.is_alive():
+        for process in pool._pool:
+            if process.is_alive(): process.kill()
+    else:
+        pool.join()
+    ring.close()
 
 # Функция-воркер для параллельного роллаута (должна быть вне класса для pickle)
-def run_parallel_rollout(node_state_dict: dict) -> Tuple[float, Set[Any]]:
-    """Запускает один роллаут из переданного состояния узла."""
+def run_parallel_rollout(node_state_dict: dict) -> Tuple[np.ndarray, np.ndarray]:
+    """Запускает один роллаут из переданного состояния узла. Возвращает очки всех игроков и коды сыгранных действий."""
     # Восстанавливаем состояние и создаем временный узел
     try:
         game_state = GameState.from_dict(node_state_dict)
         # Убедимся, что состояние не терминальное перед роллаутом
         if game_state.is_round_over():
              # Если терминальное, возвращаем счет напрямую
-             score_p0 = game_state.get_terminal_score()
-             return float(score_p0), set()
+             return game_state.get_terminal_scores().astype(np.float64), np.zeros(0, dtype=np.int64)
 
         temp_node = MCTSNode(game_state) # Parent и action не важны для роллаута
-        # Запускаем роллаут с точки зрения игрока 0
-        reward, sim_actions = temp_node.rollout(perspective_player=0)
-        return reward, sim_actions
+        return temp_node.rollout()
     except Exception as e:
         print(f"Error in parallel rollout worker: {e}")
         traceback.print_exc()
-        return 0.0, set() # Возвращаем нейтральный результат в случае ошибки
+        num_players = len(node_state_dict.get("boards", [])) or GameState.NUM_PLAYERS
+        return np.zeros(num_players), np.zeros(0, dtype=np.int64) # Возвращаем нейтральный результат в случае ошибки
+
+def run_ring_rollouts(ring_name: str, num_slots: int, slots: List[int]) -> float:
+    """
+    Роллауты из слотов кольца в разделяемой памяти (rollout_ring) одной
+    задачей пула: состояния читаются из слотов, очки и коды действий пишутся
+    в те же слоты. Возвращает время работы воркера (секунды).
+    """
+    start = time.perf_counter()
+    ring = attach_ring(ring_name, num_slots)
+    for slot in slots:
+        try:
+            game_state = ring.read_state(slot)
+            if game_state.is_round_over(): scores, simulation_actions = game_state.get_terminal_scores().astype(np.float64), np.zeros(0, dtype=np.int64)
+            else: scores, simulation_actions = MCTSNode(game_state).rollout()
+        except Exception as e:
+            print(f"Error in parallel rollout worker: {e}")
+            traceback.print_exc()
+            scores, simulation_actions = np.zeros(GameState.MAX_PLAYERS), np.zeros(0, dtype=np.int64) # Нейтральный результат
+        ring.write_result(slot, scores, simulation_actions)
+    return time.perf_counter() - start
+
+def run_rollout_batch(node_state_dicts: List[dict]) -> Tuple[List[Tuple[np.ndarray, np.ndarray]], float]:
+    """
+    Пакет роллаутов одной задачей пула: по одному роллауту из каждого состояния.
+    Возвращает результаты run_parallel_rollout и время работы воркера (секунды).
+    """
+    start = time.perf_counter()
+    outcomes = [run_parallel_rollout(node_state_dict) for node_state_dict in node_state_dicts]
+    return outcomes, time.perf_counter() - start
+
+
+class PipelineStats:
+    """
+    Загрузка пула за один поиск. Загрузка воркеров - доля их времени, занятая
+    роллаутами (по замерам в самих воркерах); простой родителя - доля времени,
+    которую основной процесс ждал результатов вместо спусков по дереву.
+    """
+    __slots__ = ('num_workers', 'tasks', 'leaves', 'worker_busy', 'parent_wait', 'started', 'wall_time')
+
+    def __init__(self, num_workers: int):
+        self.num_workers = num_workers
+        self.tasks = 0
+        self.leaves = 0
+        self.worker_busy = 0.0
+        self.parent_wait = 0.0
+        self.started = time.perf_counter()
+        self.wall_time = 0.0
+
+    def stop(self):
+        self.wall_time = time.perf_counter() - self.started
+
+    def worker_utilization(self) -> float:
+        return self.worker_busy / (self.num_workers * self.wall_time) if self.wall_time > 0 else 0.0
+
+    def parent_idle(self) -> float:
+        return self.parent_wait / self.wall_time if self.wall_time > 0 else 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        return {'tasks': self.tasks, 'leaves': self.leaves, 'leaves_per_task': self.leaves / self.tasks if self.tasks else 0.0,
+                'worker_utilization': self.worker_utilization(), 'parent_idle': self.parent_idle(), 'wall_time': self.wall_time}
+
+def run_root_search(agent: 'MCTSAgent', node_state_dict: dict, root_actions: List[int],
+                    budget: SearchBudget, seed: int) -> Tuple[Dict[int, Tuple[int, float]], int]:
+    """
+    Независимый поиск от корня в воркере (root-параллелизм) со своим потоком
+    случайных чисел. Возвращает (действие -> (посещения, сумма наград ходящего), число симуляций).
+    """
+    try:
+        random.seed(seed)
+        np.random.seed(seed & 0xFFFFFFFF)
+        return agent._search_root_stats(GameState.from_dict(node_state_dict), root_actions, budget)
+    except Exception as e:
+        print(f"Error in root search worker: {e}")
+        traceback.print_exc()
+        return {}, 0
 
 
 class MCTSAgent:
@@ -40,13 +166,81 @@ class MCTSAgent:
     # Используем N-1 ядер, но не менее 1
     DEFAULT_NUM_WORKERS = max(1, multiprocessing.cpu_count() - 1 if multiprocessing.cpu_count() > 1 else 1)
     DEFAULT_ROLLOUTS_PER_LEAF = 4 # Количество роллаутов на лист за одну параллельную итерацию
+    TREE_STORES = ('nodes', 'arrays', 'stateless') # stateless - ArrayTree без состояний в узлах
+    DEFAULT_TREE_STORE = 'nodes'
+    DEFAULT_CHECKPOINT_DEPTHS: Tuple[int, ...] = () # Глубины, где stateless-дерево хранит состояния
+    DEFAULT_TRANSPOSITION_SIZE = 0 # Размер таблицы транспозиций (0 - обычное дерево); только для tree_store='nodes'
+    DEFAULT_SESSION_MAX_NODES = 200000 # Деревья больше этого не сохраняются между решениями
+    MAX_SESSIONS = 64 # Сохраненных деревьев (сессия, игрок); лишние вытесняются по давности
+    # Параметры поиска по улицам поверх exploration/rave_k (см. search_params).
+    # На улице 1 тысячи действий - дети добавляются постепенно (progressive widening)
+    DEFAULT_STREET_PARAMS: Dict[int, Dict[str, float]] = {1: {'pw_k': 4.0, 'pw_alpha': 0.5}}
+    SELECTIONS = ('uct', 'puct') # puct - только для tree_store='nodes'
+    DEFAULT_SELECTION = 'uct'
+    DEFAULT_PRIOR_TEMPERATURE = 2.0 # Температура softmax эвристических оценок для prior PUCT
+    DEFAULT_FPU_REDUCTION = 0.25 # Q непосещенного действия = средний нормированный Q посещенных минус это значение
+    # Раздачи в дереве: none - узел после хода ждет раздачи и остается листом,
+    # sampled - явные узлы случая с исходами раздачи, open_loop - узлы хранят
+    # только действия, раздачи каждый раз новые. Только для tree_store='nodes'
+    CHANCE_MODES = ('none', 'sampled', 'open_loop')
+    DEFAULT_CHANCE_MODE = 'sampled'
+    DEFAULT_CHANCE_POLICY = 'sample' # См. MCTSNode.CHANCE_POLICIES
+    DEFAULT_CHANCE_OUTCOMES = 8 # Лимит различных исходов раздачи у узла случая (0 - без лимита)
+    # Widening open-loop в узлах со свежей раздачей, если у улицы pw_k <= 0: коды
+    # действий включают карты, и дети прошлых раздач почти никогда не легальны
+    OPEN_LOOP_PW_K = 1.0
+    OPEN_LOOP_PW_ALPHA = 0.5
+    # Параллелизм: none - последовательный поиск в этом процессе (без пула; с
+    # seed воспроизводим), leaf - роллауты одного листа параллельно, tree -
+    # несколько листьев в работе одновременно с виртуальным поражением, root -
+    # независимые деревья в каждом воркере со слиянием статистики корня
+    # (tree и root - только tree_store='nodes')
+    PARALLEL_MODES = ('none', 'leaf', 'tree', 'root')
+    DEFAULT_PARALLEL = 'tree'
+    DEFAULT_VIRTUAL_LOSS = 3.0 # Очков поражения за каждую незавершенную симуляцию через узел
+    POOL_START_METHOD = 'spawn'
+    POOL_STOP_TIMEOUT = 2.0 # Секунд на штатную остановку пула
+    RESULT_TIMEOUT = 10.0 # Секунд ожидания роллаута, если у бюджета нет дедлайна
+    IN_FLIGHT_PER_WORKER = 2 # Задач в работе на воркера: пока воркер считает, готовится следующая
+    DRAIN_WAIT = 0.005 # Секунд ожидания задач в конце поиска между вызовами yield_hook
+    DEFAULT_LEAF_BATCH_SIZE = 2 # Роллаутов (листьев) в одной задаче пула при parallel='tree'
+    # Обдумывание на ходе соперника (см. ponder.py и start_pondering)
+    DEFAULT_PONDER_SHARE = 0.0 # Доля CPU фонового поиска (0 - без обдумывания)
+    DEFAULT_PONDER_MAX_TIME_MS = 60000 # Дольше не обдумываем (брошенная партия)
+    DEFAULT_SOLVER = True # MCTS-Solver: точные значения решенных поддеревьев (только tree_store='nodes')
+    SOLVER_CHANCE_OUTCOMES = 128 # С солвером узел случая с не большим числом раздач раскрывается целиком (решаем)
+    # Выбор действия корня: uct - как в остальном дереве, gumbel - Gumbel-top-k
+    # кандидатов и sequential halving (см. sequential_halving; только tree_store='nodes')
+    ROOT_SELECTIONS = ('uct', 'gumbel')
+    DEFAULT_ROOT_SELECTION = 'uct'
+    DEFAULT_GUMBEL_K = 16 # Кандидатов корня для gumbel
 
     def __init__(self,
                  exploration: Optional[float] = None,
                  rave_k: Optional[float] = None,
                  time_limit_ms: Optional[int] = None,
                  num_workers: Optional[int] = None, # Параметр для кол-ва воркеров
-                 rollouts_per_leaf: Optional[int] = None): # Параметр для кол-ва роллаутов на лист
+                 rollouts_per_leaf: Optional[int] = None, # Параметр для кол-ва роллаутов на лист
+                 tree_store: Optional[str] = None, # 'nodes' (MCTSNode), 'arrays' или 'stateless' (ArrayTree)
+                 checkpoint_depths: Optional[Tuple[int, ...]] = None,
+                 transposition_size: Optional[int] = None,
+                 session_max_nodes: Optional[int] = None,
+                 street_params: Optional[Dict[int, Dict[str, float]]] = None, # {улица: {параметр: значение}}
+                 selection: Optional[str] = None, # 'uct' (UCB1 + RAVE) или 'puct' (prior + PUCT)
+                 chance_mode: Optional[str] = None,
+                 chance_policy: Optional[str] = None,
+                 max_chance_outcomes: Optional[int] = None,
+                 parallel: Optional[str] = None,
+                 virtual_loss: Optional[float] = None,
+                 leaf_batch_size: Optional[int] = None,
+                 max_iterations: Optional[int] = None, # Лимиты работы по умолчанию (вместе с time_limit_ms)
+                 max_simulations: Optional[int] = None,
+                 time_manager: Optional[TimeManager] = None, # Время по улицам и ранняя остановка вместо time_limit_ms
+                 ponder_share: Optional[float] = None,
+                 ponder_max_time_ms: Optional[int] = None,
+                 solver: Optional[bool] = None,
+                 root_selection: Optional[str] = None,
+                 gumbel_k: Optional[int] = None):
 
         self.exploration = exploration if exploration is not None else self.DEFAULT_EXPLORATION
         self.rave_k = rave_k if rave_k is not None else self.DEFAULT_RAVE_K
@@ -63,38 +257,257 @@ class MCTSAgent:
              print(f"Warning: num_workers=1, reducing rollouts_per_leaf from {self.rollouts_per_leaf} to 1.")
              self.rollouts_per_leaf = 1
 
+        self.tree_store = tree_store if tree_store is not None else self.DEFAULT_TREE_STORE
+        if self.tree_store not in self.TREE_STORES:
+             raise ValueError(f"Unknown tree_store '{self.tree_store}', expected one of {self.TREE_STORES}")
+        self.checkpoint_depths = tuple(checkpoint_depths) if checkpoint_depths is not None else self.DEFAULT_CHECKPOINT_DEPTHS
+        self.transposition_size = transposition_size if transposition_size is not None else self.DEFAULT_TRANSPOSITION_SIZE
+        self.last_transpositions: Optional[TranspositionTable] = None # Таблица последнего поиска (для статистики)
+        self.session_max_nodes = session_max_nodes if session_max_nodes is not None else self.DEFAULT_SESSION_MAX_NODES
+        self.street_params: Dict[int, StreetParams] = resolve_street_params(self.exploration, self.rave_k, self.DEFAULT_STREET_PARAMS, street_params)
+        self.selection = selection if selection is not None else self.DEFAULT_SELECTION
+        if self.selection not in self.SELECTIONS:
+             raise ValueError(f"Unknown selection '{self.selection}', expected one of {self.SELECTIONS}")
+        if self.selection == 'puct' and self.tree_store != 'nodes':
+             print(f"Warning: selection='puct' is only supported with tree_store='nodes', using 'uct' for '{self.tree_store}'.")
+             self.selection = 'uct'
+        self.chance_mode = chance_mode if chance_mode is not None else self.DEFAULT_CHANCE_MODE
+        if self.chance_mode not in self.CHANCE_MODES:
+             raise ValueError(f"Unknown chance_mode '{self.chance_mode}', expected one of {self.CHANCE_MODES}")
+        self.chance_policy = chance_policy if chance_policy is not None else self.DEFAULT_CHANCE_POLICY
+        if self.chance_policy not in MCTSNode.CHANCE_POLICIES:
+             raise ValueError(f"Unknown chance_policy '{self.chance_policy}', expected one of {MCTSNode.CHANCE_POLICIES}")
+        self.max_chance_outcomes = max_chance_outcomes if max_chance_outcomes is not None else self.DEFAULT_CHANCE_OUTCOMES
+        if self.tree_store != 'nodes' and self.chance_mode != 'none':
+            if chance_mode is not None: print(f"Warning: chance_mode='{self.chance_mode}' is only supported with tree_store='nodes', ignored.")
+            self.chance_mode = 'none'
+        if self.chance_mode == 'open_loop':
+            # Состояния узлов open-loop - лишь примеры раздач: ни prior, ни ключи позиций к ним не применимы
+            if self.selection == 'puct':
+                 print("Warning: selection='puct' is not supported with chance_mode='open_loop', using 'uct'.")
+                 self.selection = 'uct'
+            if self.transposition_size > 0:
+                 print("Warning: transpositions are not supported with chance_mode='open_loop', disabled.")
+                 self.transposition_size = 0
+        self.parallel = parallel if parallel is not None else self.DEFAULT_PARALLEL
+        if self.parallel not in self.PARALLEL_MODES:
+             raise ValueError(f"Unknown parallel mode '{self.parallel}', expected one of {self.PARALLEL_MODES}")
+        self.virtual_loss = virtual_loss if virtual_loss is not None else self.DEFAULT_VIRTUAL_LOSS
+        if self.tree_store != 'nodes' and self.parallel not in ('none', 'leaf'):
+            if parallel is not None: print(f"Warning: parallel='{self.parallel}' is only supported with tree_store='nodes', using 'leaf'.")
+            self.parallel = 'leaf'
+        self.max_iterations = max_iterations
+        self.max_simulations = max_simulations
+        self.time_manager = time_manager
+        self.ponder_share = max(0.0, min(1.0, ponder_share if ponder_share is not None else self.DEFAULT_PONDER_SHARE))
+        self.ponder_max_time = (ponder_max_time_ms if ponder_max_time_ms is not None else self.DEFAULT_PONDER_MAX_TIME_MS) / 1000.0
+        self._ponder: Optional[PonderTask] = None
+        self.last_ponder: Optional[PonderTask] = None # Последнее завершенное обдумывание (статистика)
+        self._pondered: Optional[PonderTask] = None # Обдумывание, статистику которого еще не забрал choose_action
+        self.solver = solver if solver is not None else self.DEFAULT_SOLVER
+        if self.solver and (self.tree_store != 'nodes' or self.chance_mode == 'open_loop'):
+            # Узлы ArrayTree не хранят точных значений, а состояния open-loop - лишь примеры раздач
+            if solver: print("Warning: solver is only supported with tree_store='nodes' and closed-loop chance modes, disabled.")
+            self.solver = False
+        self.root_selection = root_selection if root_selection is not None else self.DEFAULT_ROOT_SELECTION
+        if self.root_selection not in self.ROOT_SELECTIONS:
+             raise ValueError(f"Unknown root_selection '{self.root_selection}', expected one of {self.ROOT_SELECTIONS}")
+        if self.root_selection == 'gumbel' and (self.tree_store != 'nodes' or self.chance_mode == 'open_loop' or self.parallel == 'root'):
+             # Нужен корень MCTSNode в этом процессе с устойчивыми детьми
+             print("Warning: root_selection='gumbel' is only supported with tree_store='nodes', closed-loop chance modes and parallel other than 'root', using 'uct'.")
+             self.root_selection = 'uct'
+        self.gumbel_k = max(2, gumbel_k if gumbel_k is not None else self.DEFAULT_GUMBEL_K)
+        self.leaf_batch_size = max(1, leaf_batch_size if leaf_batch_size is not None else self.DEFAULT_LEAF_BATCH_SIZE)
+        self.last_simulations = 0 # Симуляций в последнем поиске (для статистики)
+        self.last_iterations = 0 # Итераций (спусков) в последнем поиске
+        self.last_reused_visits: Optional[int] = None # Посещения корня из дерева сессии (None - не переиспользовано)
+        self.last_clock: Optional[DecisionClock] = None # Часы последнего поиска (None - без time_manager)
+        self._phases = PhaseTimes() # Время фаз текущего поиска
+        self._report_root: Any = None # Корень текущего поиска для SearchReport (MCTSNode, ArrayTree или статистика root-режима)
+        self.last_pipeline_stats: Optional[PipelineStats] = None # Загрузка пула в последнем поиске (None - без пула)
+        self.prior_temperature = self.DEFAULT_PRIOR_TEMPERATURE
+        self.fpu_reduction = self.DEFAULT_FPU_REDUCTION
+        # (session_id, игрок) -> дерево прошлого решения (только tree_store='nodes')
+        self._sessions: 'OrderedDict[Tuple[Any, int], SearchSession]' = OrderedDict()
+
         self.fantasyland_solver = FantasylandSolver()
-        print(f"MCTS Agent initialized with: TimeLimit={self.time_limit:.2f}s, Exploration={self.exploration}, RaveK={self.rave_k}, Workers={self.num_workers}, RolloutsPerLeaf={self.rollouts_per_leaf}")
+        print(f"MCTS Agent initialized with: TimeLimit={self.time_limit:.2f}s, Exploration={self.exploration}, RaveK={self.rave_k}, Workers={self.num_workers}, RolloutsPerLeaf={self.rollouts_per_leaf}, TreeStore={self.tree_store}, TT={self.transposition_size}, Selection={self.selection}, Chance={self.chance_mode}, Parallel={self.parallel}, LeafBatch={self.leaf_batch_size}, MaxIterations={self.max_iterations}, MaxSimulations={self.max_simulations}, TimeManager={self.time_manager}, PonderShare={self.ponder_share}, Solver={self.solver}, RootSelection={self.root_selection}")
 
-        # Устанавливаем метод старта процессов (важно для некоторых ОС и окружений)
-        # Делаем это один раз глобально, если возможно
+        # Пул воркеров создается при первом поиске и живет вместе с агентом (см. _get_pool).
+        # Метод старта задается контекстом пула, глобальная настройка multiprocessing не меняется.
+        self._pool: Optional[multiprocessing.pool.Pool] = None
+        self._pool_finalizer: Optional[weakref.finalize] = None
+        self._pool_pids: frozenset = frozenset() # Процессы пула при создании
+        self._ring: Optional[RolloutRing] = None # Слоты состояний и результатов роллаутов (живет вместе с пулом)
+        self._pool_stragglers: List[Tuple[multiprocessing.pool.AsyncResult, Optional[List[int]]]] = [] # Задачи (и их слоты), не успевшие к концу поиска
+        self._pool_broken = False
+        self._pool_owner: Optional['MCTSAgent'] = None # Агент, чьим пулом пользуется копия search_view
+        self._pool_views = 0 # Открытых копий search_view (поиски сервиса), пул перезапускается только без них
+        self._pool_lock: Optional[threading.Lock] = threading.Lock() # Счетчик копий меняют их потоки
+        self.yield_hook: Optional[Callable[[], None]] = None # Вызывается между итерациями поиска (см. search_service)
+        self.decision_start: Optional[float] = None # time.time() начала решения, если поиск начнется позже (очередь search_service)
+
+
+    def choose_action(self, game_state: GameState, session_id: Optional[Any] = None,
+                      budget: Optional[SearchBudget] = None, seed: Optional[int] = None,
+                      return_report: bool = False) -> Any:
+        """
+        Выбирает лучшее действие с помощью MCTS с параллелизацией.
+        Внутри поиска действия - int-коды; наружу возвращается действие-кортеж.
+        session_id - идентификатор игровой сессии: дерево решения сохраняется
+        и переиспользуется в следующем решении того же игрока (см. release_session).
+        budget - лимиты поиска (по умолчанию time_limit_ms и лимиты работы
+        агента). seed - поиск со своим потоком случайных чисел (глобальные
+        генераторы random и numpy восстанавливаются после поиска): при
+        parallel='none' или 'root' и бюджете без дедлайна результат
+        воспроизводим, в tree/leaf он зависит еще и от порядка ответов пула.
+        return_report=True - возвращается (действие, SearchReport).
+        """
+        self.stop_pondering() # Дерево сессии возвращается из фона, CPU - настоящему поиску
+        start = time.perf_counter()
+        self.last_simulations = self.last_iterations = 0
+        self.last_pipeline_stats = self.last_clock = self.last_reused_visits = None
+        self._phases = PhaseTimes()
         try:
-             # Проверяем, установлен ли метод, и если нет, или не 'spawn', пытаемся установить 'spawn'
-             current_method = multiprocessing.get_start_method(allow_none=True)
-             if current_method != 'spawn':
-                  # print(f"Attempting to set multiprocessing start method to 'spawn' (current: {current_method}).")
-                  multiprocessing.set_start_method('spawn', force=True) # force=True может быть необходимо
-                  # print(f"Multiprocessing start method set to: {multiprocessing.get_start_method()}")
-        except Exception as e:
-             print(f"Warning: Could not set multiprocessing start method to 'spawn': {e}. Using default ({multiprocessing.get_start_method()}).")
+            with self._seeded(seed):
+                action = self._choose_action(game_state, session_id, budget)
+            if not return_report: return action
+            return action, self._build_report(game_state, time.perf_counter() - start)
+        finally:
+            self._report_root = None # Не держим дерево до следующего поиска
+
+    def _build_report(self, game_state: GameState, elapsed: float) -> SearchReport:
+        """SearchReport по корню только что завершенного поиска."""
+        source = self._report_root
+        player = game_state.next_to_act()
+        mode = f"{self.parallel}/{self.tree_store}"
+        phase_times: Optional[Dict[str, float]] = self._phases.as_dict()
+        tree_nodes = max_depth = None
+        children: List[ChildReport] = []
+        if isinstance(source, MCTSNode):
+            tree_nodes, max_depth = self._tree_shape(source)
+            actions = list(source.children)
+            rave_visits, rave_reward = source.rave_stats(actions) if actions else ([], [])
+            for action, rv, rr in zip(actions, rave_visits, rave_reward):
+                child = source.children[action]
+                children.append(ChildReport(int(action), int(child.visits), child.total_reward / child.visits if child.visits else None,
+                                            int(rv), float(rr) / rv if rv else None,
+                                            float(child.solved[player]) if child.solved is not None else None))
+        elif isinstance(source, ArrayTree):
+            # Раскрытые узлы (строки еще не опробованных действий не считаются), как у MCTSNode
+            tree_nodes, max_depth = 1 + int(source.num_expanded[:source.size].sum()), int(source.depth[:source.size][source.visits[:source.size] > 0].max(initial=0))
+            block = source.children(source.root)
+            for row in range(block.start, block.stop):
+                visits, rave_visits = int(source.visits[row]), int(source.rave_visits[row])
+                children.append(ChildReport(int(source.action[row]), visits, float(source.total_reward[row]) / visits if visits else None,
+                                            rave_visits, float(source.rave_reward[row]) / rave_visits if rave_visits else None))
+        elif isinstance(source, dict): # root-параллелизм: действие -> [посещения, награда] по всем воркерам
+            if self.num_workers > 1: phase_times = None
+            children = [ChildReport(int(action), int(visits), reward / visits if visits else None, 0, None)
+                        for action, (visits, reward) in source.items()]
+        else: # Решение без поиска
+            fantasyland = player != -1 and game_state.is_fantasyland_round and game_state.fantasyland_status[player]
+            mode = 'fantasyland' if fantasyland else 'forced'
+        children.sort(key=lambda child: child.visits, reverse=True)
+        stop_reason = self.last_clock.stop_reason if self.last_clock is not None else None
+        if isinstance(source, MCTSNode) and source.solved is not None: stop_reason = 'solved'
+        stats = self.last_pipeline_stats
+        return SearchReport(player=player, street=game_state.street, mode=mode,
+                            iterations=self.last_iterations, simulations=self.last_simulations, elapsed=elapsed,
+                            tree_nodes=tree_nodes, max_depth=max_depth,
+                            worker_utilization=stats.worker_utilization() if stats is not None else None,
+                            phase_times=phase_times,
+                            stop_reason=stop_reason,
+                            children=children,
+                            reused_visits=self.last_reused_visits)
+
+    @staticmethod
+    def _tree_shape(root: MCTSNode) -> Tuple[int, int]:
+        """(число узлов, максимальная глубина) дерева от root; общие узлы считаются один раз."""
+        seen = set()
+        max_depth = 0
+        stack = [(root, 0)]
+        while stack:
+            node, depth = stack.pop()
+            if id(node) in seen: continue
+            seen.add(id(node))
+            max_depth = max(max_depth, depth)
+            stack.extend((child, depth + 1) for child in node.children.values())
+        return len(seen), max_depth
+
+    @staticmethod
+    @contextlib.contextmanager
+    def _seeded(seed: Optional[int]):
+        """Засевает random и numpy на время блока и восстанавливает их состояние (seed=None - ничего не меняет)."""
+        if seed is None:
+            yield
+            return
+        saved_random, saved_numpy = random.getstate(), np.random.get_state()
+        random.seed(seed)
+        np.random.seed(seed & 0xFFFFFFFF)
+        try:
+            yield
+        finally:
+            random.setstate(saved_random)
+            np.random.set_state(saved_numpy)
+
+    def _resolve_budget(self, budget: Optional[SearchBudget]) -> SearchBudget:
+        """Бюджет поиска, начинающегося сейчас: без заданных лимитов - time_limit_ms и лимиты работы агента."""
+        if budget is not None and budget.is_limited(): return budget
+        return SearchBudget(self.max_iterations, self.max_simulations, self._decision_start() + self.time_limit)
+
+    def _decision_start(self) -> float:
+        return self.decision_start if self.decision_start is not None else time.time()
+
+    def _plan_search(self, game_state: GameState, budget: Optional[SearchBudget]) -> Tuple[SearchBudget, Optional[DecisionClock]]:
+        """
+        Бюджет и часы поиска, начинающегося сейчас. С time_manager и без
+        заданных лимитов время берется по улице, а жесткий дедлайн часов
+        становится дедлайном бюджета; явный бюджет часов не получает.
+        """
+        self.last_clock = None
+        if self.time_manager is None or (budget is not None and budget.is_limited()):
+            return self._resolve_budget(budget), None
+        clock = self.last_clock = self.time_manager.start(game_state.street, self._decision_start())
+        return SearchBudget(self.max_iterations, self.max_simulations, clock.hard_deadline), clock
+
+    def _search_done(self, budget: SearchBudget, clock: Optional[DecisionClock], iterations: int, simulations: int,
+                     child_stats: ChildStats) -> bool:
+        """
+        Исчерпан бюджет или часы решили остановить поиск. Сначала вызывается
+        yield_hook: поиск может уступить ход другим и продолжиться позже.
+        """
+        if self.yield_hook is not None: self.yield_hook()
+        if budget.exhausted(iterations, simulations): return True
+        return clock is not None and clock.should_stop(iterations, simulations, child_stats)
+
+    @staticmethod
+    def _root_child_stats(root: MCTSNode) -> Tuple[np.ndarray, np.ndarray]:
+        """Посещения и суммы наград детей корня (для DecisionClock)."""
+        children = list(root.children.values())
+        return (np.array([child.visits for child in children], dtype=np.float64),
+                np.array([child.total_reward for child in children], dtype=np.float64))
 
+    def _result_timeout(self, budget: SearchBudget) -> float:
+        """Сколько ждать одну задачу роллаутов пула."""
+        return max(0.1, self.time_limit * 0.1) if budget.deadline is not None else self.RESULT_TIMEOUT
 
-    def choose_action(self, game_state: GameState) -> Optional[Any]:
-        """Выбирает лучшее действие с помощью MCTS с параллелизацией."""
+    @staticmethod
+    def _local_rollout(state: GameState, node: MCTSNode) -> Tuple[List[np.ndarray], np.ndarray]:
+        """Один роллаут в этом процессе (rollout для _run_iteration)."""
+        reward, simulation_actions = MCTSNode(state).rollout()
+        return [reward], simulation_actions
+
+    def _local_rollouts(self, state: GameState, node: MCTSNode) -> Tuple[List[np.ndarray], np.ndarray]:
+        """rollouts_per_leaf роллаутов в этом процессе (parallel='none')."""
+        outcomes = [MCTSNode(state).rollout() for _ in range(self.rollouts_per_leaf)]
+        return [reward for reward, _ in outcomes], np.concatenate([actions for _, actions in outcomes])
+
+
+    def _choose_action(self, game_state: GameState, session_id: Optional[Any], budget: Optional[SearchBudget]) -> Optional[Any]:
+        """Тело choose_action (случайные числа уже засеяны)."""
         # Определяем игрока, для которого выбираем ход
-        player_to_act = -1
-        gs = game_state
-        if gs.is_fantasyland_round:
-             for i in range(gs.NUM_PLAYERS):
-                  if gs.fantasyland_status[i] and not gs._player_finished_round[i]:
-                       player_to_act = i; break
-             if player_to_act == -1:
-                  for i in range(gs.NUM_PLAYERS):
-                       if not gs.fantasyland_status[i] and not gs._player_finished_round[i] and gs.current_hands.get(i):
-                            player_to_act = i; break
-             if player_to_act == -1: player_to_act = gs.current_player_idx
-        else:
-             player_to_act = gs.current_player_idx
+        player_to_act = game_state.next_to_act()
 
         if player_to_act == -1:
              print("Error: Could not determine player to act in choose_action.")
@@ -118,119 +531,801 @@ class MCTSAgent:
                  return None
 
         # --- Обычный ход MCTS ---
-        initial_actions = game_state.get_legal_actions_for_player(player_to_act)
+        initial_actions = game_state.get_legal_action_codes_for_player(player_to_act)
         if not initial_actions: return None
-        if len(initial_actions) == 1: return initial_actions[0]
+        if len(initial_actions) == 1: return decode_action(initial_actions[0])
+        if self.tree_store != 'nodes': return self._choose_action_arrays(game_state, initial_actions, budget)
+        if self.parallel == 'root': return self._choose_action_root_parallel(game_state, initial_actions, budget)
 
-        root_node = MCTSNode(game_state)
-        root_node.untried_actions = list(initial_actions)
-        random.shuffle(root_node.untried_actions)
-        for act in root_node.untried_actions: # Инициализация RAVE
-             if act not in root_node.rave_visits:
-                  root_node.rave_visits[act] = 0
-                  root_node.rave_total_reward[act] = 0.0
+        # Дерево open-loop не переносится: его дети получены при других раздачах
+        session_key = (session_id, player_to_act) if session_id is not None and self.chance_mode != 'open_loop' else None
+        root_node, transpositions = self._reuse_session_tree(session_key, game_state)
+        if root_node is not None: self.last_reused_visits = root_node.visits
+        else:
+            root_node = MCTSNode(game_state)
+            transpositions = TranspositionTable(self.transposition_size) if self.transposition_size > 0 else None
+            if transpositions is not None: root_node.tt_entry = transpositions.lookup(game_state)
+        pondered = self._take_pondered(session_id, game_state, player_to_act)
+        if pondered is not None:
+            self.last_reused_visits = (self.last_reused_visits or 0) + root_node.seed_children(pondered, transpositions)
+        self.last_transpositions = transpositions
+        self._init_root(root_node, initial_actions)
+        self._report_root = root_node
 
-        start_time = time.time()
         num_simulations = 0
+        iterations = 0
 
         try:
-            # Используем контекстный менеджер для пула
-            with multiprocessing.Pool(processes=self.num_workers) as pool:
-                while time.time() - start_time < self.time_limit:
-                    # --- Selection ---
-                    path, leaf_node = self._select(root_node)
-                    if leaf_node is None: continue
-
-                    results = []
-                    simulation_actions_aggregated = set()
-                    node_to_rollout_from = leaf_node
-                    expanded_node = None
-
-                    if not leaf_node.is_terminal():
-                        # --- Expansion (попытка) ---
-                        if leaf_node.untried_actions:
-                             expanded_node = leaf_node.expand()
-                             if expanded_node:
-                                  node_to_rollout_from = expanded_node
-                                  path.append(expanded_node)
-
-                        # --- Parallel Rollouts ---
-                        try:
-                            node_state_dict = node_to_rollout_from.game_state.to_dict()
-                        except Exception as e:
-                             print(f"Error serializing state for parallel rollout: {e}")
-                             continue
-
-                        async_results = [pool.apply_async(run_parallel_rollout, (node_state_dict,))
-                                         for _ in range(self.rollouts_per_leaf)]
-
-                        for res in async_results:
-                            try:
-                                timeout_get = max(0.1, self.time_limit * 0.1)
-                                reward, sim_actions = res.get(timeout=timeout_get)
-                                results.append(reward)
-                                simulation_actions_aggregated.update(sim_actions)
-                                num_simulations += 1
-                            except multiprocessing.TimeoutError:
-                                print("Warning: Rollout worker timed out.")
-                            except Exception as e:
-                                print(f"Warning: Error getting result from worker: {e}")
-
-                    else: # Лист терминальный
-                        reward = leaf_node.game_state.get_terminal_score()
-                        results.append(reward)
-                        num_simulations += 1
-
-                    # --- Backpropagation ---
-                    if results:
-                        total_reward_from_batch = sum(results)
-                        num_rollouts_in_batch = len(results)
-                        if expanded_node and expanded_node.action:
-                             simulation_actions_aggregated.add(expanded_node.action)
-                        self._backpropagate_parallel(path, total_reward_from_batch, num_rollouts_in_batch, simulation_actions_aggregated)
+            pool = self._get_pool() if self.parallel != 'none' else None # Постоянный пул агента; (пере)запуск не съедает бюджет
+            start_time = time.time()
+            budget, clock = self._plan_search(game_state, budget)
+            child_stats = lambda: self._root_child_stats(root_node)
+            halving = self._plan_root_halving(root_node, player_to_act, initial_actions, budget, clock)
+            if self.parallel == 'tree':
+                iterations, num_simulations = self._search_tree_parallel(pool, root_node, transpositions, budget, clock, halving)
+            else:
+                def _pool_rollout(state: GameState, node: MCTSNode) -> Optional[Tuple[List[np.ndarray], np.ndarray]]:
+                    results: List[np.ndarray] = []
+                    simulation_actions: List[np.ndarray] = []
+                    if not self._dispatch_rollouts(pool, state, results, simulation_actions, self._result_timeout(budget)): return None
+                    return results, np.concatenate(simulation_actions) if simulation_actions else np.zeros(0, dtype=np.int64)
+                rollout = _pool_rollout if pool is not None else self._local_rollouts
+                self.last_pipeline_stats = PipelineStats(self.num_workers) if pool is not None else None
+
+                while root_node.solved is None and not self._search_done(budget, clock, iterations, num_simulations, child_stats):
+                    root_action = None
+                    if halving is not None:
+                        root_action = halving.next_action(iterations, num_simulations, root_node)
+                        if root_action is None: break # Остался один кандидат
+                    iterations += 1
+                    num_simulations += self._run_iteration(root_node, transpositions, rollout, root_action) or 0
+                if self.last_pipeline_stats is not None: self.last_pipeline_stats.stop()
 
         except Exception as e:
              print(f"Error during MCTS parallel execution: {e}")
              traceback.print_exc()
-             return random.choice(initial_actions) if initial_actions else None
+             self._pool_broken = True
+             return decode_action(random.choice(initial_actions)) if initial_actions else None
 
         elapsed_time = time.time() - start_time
+        self.last_simulations = num_simulations
+        self.last_iterations = iterations
         # print(f"MCTS ran {num_simulations} simulations in {elapsed_time:.3f}s ({num_simulations/elapsed_time:.1f} sims/s) using {self.num_workers} workers.")
 
         # --- Выбор лучшего хода ---
         if not root_node.children:
-            return random.choice(initial_actions) if initial_actions else None
+            return decode_action(random.choice(initial_actions)) if initial_actions else None
 
         # Вывод статистики (опционально)
         # ...
 
-        best_action_robust = max(root_node.children, key=lambda act: root_node.children[act].visits)
-        return best_action_robust
+        if halving is not None and root_node.solved is None: best_action_robust = halving.best_action(root_node)
+        else: best_action_robust = self._best_child(root_node).action
+        if session_key is not None: self._store_session_tree(session_key, root_node, transpositions)
+        return decode_action(best_action_robust)
+
+
+    def _reuse_session_tree(self, session_key: Optional[Tuple[Any, int]], game_state: GameState) -> Tuple[Optional[MCTSNode], Optional[TranspositionTable]]:
+        """Перекореняет сохраненное дерево сессии на game_state. (None, None) - дерева нет или совпадения нет."""
+        if session_key is None: return None, None
+        stored = self._sessions.pop(session_key, None)
+        if stored is None: return None, None
+        root = stored.reroot(game_state)
+        if root is None: return None, None
+        print(f"MCTS: reusing subtree for session {session_key[0]} player {session_key[1]} ({root.visits} visits).")
+        return root, stored.transpositions
+
+    def _store_session_tree(self, session_key: Tuple[Any, int], root: MCTSNode, transpositions: Optional[TranspositionTable]):
+        """Сохраняет дерево решения, если оно не превышает session_max_nodes."""
+        if count_nodes(root, self.session_max_nodes) > self.session_max_nodes:
+            print(f"MCTS: tree for session {session_key[0]} exceeds {self.session_max_nodes} nodes, not kept.")
+            return
+        self._sessions[session_key] = SearchSession(root, transpositions)
+        while len(self._sessions) > self.MAX_SESSIONS: self._sessions.popitem(last=False)
+
+    def release_session(self, session_id: Any):
+        """Освобождает деревья всех игроков сессии (вызывать по окончании раунда)."""
+        self.stop_pondering(session_id)
+        if self._pondered is not None and self._pondered.session_key[0] == session_id: self._pondered = None
+        for key in [key for key in self._sessions if key[0] == session_id]:
+            del self._sessions[key]
+
+    # --- Обдумывание на ходе соперника ---
+
+    def start_pondering(self, session_id: Any, game_state: GameState, player: int) -> bool:
+        """
+        Запускает фоновый поиск следующего решения игрока player, пока ходит
+        соперник (см. ponder.py): корень - решение player с его картами, ход
+        соперника сэмплируется в каждой итерации. Поиск идет до следующего
+        choose_action, release_session или close (они его останавливают).
+        Обдумывается одна сессия: предыдущее обдумывание останавливается.
+        False - обдумывание выключено или не нужно (в том числе рука player
+        на следующее решение еще не раздана).
+        """
+        self.stop_pondering()
+        self._pondered = None
+        if self.ponder_share <= 0 or self.tree_store != 'nodes' or self.parallel == 'root': return False
+        if game_state.is_round_over() or game_state._player_finished_round[player]: return False
+        if game_state.is_fantasyland_round: return False # Ходы в Фантазии решает солвер, сэмплировать их нечем
+        if game_state.get_player_hand(player) is None or game_state.next_to_act() == player: return False
+        game_state = game_state.copy() # Вызывающий продолжает игру на своем состоянии
+        sample = self._sample_ponder_state(game_state, player)
+        if sample is None: return False
+        root = MCTSNode(sample) # Состояние корня - лишь пример хода соперника
+        # Итерация open-loop добавляет не больше одного узла
+        self._ponder = PonderTask((session_id, player), decision_key(game_state, player), root,
+                                  lambda: self._ponder_iteration(root, game_state, player),
+                                  self.ponder_share, self.ponder_max_time, self.session_max_nodes).start()
+        return True
+
+    def stop_pondering(self, session_id: Optional[Any] = None):
+        """Останавливает обдумывание (только сессии session_id, если задана); его статистику заберет choose_action."""
+        task = self._ponder
+        if task is None or (session_id is not None and task.session_key[0] != session_id): return
+        self._ponder = None
+        task.cancel()
+        self.last_ponder = self._pondered = task
+        print(f"MCTS: pondered session {task.session_key[0]} player {task.session_key[1]}: "
+              f"{task.simulations} simulations in {task.stopped - task.started:.2f}s (CPU share {task.cpu_share():.2f}).")
+
+    def _take_pondered(self, session_id: Optional[Any], game_state: GameState, player: int) -> Optional[MCTSNode]:
+        """Корень обдумывания этого решения (None - обдумывания не было или оно о другом решении)."""
+        task, self._pondered = self._pondered, None
+        if task is None or session_id is None or task.session_key != (session_id, player): return None
+        if task.decision_key != decision_key(game_state, player): return None
+        return task.root
+
+    def _ponder_iteration(self, root: MCTSNode, game_state: GameState, player: int) -> Optional[int]:
+        """Итерация обдумывания: open-loop итерация от root при новом примере ходов соперников."""
+        sample = self._sample_ponder_state(game_state, player)
+        if sample is None: return None
+        return self._run_iteration(root, None, self._local_rollout, root_state=sample)
+
+    def _sample_ponder_state(self, game_state: GameState, player: int) -> Optional[GameState]:
+        """
+        Пример состояния решения player после ходов соперников: их руки,
+        скрытые от player, пересдаются, недостающие раздаются, ходы выбирает
+        эвристика роллаутов. None - ход до player не дошел.
+        """
+        state = game_state.copy()
+        for opponent in range(state.num_players):
+            if opponent != player: state.redeal_hand(opponent)
+        policy = MCTSNode(state)
+        while True:
+            opponent = state.next_to_act()
+            if opponent == player: return state
+            if opponent == -1: return None
+            if state.get_player_hand(opponent) is None:
+                if len(state.deck) < state.street_deal_size(): return None
+                state.deal_street_cards(opponent)
+            codes = state.get_legal_action_codes_for_player(opponent)
+            action = policy._heuristic_rollout_policy(state, opponent, codes) if codes else None
+            if action is None or state.apply_action_inplace(opponent, action) is None: return None
+
+    def __getstate__(self) -> Dict[str, Any]:
+        """Агент передается в воркеры root-параллелизма без сохраненных деревьев сессий и без пула."""
+        state = self.__dict__.copy()
+        state['_sessions'] = OrderedDict()
+        state['last_transpositions'] = None
+        state['_pool'] = None
+        state['_pool_finalizer'] = None
+        state['_pool_pids'] = frozenset()
+        state['_pool_stragglers'] = []
+        state['_ring'] = None
+        state['_pool_broken'] = False
+        state['_report_root'] = None
+        state['_ponder'] = None
+        state['last_ponder'] = None
+        state['_pondered'] = None
+        state['_pool_owner'] = None
+        state['_pool_views'] = 0
+        state['_pool_lock'] = None
+        state['yield_hook'] = None
+        return state
+
+    def search_view(self) -> 'MCTSAgent':
+        """
+        Копия агента для поиска в другом потоке (search_service): своя
+        статистика последнего поиска, общие с агентом параметры, пул, кольцо
+        и деревья сессий. Пулом управляет агент; close() копии пул не
+        останавливает. Поиски копий не должны идти одновременно - их
+        чередует yield_hook. Пока копия не закрыта, агент не ждет чужих
+        задач и не перезапускает пул перед поиском другой копии.
+        """
+        with self._pool_lock: self._pool_views += 1
+        view = copy.copy(self)
+        view._pool_owner = self
+        view._pool_finalizer = None
+        view._ponder = view.last_ponder = view._pondered = None
+        view._phases = PhaseTimes()
+        view.yield_hook = None
+        return view
+
+
+    # --- Пул воркеров ---
+
+    def _get_pool(self, shared: bool = False) -> multiprocessing.pool.Pool:
+        """
+        Постоянный пул агента (метод старта 'spawn'). Создается при первом
+        поиске; неисправный пул (умерший воркер, зависшая задача) перед
+        поиском останавливается и создается заново. Копия search_view
+        получает пул агента; пока открыты другие копии, их задачи в работе
+        и опоздавшие не ждут, а пул не перезапускается (его остановка
+        оборвала бы их поиски), только освобождаются слоты завершившихся.
+        """
+        if self._pool_owner is not None:
+            owner = self._pool_owner
+            pool = owner._get_pool(shared=True)
+            self._pool, self._ring = pool, owner._ring
+            self._pool_stragglers = owner._pool_stragglers # Перезапуск пула создает новый список
+            return pool
+        if self._pool is not None:
+            if shared and self._pool_views > 1: self._reap_stragglers()
+            elif not self._pool_healthy():
+                print("Warning: MCTS worker pool is unhealthy, restarting.")
+                self.close()
+        if self._pool is None:
+            pool = multiprocessing.get_context(self.POOL_START_METHOD).Pool(processes=self.num_workers, initializer=init_pool_worker)
+            # Слотов хватает на все задачи в работе (пакет добирается до rollouts_per_leaf сверх размера) и на опоздавшие
+            ring = RolloutRing(2 * self.num_workers * self.IN_FLIGHT_PER_WORKER * (self.leaf_batch_size + self.rollouts_per_leaf))
+            self._pool, self._ring = pool, ring
+            self._pool_pids = frozenset(process.pid for process in pool._pool)
+            self._pool_stragglers = []
+            self._pool_broken = False
+            # Пул останавливается и при сборке агента или выходе интерпретатора, если close() не вызвали
+            self._pool_finalizer = weakref.finalize(self, _shutdown_pool, pool, ring, self.POOL_STOP_TIMEOUT)
+            pool.map(ping_pool_worker, range(self.num_workers), chunksize=1) # Ждем инициализаторы воркеров
+        return self._pool
+
+    def _pool_healthy(self) -> bool:
+        """
+        Пул принимает задачи, работают те же процессы, что при создании, и
+        задачи, не успевшие к концу прошлого поиска, завершились (за
+        POOL_STOP_TIMEOUT). Pool сам заменяет умерший воркер, но его задачи
+        теряются, а если он умер с блокировкой очереди - пул зависает.
+        """
+        if self._pool_broken: return False
+        if not self._reap_stragglers(self.POOL_STOP_TIMEOUT): return False
+        try:
+            processes = self._pool._pool
+            return (self._pool._state == multiprocessing.pool.RUN and all(process.is_alive() for process in processes)
+                    and frozenset(process.pid for process in processes) == self._pool_pids)
+        except AttributeError: # Внутреннее устройство Pool могло измениться - проверяем только таймауты
+            return True
+
+    def _reap_stragglers(self, timeout: float = 0.0) -> bool:
+        """
+        Ждет до timeout задачи, не успевшие к концу прошлых поисков, и
+        освобождает слоты завершившихся. True - завершились все.
+        """
+        deadline = time.time() + timeout
+        for task, _ in self._pool_stragglers: task.wait(max(0.0, deadline - time.time()))
+        remaining = []
+        for task, slots in self._pool_stragglers:
+            if task.ready(): self._release_slots(slots)
+            else: remaining.append((task, slots))
+        self._pool_stragglers[:] = remaining # Список общий с копиями search_view
+        return not remaining
+
+    def warm_up(self):
+        """Создает пул заранее, чтобы первый ход не платил за запуск воркеров (parallel='none' пул не нужен)."""
+        if self.parallel != 'none': self._get_pool()
+
+    def close(self):
+        """
+        Останавливает обдумывание и пул воркеров (с его кольцом). Следующий
+        поиск создаст новый пул. Копия search_view только передает агенту
+        признак неисправного пула и перестает считаться открытой.
+        """
+        self.stop_pondering()
+        if self._pool_owner is not None:
+            owner = self._pool_owner
+            owner._pool_broken = owner._pool_broken or self._pool_broken
+            with owner._pool_lock: owner._pool_views -= 1
+            self._pool_owner = None # Повторный close() не уменьшает счетчик еще раз
+        elif self._pool_finalizer is not None: self._pool_finalizer()
+        self._pool = None
+        self._ring = None
+        self._pool_finalizer = None
+        self._pool_stragglers = []
+
+    def _submit_rollouts(self, pool, states: List[GameState], callback: Optional[Callable] = None,
+                         error_callback: Optional[Callable] = None) -> Tuple[multiprocessing.pool.AsyncResult, Optional[List[int]]]:
+        """
+        Отправляет в пул одну задачу с роллаутами из states (по одному на
+        состояние). Состояния пишутся в слоты кольца в разделяемой памяти, и
+        воркер получает только их номера; если свободных слотов нет - уходят
+        словарями to_dict. Возвращает задачу и занятые слоты (None - словари).
+        Результат задачи разбирает _collect_rollouts.
+        """
+        slots = self._ring.acquire(len(states)) if self._ring is not None else None
+        if slots is not None:
+            try:
+                for slot, state in zip(slots, states): self._ring.write_state(slot, state)
+                return pool.apply_async(run_ring_rollouts, (self._ring.name, self._ring.num_slots, slots),
+                                        callback=callback, error_callback=error_callback), slots
+            except Exception as e:
+                print(f"Warning: could not write rollout states to shared memory ({e}), sending dicts.")
+                self._release_slots(slots)
+        return pool.apply_async(run_rollout_batch, ([state.to_dict() for state in states],),
+                                callback=callback, error_callback=error_callback), None
+
+    def _collect_rollouts(self, result: Any, slots: Optional[List[int]], num_players: int) -> Tuple[List[Tuple[np.ndarray, np.ndarray]], float]:
+        """Результат задачи _submit_rollouts: (очки и коды действий по состояниям, время воркера). Слоты освобождаются."""
+        if slots is None: return result
+        outcomes = [self._ring.read_result(slot, num_players) for slot in slots]
+        self._release_slots(slots)
+        return outcomes, result
+
+    def _release_slots(self, slots: Optional[List[int]]):
+        if slots is not None and self._ring is not None: self._ring.release(slots)
+
 
+    def _init_root(self, root: MCTSNode, initial_actions: List[int]):
+        """
+        Готовит действия корня: prior для PUCT или упорядоченные неопробованные
+        действия. Для gumbel действия корня задает SequentialHalving - порядок
+        по prior и RAVE корня не нужны (на улице 1 это тысячи действий).
+        """
+        if self.root_selection == 'gumbel':
+            if root.untried_actions is None: root.untried_actions = [action for action in initial_actions if action not in root.children]
+        elif self.selection == 'puct':
+            if root.priors is None: root.init_priors(self.prior_temperature, initial_actions)
+        elif root.untried_actions is None: root.init_untried_actions(initial_actions)
 
-    def _select(self, node: MCTSNode) -> Tuple[List[MCTSNode], Optional[MCTSNode]]:
-        """Фаза выбора узла для расширения/симуляции."""
+
+    def _plan_root_halving(self, root: MCTSNode, player: int, initial_actions: List[int], budget: SearchBudget,
+                           clock: Optional[DecisionClock]) -> Optional[SequentialHalving]:
+        """План sequential halving для корня (None - root_selection не gumbel)."""
+        if self.root_selection != 'gumbel': return None
+        logits = action_priors(root.game_state, player, initial_actions) / max(self.prior_temperature, 1e-6)
+        return SequentialHalving(initial_actions, logits, self.gumbel_k, budget,
+                                 deadline=clock.soft_deadline if clock is not None else None)
+
+
+    def _search_root_stats(self, game_state: GameState, root_actions: List[int], budget: SearchBudget) -> Tuple[Dict[int, Tuple[int, float]], int]:
+        """
+        Последовательный поиск в этом процессе (роллауты без пула) в пределах
+        budget. Возвращает (действие -> (посещения, сумма наград ходящего из
+        корня), число симуляций).
+        """
+        root = MCTSNode(game_state)
+        transpositions = TranspositionTable(self.transposition_size) if self.transposition_size > 0 else None
+        if transpositions is not None: root.tt_entry = transpositions.lookup(game_state)
+        self._init_root(root, root_actions)
+
+        num_simulations = 0
+        iterations = 0
+        while root.solved is None and not budget.exhausted(iterations, num_simulations):
+            iterations += 1
+            num_simulations += self._run_iteration(root, transpositions, self._local_rollout) or 0
+        return {action: (child.visits, child.total_reward) for action, child in root.children.items()}, num_simulations
+
+
+    def _root_budget(self, game_state: GameState, budget: Optional[SearchBudget]) -> SearchBudget:
+        """Бюджет root-поиска: воркеры не видят общего дерева, поэтому от часов - только мягкий дедлайн."""
+        budget, clock = self._plan_search(game_state, budget)
+        return budget if clock is None else budget._replace(deadline=clock.soft_deadline)
+
+    def _choose_action_root_parallel(self, game_state: GameState, initial_actions: List[int],
+                                     budget: Optional[SearchBudget]) -> Optional[Any]:
+        """
+        Root-параллелизм: каждый воркер растит свое дерево от корня до общего
+        дедлайна и на свою долю лимитов работы; обратно приходят только
+        посещения и награды детей корня, которые суммируются. Все воркеры
+        получают один список действий корня (на улице 1 слоты сэмплируются).
+        Один воркер - поиск в этом процессе.
+        """
+        seeds = [random.getrandbits(32) for _ in range(self.num_workers)] # Свой поток случайных чисел у каждого воркера
+        self.last_pipeline_stats = None # Воркеры ведут целые поиски, конвейера роллаутов нет
+        self._report_root = {}
+        outcomes: List[Tuple[Dict[int, Tuple[int, float]], int]] = []
+        try:
+            if self.num_workers == 1:
+                outcomes.append(self._search_root_stats(game_state, initial_actions, self._root_budget(game_state, budget)))
+            else:
+                node_state_dict = game_state.to_dict()
+                pool = self._get_pool()
+                budget = self._root_budget(game_state, budget)
+                worker_budget = budget.split(self.num_workers)
+                async_results = [pool.apply_async(run_root_search, (self, node_state_dict, initial_actions, worker_budget, seed))
+                                 for seed in seeds]
+                grace = self._result_timeout(budget)
+                for res in async_results:
+                    timeout = max(0.1, budget.deadline + grace - time.time()) if budget.deadline is not None else None
+                    try: outcomes.append(res.get(timeout=timeout))
+                    except multiprocessing.TimeoutError:
+                        print("Warning: Root search worker timed out.")
+                        self._pool_stragglers.append((res, None))
+        except Exception as e:
+             print(f"Error during MCTS root-parallel execution: {e}")
+             traceback.print_exc()
+             self._pool_broken = True
+             return decode_action(random.choice(initial_actions))
+
+        merged: Dict[int, List[float]] = {}
+        self._report_root = merged
+        self.last_simulations = 0
+        self.last_iterations = 0 # Итерации воркеров не возвращаются
+        for root_stats, num_simulations in outcomes:
+            self.last_simulations += num_simulations
+            for action, (visits, reward) in root_stats.items():
+                total = merged.setdefault(action, [0, 0.0])
+                total[0] += visits; total[1] += reward
+        if not merged: return decode_action(random.choice(initial_actions))
+        # Больше всего посещений; при равенстве - лучшая средняя награда
+        best_action = max(merged, key=lambda action: (merged[action][0], merged[action][1] / max(1, merged[action][0])))
+        return decode_action(best_action)
+
+
+    @staticmethod
+    def _best_child(node: MCTSNode) -> MCTSNode:
+        """
+        Самый посещаемый ребенок. В DAG считаются посещения позиции по всем
+        путям (транспозиции делят посещения между своими ребрами). У решенного
+        узла - ребенок с точным лучшим значением.
+        """
+        if node.solved is not None:
+            player = node._get_player_to_move()
+            return max((child for child in node.children.values() if child.solved is not None), key=lambda child: child.solved[player])
+        def visits(child: MCTSNode) -> int:
+            return child.tt_entry.visits if child.tt_entry is not None else child.visits
+        return max(node.children.values(), key=visits)
+
+
+    def _choose_action_arrays(self, game_state: GameState, initial_actions: List[int],
+                              budget: Optional[SearchBudget]) -> Optional[Any]:
+        """Тот же поиск, что в choose_action, но на дереве ArrayTree."""
+        tree = ArrayTree(game_state, initial_actions,
+                         store_states=self.tree_store == 'arrays', checkpoint_depths=self.checkpoint_depths)
+        self._report_root = tree
+        num_simulations = 0
+        iterations = 0
+        try:
+            pool = self._get_pool() if self.parallel != 'none' else None
+            budget, clock = self._plan_search(game_state, budget)
+            def child_stats() -> Tuple[np.ndarray, np.ndarray]:
+                block = tree.children(tree.root)
+                return tree.visits[block].astype(np.float64), tree.total_reward[block]
+            self.last_pipeline_stats = PipelineStats(self.num_workers) if pool is not None else None
+            while not self._search_done(budget, clock, iterations, num_simulations, child_stats):
+                iterations += 1
+                phase_start = time.perf_counter()
+                path = tree.select(self.street_params)
+                leaf = path[-1]
+                results = []
+                simulation_actions_aggregated: List[np.ndarray] = []
+                expand_start = time.perf_counter()
+                self._phases.select += expand_start - phase_start
+
+                if not tree.is_terminal(leaf):
+                    expanded = tree.expand(leaf)
+                    if expanded != NO_NODE:
+                        path.append(expanded)
+                        simulation_actions_aggregated.append(tree.action[expanded:expanded + 1])
+                    rollout_start = time.perf_counter()
+                    self._phases.expand += rollout_start - expand_start
+                    with tree.node_state(path[-1]) as state:
+                        if pool is None:
+                            dispatched = True
+                            for _ in range(self.rollouts_per_leaf):
+                                reward, sim_actions = MCTSNode(state).rollout()
+                                results.append(reward)
+                                simulation_actions_aggregated.append(sim_actions)
+                        else:
+                            dispatched = self._dispatch_rollouts(pool, state, results, simulation_actions_aggregated,
+                                                                 self._result_timeout(budget))
+                    self._phases.rollout += time.perf_counter() - rollout_start
+                    if not dispatched: continue
+                else:
+                    with tree.node_state(leaf) as state:
+                        results.append(state.get_terminal_scores().astype(np.float64))
+
+                if results:
+                    backprop_start = time.perf_counter()
+                    tree.backpropagate(path, np.sum(results, axis=0), len(results), np.concatenate(simulation_actions_aggregated or [np.zeros(0, dtype=np.int64)]))
+                    self._phases.backprop += time.perf_counter() - backprop_start
+                    num_simulations += len(results)
+            if self.last_pipeline_stats is not None: self.last_pipeline_stats.stop()
+
+        except Exception as e:
+             print(f"Error during MCTS parallel execution: {e}")
+             traceback.print_exc()
+             self._pool_broken = True
+             return decode_action(random.choice(initial_actions))
+
+        self.last_simulations = num_simulations
+        self.last_iterations = iterations
+        best_action = tree.best_action()
+        if best_action is None: best_action = random.choice(initial_actions)
+        return decode_action(best_action)
+
+
+    def _dispatch_rollouts(self, pool, state: GameState, results: List[np.ndarray], simulation_actions: List[np.ndarray],
+                           timeout: float) -> bool:
+        """
+        Запускает rollouts_per_leaf роллаутов из state в пуле (по задаче на
+        роллаут, чтобы их считали разные воркеры) и ждет их, собирая
+        результаты в results и массивы кодов действий в simulation_actions.
+        Это синхронный leaf-параллелизм: без виртуального поражения следующий
+        спуск все равно выбрал бы тот же лист. Конвейер - parallel='tree'.
+        timeout - секунд ожидания одной задачи. False - если состояние не
+        удалось передать.
+        """
+        try:
+            tasks = [self._submit_rollouts(pool, [state]) for _ in range(self.rollouts_per_leaf)]
+        except Exception as e:
+             print(f"Error serializing state for parallel rollout: {e}")
+             return False
+        stats = self.last_pipeline_stats
+        stats.tasks += len(tasks); stats.leaves += len(tasks)
+
+        for res, slots in tasks:
+            wait_start = time.perf_counter()
+            try:
+                outcomes, busy = self._collect_rollouts(res.get(timeout=timeout), slots, state.num_players)
+                stats.worker_busy += busy
+                for reward, sim_actions in outcomes:
+                    results.append(reward)
+                    simulation_actions.append(sim_actions)
+            except multiprocessing.TimeoutError:
+                print("Warning: Rollout worker timed out.")
+                self._pool_stragglers.append((res, slots)) # Слоты освободятся, когда задача завершится
+            except Exception as e:
+                print(f"Warning: Error getting result from worker: {e}")
+                self._release_slots(slots)
+            finally:
+                stats.parent_wait += time.perf_counter() - wait_start
+        return True
+
+
+    def _descend(self, root: MCTSNode, transpositions: Optional[TranspositionTable],
+                 root_action: Optional[int] = None) -> Tuple[List[MCTSNode], GameState, Optional[MCTSNode]]:
+        """
+        Выбор и раскрытие. root_action - действие корня, заданное заранее
+        (SequentialHalving). Возвращает (путь, состояние для роллаута,
+        раскрытый узел или None).
+        """
+        phase_start = time.perf_counter()
+        if self.chance_mode == 'open_loop':
+            descent = self._select_open_loop(root)
+            self._phases.select += time.perf_counter() - phase_start # Раскрытие open-loop идет вместе со спуском
+            return descent
+        path, leaf_node = self._select(root, transpositions, root_action)
+        expand_start = time.perf_counter()
+        self._phases.select += expand_start - phase_start
+        expanded_node = None
+        if not leaf_node.is_terminal() and leaf_node.untried_actions:
+            expanded_node = leaf_node.expand(transpositions)
+            if expanded_node: path.append(expanded_node)
+        self._phases.expand += time.perf_counter() - expand_start
+        return path, path[-1].game_state, expanded_node
+
+
+    def _search_tree_parallel(self, pool, root: MCTSNode, transpositions: Optional[TranspositionTable],
+                              budget: SearchBudget, clock: Optional[DecisionClock] = None,
+                              halving: Optional[SequentialHalving] = None) -> Tuple[int, int]:
+        """
+        Tree-параллелизм на центральном дереве с конвейером задач: листья
+        копятся в пакет по leaf_batch_size роллаутов, пакет уходит в пул одной
+        задачей, в работе одновременно до IN_FLIGHT_PER_WORKER * num_workers
+        задач. Путь к листу в работе (и в еще не отправленном пакете) получает
+        виртуальное поражение, чтобы следующие спуски расходились по дереву.
+        Колбэки пула только кладут результаты в очередь, дерево меняет лишь
+        этот поток: пакет распространяется по мере поступления и снимает
+        виртуальное поражение. Роллауты в работе засчитываются в
+        max_simulations сразу, чтобы не отправить лишних; clock видит
+        статистику корня вместе с виртуальным поражением. Возвращает (число
+        итераций, число симуляций). С halving действие корня каждого спуска
+        задает он; поиск заканчивается, когда остается один кандидат.
+        """
+        arrived: 'queue.Queue[Tuple[int, Any]]' = queue.Queue()
+        Leaf = Tuple[List[MCTSNode], np.ndarray] # Путь и действия для RAVE
+        in_flight: Dict[int, Tuple[List[Leaf], multiprocessing.pool.AsyncResult, Optional[List[int]]]] = {} # Номер задачи -> (листья пакета, задача, слоты)
+        batch: List[Leaf] = []
+        batch_states: List[GameState] = []
+        num_players = root.game_state.num_players
+        capacity = self.num_workers * self.IN_FLIGHT_PER_WORKER
+        next_task = 0
+        num_simulations = 0
+        iterations = 0
+        pending = 0 # Роллаутов в работе и в пакете
+        stats = self.last_pipeline_stats = PipelineStats(self.num_workers)
+
+        def finish(task_id: int, result: Any) -> int:
+            nonlocal pending
+            leaves, _, slots = in_flight.pop(task_id)
+            pending -= len(leaves)
+            for path, _ in leaves: self._apply_virtual_loss(path, -1)
+            if result is None: # Ошибка в воркере
+                self._release_slots(slots)
+                return 0
+            outcomes, busy = self._collect_rollouts(result, slots, num_players)
+            stats.worker_busy += busy
+            for (path, extra_actions), (reward, simulation_actions) in zip(leaves, outcomes):
+                self._backpropagate_parallel(path, reward, 1, np.concatenate((simulation_actions, extra_actions)), transpositions)
+            return len(outcomes)
+
+        def wait_result(timeout: float) -> Optional[Tuple[int, Any]]:
+            wait_start = time.perf_counter()
+            try: return arrived.get(timeout=max(0.0, timeout))
+            except queue.Empty: return None
+            finally:
+                waited = time.perf_counter() - wait_start
+                stats.parent_wait += waited
+                self._phases.rollout += waited
+
+        def submit():
+            nonlocal next_task
+            phase_start = time.perf_counter()
+            task_id = next_task; next_task += 1
+            task, slots = self._submit_rollouts(pool, batch_states,
+                                                callback=lambda result, task_id=task_id: arrived.put((task_id, result)),
+                                                error_callback=lambda error, task_id=task_id: arrived.put((task_id, None)))
+            in_flight[task_id] = (list(batch), task, slots)
+            stats.tasks += 1; stats.leaves += len(batch)
+            batch.clear(); batch_states.clear()
+            self._phases.rollout += time.perf_counter() - phase_start
+
+        child_stats = lambda: self._root_child_stats(root)
+        while root.solved is None and not self._search_done(budget, clock, iterations, num_simulations + pending, child_stats):
+            if len(in_flight) >= capacity: # Свободного места нет - ждем результат
+                arrival = wait_result(budget.remaining_time(self.RESULT_TIMEOUT))
+                if arrival is not None: num_simulations += finish(*arrival)
+                elif budget.deadline is None: break # Без дедлайна пул не ответил за RESULT_TIMEOUT
+                continue
+            try: # Забираем готовые результаты, не дожидаясь остальных
+                num_simulations += finish(*arrived.get_nowait())
+                continue
+            except queue.Empty: pass
+
+            root_action = None
+            if halving is not None:
+                root_action = halving.next_action(iterations, num_simulations + pending, root)
+                if root_action is None: break # Остался один кандидат
+            iterations += 1
+            path, leaf_state, expanded_node = self._descend(root, transpositions, root_action)
+            extra_actions = np.array([expanded_node.action] if expanded_node and expanded_node.action is not None else [], dtype=np.int64)
+            exact = self._leaf_value(path[-1], leaf_state)
+            if exact is not None: # Терминальный или решенный лист - роллаут не нужен
+                self._backpropagate_parallel(path, exact, 1, extra_actions, transpositions)
+                num_simulations += 1
+                continue
+            for _ in range(self.rollouts_per_leaf):
+                self._apply_virtual_loss(path, +1)
+                batch.append((path, extra_actions))
+                batch_states.append(leaf_state)
+                pending += 1
+            if len(batch) >= self.leaf_batch_size: submit()
+
+        if batch and (budget.deadline is None or time.time() < budget.deadline):
+            submit() # Лимит работы исчерпан до дедлайна - неполный пакет тоже считаем
+        else: # Неотправленный пакет только снимает виртуальное поражение
+            for path, _ in batch: self._apply_virtual_loss(path, -1)
+            pending -= len(batch)
+        # Дожидаемся задач в работе (лимит работы исчерпан раньше - вплоть до
+        # дедлайна бюджета); не успевшие - только снимают виртуальное поражение
+        deadline = max(time.time(), budget.deadline or 0.0) + self._result_timeout(budget)
+        while in_flight and time.time() < deadline:
+            if self.yield_hook is not None: # Ожидание не держит ход дольше кванта планировщика
+                self.yield_hook()
+                arrival = wait_result(min(self.DRAIN_WAIT, deadline - time.time()))
+                if arrival is None: continue
+            else:
+                arrival = wait_result(deadline - time.time())
+                if arrival is None: break
+            num_simulations += finish(*arrival)
+        if in_flight:
+            print(f"Warning: {sum(len(leaves) for leaves, _, _ in in_flight.values())} rollouts did not finish in time.")
+            for task_id in list(in_flight):
+                leaves, task, slots = in_flight.pop(task_id)
+                for path, _ in leaves: self._apply_virtual_loss(path, -1)
+                self._pool_stragglers.append((task, slots)) # Слоты освободятся, когда задача завершится
+        stats.stop()
+        return iterations, num_simulations
+
+
+    def _apply_virtual_loss(self, path: List[MCTSNode], sign: int):
+        """
+        Добавляет (sign=+1) или снимает (sign=-1) виртуальное поражение на пути:
+        посещение с потерей virtual_loss очков для игрока, сделавшего ход в узел.
+        Q из записи транспозиции его не видит - там меняется только число посещений.
+        """
+        for node in path:
+            node.visits += sign
+            node.total_reward -= sign * self.virtual_loss
+
+
+    def _run_iteration(self, root: MCTSNode, transpositions: Optional[TranspositionTable],
+                       rollout: Callable[[GameState, MCTSNode], Optional[Tuple[List[np.ndarray], np.ndarray]]],
+                       root_action: Optional[int] = None, root_state: Optional[GameState] = None) -> Optional[int]:
+        """
+        Одна итерация поиска: выбор, раскрытие, симуляции и обратное распространение.
+        rollout(состояние, узел) возвращает (векторы очков, коды действий симуляций)
+        или None. root_action - заданное действие корня. root_state - пример
+        состояния корня для этой итерации (обдумывание): спуск тогда open-loop
+        и без MCTS-Solver. Возвращает число симуляций (None - итерация не удалась).
+        """
+        if root_state is not None:
+            path, leaf_state, expanded_node = self._select_open_loop(root, root_state)
+        else: path, leaf_state, expanded_node = self._descend(root, transpositions, root_action)
+        exact = self._leaf_value(path[-1], leaf_state)
+        if exact is not None:
+            results, simulation_actions = [exact], np.zeros(0, dtype=np.int64)
+        else:
+            phase_start = time.perf_counter()
+            outcome = rollout(leaf_state, path[-1])
+            self._phases.rollout += time.perf_counter() - phase_start
+            if outcome is None: return None
+            results, simulation_actions = outcome
+        if not results: return 0
+
+        if expanded_node and expanded_node.action is not None:
+             simulation_actions = np.append(simulation_actions, expanded_node.action)
+        self._backpropagate_parallel(path, np.sum(results, axis=0), len(results), simulation_actions, transpositions,
+                                     solve=root_state is None)
+        return len(results)
+
+
+    def _leaf_value(self, leaf: MCTSNode, leaf_state: GameState) -> Optional[np.ndarray]:
+        """Точные очки листа без роллаута: терминальное состояние или решенный узел (None - нужен роллаут)."""
+        if leaf_state.is_round_over(): return leaf_state.get_terminal_scores().astype(np.float64)
+        return leaf.solved if self.solver else None
+
+    def _select(self, node: MCTSNode, transpositions: Optional[TranspositionTable] = None,
+                root_action: Optional[int] = None) -> Tuple[List[MCTSNode], Optional[MCTSNode]]:
+        """Фаза выбора узла для расширения/симуляции; root_action - заданное действие корня node."""
         path = [node]
         current_node = node
-        while not current_node.is_terminal():
+        while current_node.solved is None and not current_node.is_terminal(): # В решенное поддерево не спускаемся
             player_to_move = current_node._get_player_to_move()
             if player_to_move == -1: return path, current_node # Терминальный
 
-            if current_node.untried_actions is None:
-                 current_node.untried_actions = current_node.game_state.get_legal_actions_for_player(player_to_move)
-                 random.shuffle(current_node.untried_actions)
-                 for act in current_node.untried_actions:
-                     if act not in current_node.rave_visits:
-                         current_node.rave_visits[act] = 0
-                         current_node.rave_total_reward[act] = 0.0
+            if root_action is not None and current_node is node:
+                child = current_node.children.get(root_action)
+                if child is None: # Нераскрытое заданное действие кладется последним и раскрывается вызывающим кодом
+                    untried = current_node.untried_actions # Список готовит _init_root
+                    if root_action in untried: untried.remove(root_action)
+                    untried.append(root_action)
+                    return path, current_node
+                current_node = child
+                path.append(current_node)
+                continue
 
-            if current_node.untried_actions:
-                return path, current_node # Возвращаем для расширения
+            if self.chance_mode == 'sampled' and current_node.is_chance_node():
+                child, created = current_node.sample_outcome(self.chance_policy, self.max_chance_outcomes, transpositions,
+                                                             self.SOLVER_CHANCE_OUTCOMES if self.solver else 0)
+                if child is None: return path, current_node
+                current_node = child
+                path.append(current_node)
+                if created: return path, current_node # Новый исход - лист для роллаута
+                continue
+
+            params = self.street_params.get(current_node.game_state.street, self.street_params[1])
+            if self.selection == 'puct':
+                # PUCT: выбор среди всех действий; нераскрытое выбранное действие
+                # кладется в untried_actions и раскрывается вызывающим кодом
+                if current_node.priors is None: current_node.init_priors(self.prior_temperature)
+                action = current_node.puct_select_action(params.c_puct, self.fpu_reduction)
+                if action is None: return path, current_node # Лист
+                child = current_node.children.get(action)
+                if child is None:
+                    current_node.untried_actions = [action]
+                    return path, current_node
+                current_node = child
+                path.append(current_node)
+                continue
+
+            if current_node.untried_actions is None: current_node.init_untried_actions()
+
+            if current_node.untried_actions and (len(current_node.children) < widening_limit(current_node.visits, params.pw_k, params.pw_alpha)
+                                                 or (self.solver and current_node.solved_children == len(current_node.children))):
+                return path, current_node # Возвращаем для расширения (все раскрытые решены - бюджет на новые действия)
 
             if not current_node.children:
                  return path, current_node # Лист
 
-            selected_child = current_node.uct_select_child(self.exploration, self.rave_k)
+            selected_child = current_node.uct_select_child(params.exploration, params.rave_k)
             if selected_child is None:
                 print(f"Warning: Selection returned None child from node {current_node}. Returning node as leaf.")
                 if current_node.children:
@@ -242,60 +1337,97 @@ class MCTSAgent:
         return path, current_node
 
 
-    def _backpropagate_parallel(self, path: List[MCTSNode], total_reward: float, num_rollouts: int, simulation_actions: Set[Any]):
-        """Фаза обратного распространения для параллельных роллаутов."""
+    def _select_open_loop(self, root: MCTSNode, root_state: Optional[GameState] = None) -> Tuple[List[MCTSNode], GameState, Optional[MCTSNode]]:
+        """
+        Выбор и раскрытие в режиме open-loop: узел хранит последовательность
+        действий, а состояние каждый раз строится заново от корня со свежими
+        раздачами. Ребенок доступен, только если его действие легально при
+        текущей раздаче. В узле со свежей раздачей число детей всегда ограничено
+        widening (OPEN_LOOP_PW_K, если у улицы оно выключено): когда лимит
+        достигнут и легальных детей нет, узел - лист и роллаут идет от раздачи.
+        root_state - состояние корня вместо root.game_state (меняется на месте).
+        Возвращает (путь, состояние листа, раскрытый узел или None).
+        """
+        state = root_state if root_state is not None else root.game_state.copy()
+        path = [root]
+        node = root
+        while not state.is_round_over():
+            player = state.next_to_act()
+            params = self.street_params.get(state.street, self.street_params[1])
+            dealt = state.get_player_hand(player) is None
+            if dealt:
+                if state.is_fantasyland_round and state.fantasyland_status[player]: break
+                if len(state.deck) < state.street_deal_size(): break
+                state.deal_street_cards(player)
+                codes = np.asarray(state.get_legal_action_codes_for_player(player), dtype=np.int64)
+                in_tree = np.isin(codes, np.fromiter(node.children, dtype=np.int64, count=len(node.children)))
+                available = codes[in_tree].tolist()
+                untried = codes[~in_tree]
+                pw_k, pw_alpha = (params.pw_k, params.pw_alpha) if params.pw_k > 0 else (self.OPEN_LOOP_PW_K, self.OPEN_LOOP_PW_ALPHA)
+                can_expand = len(untried) > 0 and len(node.children) < widening_limit(node.visits, pw_k, pw_alpha)
+            else:
+                # Раздача корня известна - действия кэшируются как в обычном дереве
+                if node.untried_actions is None: node.init_untried_actions()
+                available = list(node.children)
+                untried = node.untried_actions
+                can_expand = len(untried) > 0 and len(available) < widening_limit(node.visits, params.pw_k, params.pw_alpha)
+
+            if can_expand:
+                action = best_by_prior(state, player, untried) if dealt else untried.pop()
+                if state.apply_action_inplace(player, action) is None: break
+                child = MCTSNode(state.copy(), parent=node, action=action) # Состояние - пример раздачи
+                node.children[action] = child
+                node.add_rave_actions([action])
+                path.append(child)
+                return path, state, child
+
+            if not available: break
+            node = node.uct_select_child(params.exploration, params.rave_k, available)
+            if node is None or state.apply_action_inplace(player, node.action) is None: break
+            path.append(node)
+        return path, state, None
+
+
+    def _backpropagate_parallel(self, path: List[MCTSNode], total_reward: np.ndarray, num_rollouts: int, simulation_actions: Any,
+                                transpositions: Optional[TranspositionTable] = None, solve: bool = True):
+        """
+        Фаза обратного распространения для параллельных роллаутов.
+        total_reward - сумма векторов очков всех игроков; узел получает
+        компоненту игрока, сделавшего в него ход, RAVE - игрока, ходящего из узла.
+        Запись транспозиции узла (если есть) получает весь вектор.
+        simulation_actions - коды действий симуляций (массив или множество).
+        solve=False - без MCTS-Solver (состояния узлов - лишь примеры раздач).
+        """
         if num_rollouts == 0: return
+        phase_start = time.perf_counter()
+        simulation_codes = action_code_array(simulation_actions)
 
         for node in reversed(path):
             node.visits += num_rollouts
+            if node.tt_entry is not None:
+                node.tt_entry.visits += num_rollouts
+                node.tt_entry.total_reward += total_reward
+                if transpositions is not None: transpositions.touch(node.tt_entry)
             # Игрок, который сделал ход СЮДА
             player_who_acted = node.parent._get_player_to_move() if node.parent else -1
+            if player_who_acted != -1: node.total_reward += float(total_reward[player_who_acted])
 
-            if player_who_acted == 0: node.total_reward += total_reward
-            elif player_who_acted == 1: node.total_reward -= total_reward
-
-            # Обновляем RAVE
+            # Обновляем RAVE (приближение: все действия батча получают num_rollouts)
             player_to_move_from_node = node._get_player_to_move()
             if player_to_move_from_node != -1: # Не обновляем RAVE для терминального узла
-                 possible_actions_from_node = set(node.children.keys())
-                 if node.untried_actions: possible_actions_from_node.update(node.untried_actions)
-                 relevant_sim_actions = simulation_actions.intersection(possible_actions_from_node)
+                 node.update_rave(simulation_codes, num_rollouts, float(total_reward[player_to_move_from_node]))
+        if self.solver and solve: self._propagate_solved(path)
+        self._phases.backprop += time.perf_counter() - phase_start
 
-                 for action in relevant_sim_actions:
-                      if action in node.rave_visits:
-                           # Приближение: увеличиваем на num_rollouts
-                           node.rave_visits[action] += num_rollouts
-                           # RAVE награда обновляется с точки зрения игрока player_to_move_from_node
-                           if player_to_move_from_node == 0: node.rave_total_reward[action] += total_reward
-                           elif player_to_move_from_node == 1: node.rave_total_reward[action] -= total_reward
+    @staticmethod
+    def _propagate_solved(path: List[MCTSNode]):
+        """MCTS-Solver: решает узлы пути снизу вверх, пока решаются (решенный узел засчитывается родителю по пути)."""
+        for i in range(len(path) - 1, -1, -1):
+            node = path[i]
+            if node.solved is not None or not node.try_solve(): return
+            if i > 0: path[i - 1].solved_children += 1
 
 
     def _format_action(self, action: Any) -> str:
-        """Форматирует действие для вывода."""
-        if action is None: return "None"
-        try:
-            if isinstance(action, tuple) and len(action) == 3 and isinstance(action[0], tuple) and isinstance(action[0][0], Card):
-                p1, p2, d = action
-                return f"PINEAPPLE: {card_to_str(p1[0])}@{p1[1]}{p1[2]}, {card_to_str(p2[0])}@{p2[1]}{p2[2]}; Discard {card_to_str(d)}"
-            elif isinstance(action, tuple) and len(action) == 2 and isinstance(action[0], list) and action[0] and isinstance(action[0][0], tuple):
-                 placements_str = ", ".join([f"{card_to_str(c)}@{r}{i}" for c, r, i in action[0]])
-                 return f"STREET 1: Place {placements_str}"
-            elif isinstance(action, tuple) and len(action) == 2 and isinstance(action[0], list) and action[0] and isinstance(action[0][0], Card):
-                 return f"FANTASYLAND_META ({len(action[0])} cards)"
-            elif isinstance(action, tuple) and action[0] == "FANTASYLAND_PLACEMENT":
-                 return f"FANTASYLAND_PLACE (Discard {len(action[2])})"
-            elif isinstance(action, tuple) and action[0] == "FANTASYLAND_FOUL":
-                 return f"FANTASYLAND_FOUL (Discard {len(action[1])})"
-            else:
-                 if isinstance(action, tuple):
-                      formatted_items = []
-                      for item in action:
-                           if isinstance(item, (str, int, float, bool, type(None))): formatted_items.append(repr(item))
-                           elif isinstance(item, Card): formatted_items.append(card_to_str(item))
-                           elif isinstance(item, list): formatted_items.append("[...]")
-                           elif isinstance(item, dict): formatted_items.append("{...}")
-                           else: formatted_items.append(self._format_action(item))
-                      return f"Unknown Tuple Action: ({', '.join(formatted_items)})"
-                 return str(action)
-        except Exception as e:
-             return "ErrorFormattingAction"
+        """Форматирует действие (кортеж или int-код) для вывода."""
+        return format_action(action)
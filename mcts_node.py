@@ -2,8 +2,9 @@
 import math
 import random
 import traceback
-from typing import Optional, Dict, Any, List, Tuple, Set
-from game_state import GameState
+import numpy as np
+from typing import Optional, Dict, Any, List, Tuple
+from game_state import GameState, PHASE_PENDING_DEAL
 # Используем Card (алиас PhevaluatorCard) и RANK_ORDER_MAP, SUIT_ORDER_MAP
 from card import Card, card_to_str, RANK_ORDER_MAP, SUIT_ORDER_MAP
 from scoring import (RANK_CLASS_QUADS, RANK_CLASS_TRIPS, get_hand_rank_safe,
@@ -12,50 +13,234 @@ from scoring import (RANK_CLASS_QUADS, RANK_CLASS_TRIPS, get_hand_rank_safe,
 from itertools import combinations
 from fantasyland_solver import FantasylandSolver
 from collections import Counter # Добавлен импорт Counter
+from action_codec import decode_action
+from transposition import TranspositionEntry, TranspositionTable
+from action_prior import action_priors, order_by_prior
+from card_index import CARD_TO_INDEX
+
+_NO_CODES = np.zeros(0, dtype=np.int64)
+
+def action_code_array(codes: Any) -> np.ndarray:
+    """Коды действий (массив, список или множество) как отсортированный int64-массив без повторов."""
+    if not isinstance(codes, np.ndarray): codes = np.fromiter(codes, dtype=np.int64, count=len(codes))
+    return np.unique(codes.astype(np.int64, copy=False))
+
 
 class MCTSNode:
     """Узел дерева MCTS для OFC Pineapple с RAVE."""
-    def __init__(self, game_state: GameState, parent: Optional['MCTSNode'] = None, action: Optional[Any] = None):
+    # Действия в дереве - упакованные int-коды (action_codec). У узлов случая
+    # (раздача карт, см. is_chance_node) дети - исходы раздачи по ключу
+    # "отсортированные индексы карт", action у них None
+    CHANCE_POLICIES = ('sample', 'balanced')
+    def __init__(self, game_state: GameState, parent: Optional['MCTSNode'] = None, action: Optional[int] = None):
         self.game_state: GameState = game_state
         self.parent: Optional['MCTSNode'] = parent
-        self.action: Optional[Any] = action
-        self.children: Dict[Any, 'MCTSNode'] = {}
-        self.untried_actions: Optional[List[Any]] = None
+        self.action: Optional[int] = action
+        self.children: Dict[Any, 'MCTSNode'] = {} # Действие (или исход раздачи) -> ребенок
+        self.untried_actions: Optional[List[int]] = None
         self.visits: int = 0
         self.total_reward: float = 0.0
-        self.rave_visits: Dict[Any, int] = {}
-        self.rave_total_reward: Dict[Any, float] = {}
+        # RAVE (AMAF): статистика по действиям rave_actions (отсортированные коды);
+        # обновление - одна векторная операция на узел по сыгранным действиям
+        self.rave_actions: np.ndarray = _NO_CODES
+        self.rave_visits: np.ndarray = np.zeros(0, dtype=np.int64)
+        self.rave_total_reward: np.ndarray = np.zeros(0, dtype=np.float64)
+        # Общая статистика позиции из таблицы транспозиций (None - обычное дерево).
+        # visits/total_reward узла тогда - статистика ребра от родителя
+        self.tt_entry: Optional[TranspositionEntry] = None
+        # PUCT: все легальные действия узла и их prior-вероятности (считаются один раз)
+        self.prior_actions: Optional[np.ndarray] = None
+        self.priors: Optional[np.ndarray] = None
+        # MCTS-Solver: точные очки всех игроков, если значение поддерева
+        # определено (см. try_solve), и число решенных детей
+        self.solved: Optional[np.ndarray] = None
+        self.solved_children: int = 0
 
     def _get_player_to_move(self) -> int:
-         gs = self.game_state
-         player_to_move = -1
-         if gs.is_fantasyland_round:
-              for i in range(gs.NUM_PLAYERS):
-                   if not gs._player_finished_round[i]:
-                        if gs.fantasyland_status[i]:
-                             if gs.fantasyland_hands[i] is not None: player_to_move = i; break
-                        else:
-                             if gs.current_hands.get(i) is not None: player_to_move = i; break
-              if player_to_move == -1 and not gs.is_round_over():
-                   if gs.current_player_idx != -1 and not gs._player_finished_round[gs.current_player_idx]: player_to_move = gs.current_player_idx
-                   else:
-                        for i in range(gs.NUM_PLAYERS):
-                             if not gs._player_finished_round[i]: player_to_move = i; break
-         else: player_to_move = gs.current_player_idx
-         if player_to_move == -1 and not gs.is_round_over(): return 0
-         elif gs.is_round_over(): return -1
-         else: return player_to_move
+         """Игрок, который ходит в этом узле (-1 для терминального)."""
+         return self.game_state.next_to_act()
+
+    def is_chance_node(self) -> bool:
+        """Узел случая: ход за игроком, которому еще не розданы карты улицы (не Фантазия)."""
+        state = self.game_state
+        if state.phase() != PHASE_PENDING_DEAL: return False
+        player = state.next_to_act()
+        return not (state.is_fantasyland_round and state.fantasyland_status[player])
+
+    def sample_outcome(self, policy: str, max_outcomes: int,
+                       transpositions: Optional[TranspositionTable] = None,
+                       enumerate_limit: int = 0) -> Tuple[Optional['MCTSNode'], bool]:
+        """
+        Выбирает исход раздачи узла случая. Пока исходов меньше max_outcomes
+        (0 - без ограничения), раздача сэмплируется из колоды, совпавший исход
+        ведет в существующего ребенка. После лимита: 'sample' - равновероятно
+        один из существующих исходов (раздачи равновероятны, выбор по числу
+        посещений смещал бы значение узла к исходу, вырвавшемуся вперед),
+        'balanced' - наименее посещенный.
+        Если всех возможных раздач не больше enumerate_limit, лимит не действует:
+        сначала каждая раздача раскрывается по разу (в случайном порядке), чтобы
+        узел можно было решить (см. try_solve).
+        Возвращает (ребенок или None, создан ли он сейчас).
+        """
+        state = self.game_state
+        deal_size = state.street_deal_size()
+        if len(state.deck) < deal_size: return None, False
+        num_deals = math.comb(len(state.deck), deal_size) if enumerate_limit > 0 else 0
+        if 0 < num_deals <= enumerate_limit:
+            if len(self.children) < num_deals:
+                pending = [cards for cards in combinations(state.deck.get_remaining_cards(), deal_size)
+                           if tuple(sorted(CARD_TO_INDEX[card] for card in cards)) not in self.children]
+                return self.add_outcome(list(random.choice(pending)), transpositions), True
+        elif max_outcomes <= 0 or len(self.children) < max_outcomes:
+            cards = random.sample(state.deck.get_remaining_cards(), deal_size)
+            created = tuple(sorted(CARD_TO_INDEX[card] for card in cards)) not in self.children
+            return self.add_outcome(cards, transpositions), created
+        outcomes = list(self.children.values())
+        if policy == 'balanced': return min(outcomes, key=lambda child: child.visits), False
+        return random.choice(outcomes), False
+
+    def add_outcome(self, cards: List[Card], transpositions: Optional[TranspositionTable] = None) -> 'MCTSNode':
+        """Ребенок узла случая для раздачи cards (создается, если его нет; лимит исходов не проверяется)."""
+        key = tuple(sorted(CARD_TO_INDEX[card] for card in cards))
+        child = self.children.get(key)
+        if child is not None: return child
+        next_state = self.game_state.copy()
+        next_state.deal_street_cards(self._get_player_to_move(), cards)
+        child = MCTSNode(next_state, parent=self)
+        if transpositions is not None: child.tt_entry = transpositions.lookup(next_state)
+        self.children[key] = child
+        return child
 
-    def expand(self) -> Optional['MCTSNode']:
+    def init_priors(self, temperature: float, actions: Optional[List[int]] = None):
+        """
+        Кэширует prior всех действий узла: softmax эвристических оценок
+        (action_prior) с температурой. prior_actions хранятся отсортированными.
+        """
+        player_to_move = self._get_player_to_move()
+        if player_to_move == -1: actions = []
+        elif actions is None: actions = self.game_state.get_legal_action_codes_for_player(player_to_move)
+        self.prior_actions = np.sort(np.asarray(actions, dtype=np.int64))
+        if len(self.prior_actions) == 0: self.priors = np.zeros(0); return
+        logits = action_priors(self.game_state, player_to_move, self.prior_actions) / max(temperature, 1e-6)
+        weights = np.exp(logits - logits.max())
+        self.priors = weights / weights.sum()
+
+    def puct_select_action(self, c_puct: float, fpu_reduction: float) -> Optional[int]:
+        """
+        Действие с максимальным Q + c_puct * P * sqrt(N) / (1 + n) среди всех
+        действий узла (раскрытых и нет). Q (очки) нормируется в [0, 1] по
+        min/max посещенных детей, иначе он подавляет prior-член. Q непосещенных -
+        средний нормированный Q посещенных минус fpu_reduction (First Play Urgency).
+        """
+        if self.prior_actions is None or len(self.prior_actions) == 0: return None
+        player = self._get_player_to_move()
+        visited = [child for child in self.children.values() if child.visits > 0]
+        n = np.zeros(len(self.prior_actions))
+        q = np.zeros(len(self.prior_actions))
+        if visited:
+            idx = np.searchsorted(self.prior_actions, [child.action for child in visited])
+            idx = np.minimum(idx, len(self.prior_actions) - 1)
+            # Дети из переиспользованного дерева могут не входить в выборку слотов улицы 1
+            known = self.prior_actions[idx] == np.array([child.action for child in visited], dtype=np.int64)
+            visited = [child for child, ok in zip(visited, known) if ok]
+            idx = idx[known]
+        if visited:
+            child_q = np.array([child.get_q_value(player) for child in visited])
+            spread = child_q.max() - child_q.min()
+            child_q = (child_q - child_q.min()) / spread if spread > 0 else np.full(len(child_q), 0.5)
+            q[:] = max(0.0, child_q.mean() - fpu_reduction)
+            q[idx] = child_q
+            n[idx] = [child.visits for child in visited]
+        explore = c_puct * self.priors * math.sqrt(max(1, self.visits)) / (1 + n)
+        if visited: explore[idx[np.array([child.solved is not None for child in visited])]] = 0.0 # Решенным исследовать нечего
+        scores = q + explore
+        return int(self.prior_actions[int(np.argmax(scores))])
+
+    def init_untried_actions(self, actions: Optional[List[int]] = None):
+        """
+        Заполняет untried_actions (по умолчанию - все легальные коды без уже
+        раскрытых) в порядке prior: expand() берет с конца лучшее по эвристике.
+        """
+        player_to_move = self._get_player_to_move()
+        if player_to_move == -1: self.untried_actions = []; return
+        if actions is None: actions = self.game_state.get_legal_action_codes_for_player(player_to_move)
+        actions = [act for act in actions if act not in self.children]
+        self.untried_actions = order_by_prior(self.game_state, player_to_move, actions)
+        self.add_rave_actions(self.untried_actions)
+
+    def add_rave_actions(self, actions: Any):
+        """Начинает собирать RAVE-статистику для новых действий (уже известные не сбрасываются)."""
+        codes = np.setdiff1d(action_code_array(actions), self.rave_actions, assume_unique=True)
+        if codes.size == 0: return
+        merged = np.concatenate((self.rave_actions, codes))
+        order = np.argsort(merged, kind='stable')
+        self.rave_actions = merged[order]
+        self.rave_visits = np.concatenate((self.rave_visits, np.zeros(codes.size, dtype=np.int64)))[order]
+        self.rave_total_reward = np.concatenate((self.rave_total_reward, np.zeros(codes.size)))[order]
+
+    def _rave_slots(self, codes: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """(маска кодов, известных RAVE, их позиции в rave_actions)."""
+        slots = np.minimum(np.searchsorted(self.rave_actions, codes), max(0, self.rave_actions.size - 1))
+        known = self.rave_actions[slots] == codes if self.rave_actions.size else np.zeros(codes.size, dtype=bool)
+        return known, slots[known]
+
+    def rave_stats(self, actions: List[int]) -> Tuple[np.ndarray, np.ndarray]:
+        """RAVE-посещения и сумма наград по действиям (нули для неизвестных)."""
+        codes = np.asarray(actions, dtype=np.int64)
+        visits = np.zeros(codes.size, dtype=np.int64); reward = np.zeros(codes.size)
+        known, slots = self._rave_slots(codes)
+        visits[known] = self.rave_visits[slots]; reward[known] = self.rave_total_reward[slots]
+        return visits, reward
+
+    def update_rave(self, simulation_codes: np.ndarray, num_rollouts: int, mover_reward: float):
+        """
+        Scatter-add по сыгранным действиям (simulation_codes - отсортированные
+        уникальные коды): стоимость пропорциональна числу сыгранных действий.
+        """
+        if self.rave_actions.size == 0 or simulation_codes.size == 0: return
+        _, slots = self._rave_slots(simulation_codes)
+        # Коды уникальны - позиции тоже, поэтому хватает обычной индексной записи
+        self.rave_visits[slots] += num_rollouts
+        self.rave_total_reward[slots] += mover_reward
+
+    def expand(self, transpositions: Optional[TranspositionTable] = None) -> Optional['MCTSNode']:
         player_to_move = self._get_player_to_move()
         if player_to_move == -1: return None
-        if self.untried_actions is None:
-             self.untried_actions = self.game_state.get_legal_actions_for_player(player_to_move)
-             random.shuffle(self.untried_actions)
-             for act in self.untried_actions:
-                 if act not in self.rave_visits: self.rave_visits[act] = 0; self.rave_total_reward[act] = 0.0
+        if self.untried_actions is None: self.init_untried_actions()
         if not self.untried_actions: return None
-        action = self.untried_actions.pop()
+        return self._add_action_child(self.untried_actions.pop(), transpositions)
+
+    def add_action(self, action: int, transpositions: Optional[TranspositionTable] = None) -> Optional['MCTSNode']:
+        """Ребенок для заданного действия (раскрывается вне очереди untried_actions, если его нет)."""
+        child = self.children.get(action)
+        if child is not None: return child
+        if self.untried_actions is not None and action in self.untried_actions: self.untried_actions.remove(action)
+        return self._add_action_child(action, transpositions)
+
+    def seed_children(self, source: 'MCTSNode', transpositions: Optional[TranspositionTable] = None) -> int:
+        """
+        Добавляет корню статистику действий source - корня того же решения,
+        набранную при других ходах соперников (обдумывание): посещенные
+        действия раскрываются и получают посещения и награды source, RAVE
+        складывается. Возвращает перенесенные посещения.
+        """
+        seeded = 0
+        for action, source_child in source.children.items():
+            if source_child.visits == 0: continue
+            child = self.add_action(action, transpositions)
+            if child is None: continue
+            child.visits += source_child.visits
+            child.total_reward += source_child.total_reward
+            seeded += source_child.visits
+        self.visits += seeded
+        self.add_rave_actions(source.rave_actions)
+        _, slots = self._rave_slots(source.rave_actions)
+        self.rave_visits[slots] += source.rave_visits
+        self.rave_total_reward[slots] += source.rave_total_reward
+        return seeded
+
+    def _add_action_child(self, action: int, transpositions: Optional[TranspositionTable]) -> Optional['MCTSNode']:
+        player_to_move = self._get_player_to_move()
         next_state = None
         if self.game_state.is_fantasyland_round and self.game_state.fantasyland_status[player_to_move]:
              print(f"Warning: expand called for Fantasyland player {player_to_move}."); return None
@@ -64,80 +249,79 @@ class MCTSNode:
              except Exception as e: print(f"Error applying action during expand for player {player_to_move}: {e}"); traceback.print_exc(); return None
         if next_state is None: return None
         child_node = MCTSNode(next_state, parent=self, action=action)
+        if transpositions is not None: child_node.tt_entry = transpositions.lookup(next_state)
         self.children[action] = child_node
         return child_node
 
     def is_terminal(self) -> bool:
         return self.game_state.is_round_over()
 
-    def rollout(self, perspective_player: int = 0) -> Tuple[float, Set[Any]]:
-        current_rollout_state = self.game_state.copy()
+    def is_fully_expanded(self) -> bool:
+        """Все действия узла решения раскрыты (PUCT - по списку prior, UCT - неопробованных не осталось)."""
+        if self.prior_actions is not None: return len(self.children) >= len(self.prior_actions)
+        return self.untried_actions is not None and not self.untried_actions
+
+    def try_solve(self) -> bool:
+        """
+        MCTS-Solver: помечает узел решенным, если его значение определено:
+        терминальный узел - очки раунда; узел решения, все действия которого
+        раскрыты и решены, - очки лучшего для ходящего ребенка; узел случая,
+        все исходы раздачи которого в дереве и решены, - средние очки (раздачи
+        равновероятны). True - узел решен.
+        Все исходы попадают в дерево, только если sample_outcome перебирает
+        их (enumerate_limit): это последние раздачи за столом на 3 игрока
+        (4-120 исходов), а у двух игроков раздачи улицы 5 - больше 1000
+        исходов, и решаются лишь узлы решения последнего хода раунда.
+        """
+        if self.solved is not None: return True
+        state = self.game_state
+        if state.is_round_over():
+            self.solved = state.get_terminal_scores().astype(np.float64)
+            return True
+        if not self.children or self.solved_children < len(self.children): return False
+        outcomes = [child.solved for child in self.children.values()]
+        if self.is_chance_node():
+            if len(self.children) < math.comb(len(state.deck), state.street_deal_size()): return False
+            self.solved = np.mean(outcomes, axis=0)
+            return True
+        if not self.is_fully_expanded(): return False
+        player = self._get_player_to_move()
+        self.solved = max(outcomes, key=lambda scores: scores[player])
+        return True
+
+    def rollout(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Доигрывает раунд эвристической политикой. Возвращает (очки всех игроков, массив кодов сыгранных действий)."""
+        state = self.game_state.copy()
         simulation_actions_set = set()
         MAX_ROLLOUT_STEPS = 50
         steps = 0
-        while not current_rollout_state.is_round_over() and steps < MAX_ROLLOUT_STEPS:
-            steps += 1; made_move_this_iter = False; player_acted_in_iter = -1
-            player_to_act_rollout = -1
-            gs_rollout = current_rollout_state
-            if gs_rollout.is_fantasyland_round:
-                 for i in range(gs_rollout.NUM_PLAYERS):
-                      if not gs_rollout._player_finished_round[i]:
-                           if gs_rollout.fantasyland_status[i] and gs_rollout.fantasyland_hands[i] is not None: player_to_act_rollout = i; break
-                           elif not gs_rollout.fantasyland_status[i] and gs_rollout.current_hands.get(i) is not None: player_to_act_rollout = i; break
-                 if player_to_act_rollout == -1 and not gs_rollout.is_round_over(): player_to_act_rollout = gs_rollout.current_player_idx
-            else: player_to_act_rollout = gs_rollout.current_player_idx
-
-            if player_to_act_rollout != -1 and not current_rollout_state._player_finished_round[player_to_act_rollout]:
-                action = None
-                is_fl_placement = current_rollout_state.is_fantasyland_round and current_rollout_state.fantasyland_status[player_to_act_rollout]
-                if is_fl_placement:
-                    hand = current_rollout_state.fantasyland_hands[player_to_act_rollout]
-                    if hand:
-                        placement, discarded = self._heuristic_fantasyland_placement(hand)
-                        if placement: current_rollout_state = current_rollout_state.apply_fantasyland_placement(player_to_act_rollout, placement, discarded)
-                        else: current_rollout_state = current_rollout_state.apply_fantasyland_foul(player_to_act_rollout, hand)
-                        made_move_this_iter = True; player_acted_in_iter = player_to_act_rollout
-                else:
-                    hand = current_rollout_state.current_hands.get(player_to_act_rollout)
-                    if hand:
-                        possible_moves = current_rollout_state.get_legal_actions_for_player(player_to_act_rollout)
-                        if possible_moves:
-                            action = self._heuristic_rollout_policy(current_rollout_state, player_to_act_rollout, possible_moves)
-                            if action: simulation_actions_set.add(action); current_rollout_state = current_rollout_state.apply_action(player_to_act_rollout, action); made_move_this_iter = True; player_acted_in_iter = player_to_act_rollout
-                            else: current_rollout_state.boards[player_to_act_rollout].is_foul = True; current_rollout_state._player_finished_round[player_to_act_rollout] = True; current_rollout_state.current_hands[player_to_act_rollout] = None; made_move_this_iter = True; player_acted_in_iter = player_to_act_rollout
-                        else: current_rollout_state.boards[player_to_act_rollout].is_foul = True; current_rollout_state._player_finished_round[player_to_act_rollout] = True; current_rollout_state.current_hands[player_to_act_rollout] = None; made_move_this_iter = True; player_acted_in_iter = player_to_act_rollout
-
-            if not current_rollout_state.is_round_over():
-                 needs_dealing = False
-                 if not current_rollout_state.is_fantasyland_round and all(current_rollout_state._player_acted_this_street):
-                      current_rollout_state.street += 1
-                      if current_rollout_state.street <= 5: current_rollout_state._player_acted_this_street = [False] * current_rollout_state.NUM_PLAYERS; current_rollout_state.current_player_idx = 1 - current_rollout_state.dealer_idx; needs_dealing = True
-                 elif not current_rollout_state.is_fantasyland_round and made_move_this_iter and player_acted_in_iter != -1:
-                      next_player = 1 - player_acted_in_iter
-                      if not current_rollout_state._player_acted_this_street[next_player] and not current_rollout_state._player_finished_round[next_player]: current_rollout_state.current_player_idx = next_player; needs_dealing = current_rollout_state.current_hands.get(next_player) is None
-                 if needs_dealing or current_rollout_state.is_fantasyland_round:
-                      players_to_deal = []
-                      if needs_dealing and not current_rollout_state.is_fantasyland_round:
-                           p_idx = current_rollout_state.current_player_idx
-                           if not current_rollout_state._player_finished_round[p_idx] and current_rollout_state.current_hands.get(p_idx) is None: players_to_deal.append(p_idx)
-                      elif current_rollout_state.is_fantasyland_round:
-                           for p_idx_deal in range(current_rollout_state.NUM_PLAYERS):
-                                if not current_rollout_state.fantasyland_status[p_idx_deal] and not current_rollout_state._player_finished_round[p_idx_deal] and current_rollout_state.current_hands.get(p_idx_deal) is None: players_to_deal.append(p_idx_deal)
-                      for p_idx_deal in players_to_deal: current_rollout_state._deal_street_to_player(p_idx_deal)
-            if not current_rollout_state.is_round_over() and not made_move_this_iter and steps > 1: break
-        if steps >= MAX_ROLLOUT_STEPS: pass
-        final_score_p0 = current_rollout_state.get_terminal_score()
-        if perspective_player == 0: return float(final_score_p0), simulation_actions_set
-        elif perspective_player == 1: return float(-final_score_p0), simulation_actions_set
-        else: return 0.0, simulation_actions_set
+        while not state.is_round_over() and steps < MAX_ROLLOUT_STEPS:
+            steps += 1
+            player = state.advance() # Раздача карт, если ход ждет раздачи
+            if player == -1: break
+            if state.is_fantasyland_round and state.fantasyland_status[player]:
+                hand = state.fantasyland_hands[player]
+                placement, discarded = self._heuristic_fantasyland_placement(hand) if hand else (None, None)
+                if placement: state = state.apply_fantasyland_placement(player, placement, discarded)
+                else: state = state.apply_foul(player)
+                continue
+            possible_moves = state.get_legal_action_codes_for_player(player)
+            action = self._heuristic_rollout_policy(state, player, possible_moves) if possible_moves else None
+            if action is None: state = state.apply_foul(player); continue
+            simulation_actions_set.add(action)
+            state = state.apply_action(player, action)
+        return state.get_terminal_scores().astype(np.float64), action_code_array(simulation_actions_set)
 
     def _heuristic_rollout_policy(self, state: GameState, player_idx: int, actions: List[Any]) -> Optional[Any]:
-        """Улучшенная эвристика для выбора хода в симуляции."""
+        """
+        Улучшенная эвристика для выбора хода в симуляции.
+        Принимает действия-кортежи или int-коды; возвращает выбранный элемент списка.
+        """
         if not actions: return None
         if state.street == 1:
             best_action = None; best_score = -float('inf'); num_actions_to_check = min(len(actions), 50); actions_sample = random.sample(actions, num_actions_to_check)
             for action in actions_sample:
-                placements, _ = action; score = 0; temp_board = state.boards[player_idx].copy(); valid = True
+                placements, _ = decode_action(action) if isinstance(action, int) else action; score = 0; temp_board = state.boards[player_idx].copy(); valid = True
                 for card, row, index in placements:
                      if not temp_board.add_card(card, row, index): valid = False; break
                 if not valid: continue
@@ -166,7 +350,7 @@ class MCTSNode:
             if not hand or len(hand) != 3: return random.choice(actions)
             best_action = None; best_score = -float('inf'); current_board = state.boards[player_idx]; num_actions_to_check = min(len(actions), 100); actions_sample = random.sample(actions, num_actions_to_check)
             for action in actions_sample:
-                place1, place2, discarded = action; card1, row1, idx1 = place1; card2, row2, idx2 = place2; score = 0
+                place1, place2, discarded = decode_action(action) if isinstance(action, int) else action; card1, row1, idx1 = place1; card2, row2, idx2 = place2; score = 0
                 # --- ИЗМЕНЕНИЕ: Используем RANK_ORDER_MAP ---
                 score -= RANK_ORDER_MAP.get(discarded.rank, 0) * 0.5
                 # -----------------------------------------
@@ -232,38 +416,51 @@ class MCTSNode:
         return placement, discarded_list if placement else None
 
     def get_q_value(self, perspective_player: int) -> float:
+        # total_reward хранится с точки зрения игрока, сделавшего ход в этот узел;
+        # для другой перспективы знак меняется (точно для двух игроков)
+        if self.solved is not None: return float(self.solved[perspective_player]) # Точное значение
         if self.visits == 0: return 0.0
         player_who_acted = self.parent._get_player_to_move() if self.parent else -1
-        raw_q = self.total_reward / self.visits
+        if self.tt_entry is not None and self.tt_entry.visits > 0 and player_who_acted != -1:
+            # Транспозиция: Q по всем путям в позицию
+            raw_q = self.tt_entry.q_value(player_who_acted)
+        else: raw_q = self.total_reward / self.visits
         if player_who_acted == perspective_player: return raw_q
         elif player_who_acted != -1: return -raw_q
         else: return raw_q
 
     def get_rave_q_value(self, action: Any, perspective_player: int) -> float:
-         rave_visits = self.rave_visits.get(action, 0)
+         visits, reward = self.rave_stats([action])
+         rave_visits = int(visits[0])
          if rave_visits == 0: return 0.0
-         rave_reward = self.rave_total_reward.get(action, 0.0)
-         raw_rave_q = rave_reward / rave_visits
+         raw_rave_q = float(reward[0]) / rave_visits
          player_to_move = self._get_player_to_move()
          if player_to_move == -1: return 0.0
          if player_to_move == perspective_player: return raw_rave_q
          else: return -raw_rave_q
 
-    def uct_select_child(self, exploration_constant: float, rave_k: float) -> Optional['MCTSNode']:
+    def uct_select_child(self, exploration_constant: float, rave_k: float,
+                         candidates: Optional[List[int]] = None) -> Optional['MCTSNode']:
+        """candidates - действия, среди детей которых идет выбор (по умолчанию - все дети)."""
         best_score = -float('inf'); best_child = None
         current_player_perspective = self._get_player_to_move()
         if current_player_perspective == -1: return None
         parent_visits = self.visits if self.visits > 0 else 1
-        children_items = list(self.children.items())
+        if candidates is None: children_items = list(self.children.items())
+        else: children_items = [(action, self.children[action]) for action in candidates]
         if not children_items: return None
-        for action, child in children_items:
-            child_visits = child.visits; rave_visits = self.rave_visits.get(action, 0); score = -float('inf')
-            if child_visits == 0:
-                if rave_visits > 0 and rave_k > 0: rave_q = self.get_rave_q_value(action, current_player_perspective); score = rave_q + exploration_constant * math.sqrt(math.log(parent_visits + 1e-6) / (rave_visits + 1e-6))
+        # RAVE всех детей одним поиском; перспектива - ходящий из узла, знак не меняется
+        all_rave_visits, all_rave_reward = self.rave_stats([action for action, _ in children_items])
+        for i, (action, child) in enumerate(children_items):
+            child_visits = child.visits; rave_visits = int(all_rave_visits[i]); score = -float('inf')
+            if rave_visits > 0: rave_q = float(all_rave_reward[i]) / rave_visits
+            if child.solved is not None: score = child.get_q_value(current_player_perspective) # Решен: исследовать нечего
+            elif child_visits == 0:
+                if rave_visits > 0 and rave_k > 0: score = rave_q + exploration_constant * math.sqrt(math.log(parent_visits + 1e-6) / (rave_visits + 1e-6))
                 else: score = float('inf')
             else:
                 q_child = child.get_q_value(current_player_perspective); exploit_term = q_child; explore_term = exploration_constant * math.sqrt(math.log(parent_visits) / child_visits); ucb1_score = exploit_term + explore_term
-                if rave_visits > 0 and rave_k > 0: rave_q = self.get_rave_q_value(action, current_player_perspective); beta = math.sqrt(rave_k / (3 * parent_visits + rave_k)); score = (1 - beta) * ucb1_score + beta * rave_q
+                if rave_visits > 0 and rave_k > 0: beta = math.sqrt(rave_k / (3 * parent_visits + rave_k)); score = (1 - beta) * ucb1_score + beta * rave_q
                 else: score = ucb1_score
             if score > best_score: best_score = score; best_child = child
             elif score == best_score and score != float('inf') and score != -float('inf'):
@@ -0,0 +1,140 @@
+# mcts_session.py
+"""
+Переиспользование дерева MCTS между решениями одного игрока в раунде.
+
+После хода агента, хода соперника и новой раздачи агент ищет в сохраненном
+дереве потомка, состояние которого в точности совпадает с новым, и
+продолжает поиск от него (перекоренение). Совпадение проверяется по точному
+отпечатку состояния: действия в дереве - int-коды со слотами и мастями,
+поэтому канонический ключ (как в таблице транспозиций) здесь не подходит.
+Спуск идет только по детям, чьи действия (карты по слотам и сброс) и
+исходы раздачи согласуются с новым состоянием, - перекоренение не обходит
+все дерево до начала отсчета времени решения. Узел без посещений - промах:
+в нем нечего переиспользовать. Узлы случая хранят лишь несколько
+сэмплированных раздач, поэтому своя следующая раздача агента в дереве
+обычно есть только при перечислении малых раздач (солвер) или раздаче
+наперед.
+"""
+from collections import deque
+from typing import Dict, List, Optional, Set, Tuple
+
+from action_codec import ACTION_PINEAPPLE, ACTION_STREET1, SLOT_TO_ROW_INDEX, action_type, decode_placements, pineapple_discard
+from card_index import CARD_TO_INDEX
+from game_state import GameState
+from mcts_node import MCTSNode
+from transposition import TranspositionTable
+
+
+def state_fingerprint(state: GameState) -> tuple:
+    """Точный отпечаток состояния: доски по слотам, руки, сбросы и позиция хода."""
+    num_players = len(state.boards)
+    return (tuple(tuple(tuple(board.rows[row]) for row in board.ROW_NAMES) for board in state.boards),
+            tuple(frozenset(state.get_player_hand(i) or ()) for i in range(num_players)),
+            tuple(frozenset(discard) for discard in state.private_discard),
+            state._turn_pos, state.street, state.is_fantasyland_round,
+            tuple(state.fantasyland_status), tuple(state._player_finished_round))
+
+
+def _player_cards(state: GameState, player: int) -> Tuple[Dict[int, int], Set[int], Set[int]]:
+    """(слот -> карта на доске, сброшенные карты, карты на руке) игрока в индексах card_index."""
+    board = state.boards[player]
+    slots = {slot: CARD_TO_INDEX[board.rows[row][index]] for slot, (row, index) in enumerate(SLOT_TO_ROW_INDEX)
+             if board.rows[row][index] is not None}
+    discards = {CARD_TO_INDEX[card] for card in state.private_discard[player]}
+    hand = {CARD_TO_INDEX[card] for card in state.get_player_hand(player) or ()}
+    return slots, discards, hand
+
+
+def decision_key(state: GameState, player: int) -> tuple:
+    """
+    Ключ решения игрока по его картам: улица, доска по слотам и рука.
+    Легальные действия зависят только от них, поэтому статистика действий,
+    набранная до хода соперника, годится и для решения после него.
+    """
+    slots, _, hand = _player_cards(state, player)
+    return state.street, player, frozenset(slots.items()), frozenset(hand)
+
+
+class _TargetCards:
+    """Карты игроков в искомом состоянии (индексы card_index): по слотам досок, в сбросах и все."""
+    __slots__ = ('slots', 'discards', 'cards')
+
+    def __init__(self, state: GameState):
+        self.slots: List[Dict[int, int]] = []
+        self.discards: List[Set[int]] = []
+        self.cards: List[Set[int]] = []
+        for player in range(len(state.boards)):
+            slots, discards, hand = _player_cards(state, player)
+            self.slots.append(slots)
+            self.discards.append(discards)
+            self.cards.append(set(slots.values()) | discards | hand)
+
+    def allows_deal(self, player: int, key: tuple) -> bool:
+        """Исход раздачи (отсортированные индексы карт) есть среди карт игрока."""
+        return self.cards[player].issuperset(key)
+
+    def allows_action(self, player: int, code: int) -> bool:
+        """Карты действия лежат на тех же слотах (и в сбросе); действия Фантазии не проверяются."""
+        kind = action_type(code)
+        if kind != ACTION_STREET1 and kind != ACTION_PINEAPPLE: return True
+        slots = self.slots[player]
+        if any(slots.get(slot) != card for card, slot in decode_placements(code)): return False
+        return kind != ACTION_PINEAPPLE or pineapple_discard(code) in self.discards[player]
+
+
+def find_descendant(root: MCTSNode, state: GameState, max_depth: int) -> Optional[MCTSNode]:
+    """
+    Ищет (в ширину, не глубже max_depth) узел с тем же состоянием, что
+    state. Спускается только к детям, согласованным с картами state.
+    """
+    target = state_fingerprint(state)
+    cards = _TargetCards(state)
+    queue = deque([(root, 0)])
+    while queue:
+        node, depth = queue.popleft()
+        if state_fingerprint(node.game_state) == target: return node
+        if depth >= max_depth: continue
+        player = node._get_player_to_move()
+        if player < 0: continue
+        if node.is_chance_node(): allowed = lambda key: cards.allows_deal(player, key)
+        else: allowed = lambda code: cards.allows_action(player, code)
+        queue.extend((child, depth + 1) for key, child in node.children.items() if allowed(key))
+    return None
+
+
+def count_nodes(root: MCTSNode, limit: int) -> int:
+    """Число узлов поддерева (подсчет прекращается после limit)."""
+    count = 0
+    stack = [root]
+    while stack and count <= limit:
+        node = stack.pop()
+        count += 1
+        stack.extend(node.children.values())
+    return count
+
+
+def reroot_depth(state: GameState) -> int:
+    """Уровней дерева между решениями игрока: его ход, раздача и ход каждого соперника, его раздача."""
+    return 2 * state.num_players
+
+
+class SearchSession:
+    """Сохраненное дерево одного игрока в одной игровой сессии."""
+
+    def __init__(self, root: MCTSNode, transpositions: Optional[TranspositionTable]):
+        self.root = root
+        self.transpositions = transpositions
+
+    def reroot(self, state: GameState) -> Optional[MCTSNode]:
+        """
+        Находит потомка с состоянием state и делает его новым корнем
+        (остальное дерево освобождается). None - совпадения нет или у
+        совпавшего узла нет посещений.
+        """
+        node = find_descendant(self.root, state, reroot_depth(state))
+        if node is None or node.visits == 0: return None
+        node.parent = None
+        node.action = None
+        node.game_state = state
+        self.root = node
+        return node
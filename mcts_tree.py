@@ -0,0 +1,285 @@
+# mcts_tree.py
+"""
+Хранилище дерева MCTS в виде struct-of-arrays (альтернатива MCTSNode).
+
+Каждый узел - строка в наборе массивов NumPy:
+
+    visits, total_reward      статистика узла (награда - с точки зрения игрока,
+                              сделавшего ход в этот узел)
+    rave_visits, rave_reward  RAVE-статистика действия узла у родителя
+                              (с точки зрения игрока, ходящего из родителя)
+    parent, first_child, next_sibling, num_children, num_expanded
+    action                    int-код действия (action_codec), ведущего в узел
+    to_move                   игрок, ходящий из узла (-1 - терминальный)
+    depth, street             глубина узла и улица его состояния
+
+Дети узла занимают один непрерывный блок строк (по убыванию prior, см.
+action_prior), первые num_expanded из них уже раскрыты. Блок выделяется при
+первом раскрытии размером с лимит progressive widening (не меньше
+MIN_CHILD_BLOCK), остальные действия ждут в pending; когда блок заполнен,
+он переносится в новый, вдвое больший (освобожденные строки не
+переиспользуются). RAVE для еще не опробованных действий блока копится в
+тех же массивах, а выбор по UCT - векторная операция над срезом детей.
+Массивы растут блоками по CHUNK_SIZE строк.
+
+Состояния хранятся в списке states. В обычном режиме - у каждого раскрытого
+узла. В режиме без состояний (store_states=False) - только у корня и узлов
+на глубинах checkpoint_depths; состояние остальных узлов восстанавливается
+повтором действий от ближайшей контрольной точки (apply_action_inplace) с
+последующим откатом (undo_action). Узел тогда занимает десятки байт.
+"""
+import contextlib
+import math
+import random
+from typing import Dict, Iterable, Iterator, List, Mapping, Optional, Sequence
+
+import numpy as np
+
+from game_state import GameState
+from action_prior import order_by_prior
+from search_params import StreetParams, widening_limit
+
+NO_NODE = -1
+
+
+class ArrayTree:
+    """Дерево MCTS с RAVE на массивах NumPy."""
+    CHUNK_SIZE = 4096
+    MIN_CHILD_BLOCK = 8 # Строк в первом блоке детей узла (и минимальный прирост блока)
+
+    # Поля: имя -> dtype; начальное значение задается в _grow
+    _FIELDS = {
+        'visits': np.int32, 'total_reward': np.float64,
+        'rave_visits': np.int32, 'rave_reward': np.float64,
+        'parent': np.int32, 'first_child': np.int32, 'next_sibling': np.int32,
+        'num_children': np.int32, 'num_expanded': np.int32,
+        'action': np.int64, 'to_move': np.int8, 'depth': np.int16, 'street': np.int8,
+    }
+    _FILL = {'parent': NO_NODE, 'first_child': NO_NODE, 'next_sibling': NO_NODE,
+             'num_children': -1, 'action': -1, 'to_move': NO_NODE}
+
+    def __init__(self, root_state: GameState, root_actions: Optional[List[int]] = None,
+                 store_states: bool = True, checkpoint_depths: Sequence[int] = ()):
+        self.capacity = 0
+        self.size = 0
+        self.store_states = store_states
+        self.checkpoint_depths = frozenset(checkpoint_depths)
+        self.states: List[Optional[GameState]] = []
+        self.pending: Dict[int, np.ndarray] = {} # Узел -> коды действий (по убыванию prior), еще не попавших в блок детей
+        for name, dtype in self._FIELDS.items():
+            setattr(self, name, np.empty(0, dtype=dtype))
+        self.root = self._allocate(1)
+        # Без состояний корень временно меняется при повторе действий - берем свою копию
+        self.states[self.root] = root_state if store_states else root_state.copy()
+        self.to_move[self.root] = root_state.next_to_act()
+        self.street[self.root] = root_state.street
+        if root_actions is not None and self.to_move[self.root] != NO_NODE:
+            self._add_children(self.root, order_by_prior(root_state, int(self.to_move[self.root]), root_actions, best_last=False),
+                               self.MIN_CHILD_BLOCK)
+
+    # --- Память ---
+
+    def _grow(self, min_capacity: int):
+        """Увеличивает массивы блоками по CHUNK_SIZE строк."""
+        new_capacity = max(min_capacity, self.capacity + self.CHUNK_SIZE)
+        new_capacity = ((new_capacity + self.CHUNK_SIZE - 1) // self.CHUNK_SIZE) * self.CHUNK_SIZE
+        for name, dtype in self._FIELDS.items():
+            old = getattr(self, name)
+            arr = np.full(new_capacity, self._FILL.get(name, 0), dtype=dtype)
+            arr[:self.size] = old[:self.size]
+            setattr(self, name, arr)
+        self.states.extend([None] * (new_capacity - len(self.states)))
+        self.capacity = new_capacity
+
+    def _allocate(self, count: int) -> int:
+        """Выделяет count подряд идущих строк, возвращает индекс первой."""
+        if self.size + count > self.capacity: self._grow(self.size + count)
+        start = self.size
+        self.size += count
+        return start
+
+    def nbytes(self) -> int:
+        """Байты массивов на занятые строки (без объектов GameState)."""
+        per_row = sum(np.dtype(dtype).itemsize for dtype in self._FIELDS.values())
+        return per_row * self.size
+
+    # --- Структура ---
+
+    def _add_children(self, node: int, actions: List[int], block_size: int):
+        """Создает блок детей узла (нераскрытых) для первых block_size действий, остальные - в pending."""
+        count = min(len(actions), block_size)
+        self.num_children[node] = count
+        if len(actions) > count: self.pending[node] = np.asarray(actions[count:], dtype=np.int64)
+        if count == 0: return
+        start = self._allocate(count)
+        self.action[start:start + count] = actions[:count]
+        self._link_block(node, start, count)
+
+    def _link_block(self, node: int, start: int, count: int):
+        """Делает строки start..start+count блоком детей узла."""
+        block = slice(start, start + count)
+        self.parent[block] = node
+        self.depth[block] = self.depth[node] + 1
+        self.next_sibling[block] = np.arange(start + 1, start + count + 1)
+        self.next_sibling[start + count - 1] = NO_NODE
+        self.first_child[node] = start
+        self.num_children[node] = count
+
+    def _grow_children(self, node: int):
+        """Переносит блок детей узла в новый, вдвое больший, и добавляет в него следующие действия из pending."""
+        pending = self.pending.pop(node)
+        old_start, old_count = int(self.first_child[node]), int(self.num_children[node])
+        extra = min(len(pending), max(old_count, self.MIN_CHILD_BLOCK))
+        start = self._allocate(old_count + extra)
+        old, new = slice(old_start, old_start + old_count), slice(start, start + old_count)
+        for name in self._FIELDS:
+            arr = getattr(self, name)
+            arr[new] = arr[old]
+            arr[old] = self._FILL.get(name, 0) # Освобожденные строки - не узлы (отчеты считают по строкам)
+        self.states[new] = self.states[old]
+        self.states[old] = [None] * old_count
+        for offset in range(old_count): # Внуки и отложенные действия ссылаются на новые строки детей
+            moved = start + offset
+            first = int(self.first_child[moved])
+            if first != NO_NODE: self.parent[first:first + int(self.num_children[moved])] = moved
+            if old_start + offset in self.pending: self.pending[moved] = self.pending.pop(old_start + offset)
+        self.action[start + old_count:start + old_count + extra] = pending[:extra]
+        self._link_block(node, start, old_count + extra)
+        if len(pending) > extra: self.pending[node] = pending[extra:]
+
+    def ensure_children(self, node: int, block_size: float = 0):
+        """
+        Генерирует легальные действия узла при первом обращении; блок детей -
+        block_size строк (лимит widening; не меньше MIN_CHILD_BLOCK, inf - как минимум).
+        """
+        if self.num_children[node] != -1: return
+        player = int(self.to_move[node])
+        if player == NO_NODE:
+            self.num_children[node] = 0
+            return
+        with self.node_state(node) as state:
+            actions = order_by_prior(state, player, state.get_legal_action_codes_for_player(player), best_last=False)
+        self._add_children(node, actions, max(self.MIN_CHILD_BLOCK, int(block_size) if math.isfinite(block_size) else 0))
+
+    def children(self, node: int) -> slice:
+        """Срез строк раскрытых детей узла."""
+        start = int(self.first_child[node])
+        if start == NO_NODE: return slice(0, 0)
+        return slice(start, start + int(self.num_expanded[node]))
+
+    def has_untried(self, node: int) -> bool:
+        return self.num_expanded[node] < self.num_children[node] or node in self.pending
+
+    def is_terminal(self, node: int) -> bool:
+        return self.to_move[node] == NO_NODE
+
+    def expand(self, node: int) -> int:
+        """Раскрывает следующее неопробованное действие узла. Возвращает строку ребенка или NO_NODE."""
+        if not self.has_untried(node): return NO_NODE
+        if self.num_expanded[node] == self.num_children[node]: self._grow_children(node)
+        child = int(self.first_child[node] + self.num_expanded[node])
+        self.num_expanded[node] += 1
+        player, action = int(self.to_move[node]), int(self.action[child])
+        if self.store_states:
+            state = self.states[node].apply_action(player, action)
+            self.states[child] = state
+            self.to_move[child] = state.next_to_act()
+            self.street[child] = state.street
+            return child
+        with self.node_state(node) as state:
+            undo = state.apply_action_inplace(player, action)
+            self.to_move[child] = state.next_to_act()
+            self.street[child] = state.street
+            if self.depth[child] in self.checkpoint_depths: self.states[child] = state.copy()
+            if undo is not None: state.undo_action(undo)
+        return child
+
+    @contextlib.contextmanager
+    def node_state(self, node: int) -> Iterator[GameState]:
+        """
+        Состояние узла на время блока with. Без сохраненного состояния действия
+        повторяются на месте от ближайшей контрольной точки и откатываются при
+        выходе; состояние нельзя сохранять за пределами блока (нужна копия).
+        """
+        actions = []
+        base = node
+        while self.states[base] is None:
+            actions.append(base)
+            base = int(self.parent[base])
+        state = self.states[base]
+        undo_stack = []
+        try:
+            for row in reversed(actions):
+                undo = state.apply_action_inplace(int(self.to_move[self.parent[row]]), int(self.action[row]))
+                if undo is not None: undo_stack.append(undo)
+            yield state
+        finally:
+            for undo in reversed(undo_stack): state.undo_action(undo)
+
+    # --- Выбор ---
+
+    def uct_select_child(self, node: int, exploration: float, rave_k: float) -> int:
+        """Векторный UCT+RAVE по раскрытым детям узла (формулы MCTSNode.uct_select_child)."""
+        block = self.children(node)
+        if block.stop == block.start: return NO_NODE
+        parent_visits = max(1, int(self.visits[node]))
+        visits = self.visits[block].astype(np.float64)
+        rave_visits = self.rave_visits[block].astype(np.float64)
+        use_rave = (rave_visits > 0) & (rave_k > 0)
+        rave_q = np.divide(self.rave_reward[block], rave_visits, out=np.zeros_like(rave_visits), where=rave_visits > 0)
+        q = np.divide(self.total_reward[block], visits, out=np.zeros_like(visits), where=visits > 0)
+        with np.errstate(divide='ignore', invalid='ignore'): # Непосещенные дети заменяются ниже
+            ucb = q + exploration * np.sqrt(math.log(parent_visits) / visits)
+            unvisited = rave_q + exploration * np.sqrt(math.log(parent_visits + 1e-6) / (rave_visits + 1e-6))
+        beta = math.sqrt(rave_k / (3 * parent_visits + rave_k)) if rave_k > 0 else 0.0
+        scores = np.where(use_rave, (1 - beta) * ucb + beta * rave_q, ucb)
+        scores = np.where(visits == 0, np.where(use_rave, unvisited, np.inf), scores)
+        best = np.flatnonzero(scores == scores.max())
+        return block.start + int(best[0] if len(best) == 1 else random.choice(best))
+
+    def select(self, street_params: Mapping[int, StreetParams]) -> List[int]:
+        """
+        Спуск от корня до узла, который можно расширить (с учетом progressive
+        widening), или листа. Параметры берутся по улице узла. Возвращает путь.
+        """
+        path = [self.root]
+        node = self.root
+        while not self.is_terminal(node):
+            params = street_params[int(self.street[node])]
+            self.ensure_children(node, widening_limit(int(self.visits[node]) + 1, params.pw_k, params.pw_alpha))
+            expanded = int(self.num_expanded[node])
+            if expanded == 0: return path
+            if self.has_untried(node) and expanded < widening_limit(int(self.visits[node]), params.pw_k, params.pw_alpha): return path
+            node = self.uct_select_child(node, params.exploration, params.rave_k)
+            if node == NO_NODE: return path
+            path.append(node)
+        return path
+
+    # --- Обратное распространение ---
+
+    def backpropagate(self, path: List[int], total_reward: np.ndarray, num_rollouts: int, simulation_actions: Iterable[int]):
+        """
+        total_reward - сумма векторов очков игроков по num_rollouts роллаутам.
+        RAVE обновляется для всех детей блока (включая неопробованные) узлов
+        пути, чьи действия встречались в симуляциях; действия из pending RAVE
+        не копят.
+        """
+        if num_rollouts == 0: return
+        sim_actions = np.fromiter(simulation_actions, dtype=np.int64)
+        for node in reversed(path):
+            self.visits[node] += num_rollouts
+            parent = self.parent[node]
+            if parent != NO_NODE: self.total_reward[node] += total_reward[self.to_move[parent]]
+            player = self.to_move[node]
+            if player == NO_NODE or sim_actions.size == 0 or self.num_children[node] <= 0: continue
+            start = int(self.first_child[node])
+            block = slice(start, start + int(self.num_children[node]))
+            hits = start + np.flatnonzero(np.isin(self.action[block], sim_actions))
+            self.rave_visits[hits] += num_rollouts
+            self.rave_reward[hits] += total_reward[player]
+
+    def best_action(self) -> Optional[int]:
+        """Код самого посещаемого раскрытого действия корня."""
+        block = self.children(self.root)
+        if block.stop == block.start: return None
+        return int(self.action[block.start + int(np.argmax(self.visits[block]))])
@@ -0,0 +1,87 @@
+# ponder.py
+"""
+Обдумывание на ходе соперника (pondering).
+
+Пока человек думает, агент набирает статистику своего следующего решения.
+Обдумывание идет, только если рука агента на это решение уже известна
+(раздана наперед): корень - решение агента с его картами, а ход соперника
+перед ним в каждой итерации сэмплируется заново (скрытые руки соперников
+пересдаются, ход выбирает эвристика роллаутов), и поиск под корнем идет
+open-loop. Легальные действия агента от хода соперника не зависят, поэтому
+статистика действий корня переносится на настоящее решение: choose_action
+останавливает обдумывание и, если ключ решения (улица, доска и рука
+агента) совпал, раскрывает у нового корня обдуманные действия с их
+посещениями и наградами (MCTSNode.seed_children).
+
+Поиск идет в потоке-демоне с роллаутами в этом процессе (пул воркеров
+остается свободным для настоящих поисков) и ограничен долей CPU: после
+каждого отрезка работы поток спит столько, чтобы работа занимала не больше
+cpu_share времени. Отмена (cancel) ждет только текущую итерацию.
+"""
+import threading
+import time
+from typing import Any, Callable, Optional, Tuple
+
+from mcts_node import MCTSNode
+
+SLICE = 0.05 # Секунд работы между паузами
+
+
+class PonderTask:
+    """Фоновый поиск следующего решения одного игрока в одной сессии."""
+
+    def __init__(self, session_key: Tuple[Any, int], decision_key: tuple, root: MCTSNode,
+                 iterate: Callable[[], Optional[int]],
+                 cpu_share: float, max_time: float, max_iterations: int):
+        """
+        decision_key - ключ обдумываемого решения (mcts_session.decision_key).
+        iterate() - одна итерация поиска от root, возвращает число симуляций.
+        max_iterations - предел итераций (рост дерева).
+        """
+        self.session_key = session_key
+        self.decision_key = decision_key
+        self.root = root
+        self.iterations = 0
+        self.simulations = 0
+        self.busy = 0.0 # Секунд работы
+        self.started = time.time()
+        self.stopped: Optional[float] = None
+        self._iterate = iterate
+        self._cpu_share = min(1.0, cpu_share)
+        self._deadline = self.started + max_time
+        self._max_iterations = max_iterations
+        self._cancelled = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"mcts-ponder-{session_key[0]}", daemon=True)
+
+    def start(self) -> 'PonderTask':
+        self._thread.start()
+        return self
+
+    def _run(self):
+        try:
+            while not self._cancelled.is_set() and time.time() < self._deadline and self.iterations < self._max_iterations:
+                slice_start = time.perf_counter()
+                while not self._cancelled.is_set() and time.perf_counter() - slice_start < SLICE:
+                    self.simulations += self._iterate() or 0
+                    self.iterations += 1
+                busy = time.perf_counter() - slice_start
+                self.busy += busy
+                self._cancelled.wait(busy * (1.0 - self._cpu_share) / self._cpu_share)
+        except Exception as e:
+            print(f"Warning: pondering for session {self.session_key[0]} failed: {e}")
+        finally:
+            self.stopped = time.time()
+
+    def is_running(self) -> bool:
+        return self._thread.is_alive()
+
+    def cancel(self) -> 'PonderTask':
+        """Останавливает поиск и ждет завершения текущей итерации."""
+        self._cancelled.set()
+        if self._thread.is_alive() and self._thread is not threading.current_thread(): self._thread.join()
+        return self
+
+    def cpu_share(self) -> float:
+        """Фактическая доля времени, занятая работой."""
+        wall = (self.stopped or time.time()) - self.started
+        return self.busy / wall if wall > 0 else 0.0
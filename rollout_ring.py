@@ -0,0 +1,100 @@
+# rollout_ring.py
+"""
+Кольцо слотов в разделяемой памяти (multiprocessing.shared_memory) для
+роллаутов в пуле воркеров.
+
+Слот хранит состояние листа (state_codec) и результат роллаута из него:
+очки игроков и коды сыгранных действий. Основной процесс пишет состояния
+в свободные слоты и отправляет воркеру только имя кольца и номера слотов;
+воркер читает состояния, пишет результаты в те же слоты и возвращает лишь
+время работы. Освобожденные слоты уходят в конец очереди свободных, поэтому
+занимаются по кругу.
+
+Кольцо создает и удаляет владелец (MCTSAgent, вместе с пулом); воркеры
+подключаются к нему по имени один раз на процесс (attach).
+"""
+from collections import deque
+from multiprocessing import shared_memory
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from game_state import GameState
+from state_codec import STATE_SIZE, decode_state, encode_state
+
+MAX_SIMULATION_ACTIONS = 64 # Действий за роллаут (MCTSNode.rollout делает не больше 50 шагов)
+
+
+def _layout(num_slots: int) -> Tuple[Dict[str, Tuple[int, tuple, type]], int]:
+    """Смещение, форма и тип каждого массива кольца; общий размер в байтах."""
+    fields = {'states': ((num_slots, STATE_SIZE), np.int8),
+              'scores': ((num_slots, GameState.MAX_PLAYERS), np.float64),
+              'num_actions': ((num_slots,), np.int32),
+              'actions': ((num_slots, MAX_SIMULATION_ACTIONS), np.int64)}
+    layout, offset = {}, 0
+    for name, (shape, dtype) in fields.items():
+        offset = (offset + 7) // 8 * 8
+        layout[name] = (offset, shape, dtype)
+        offset += int(np.prod(shape)) * np.dtype(dtype).itemsize
+    return layout, offset
+
+
+class RolloutRing:
+    """Слоты состояний и результатов роллаутов в одном блоке разделяемой памяти."""
+
+    def __init__(self, num_slots: int, name: Optional[str] = None):
+        """name=None - создать новое кольцо (владелец), иначе подключиться к существующему."""
+        self.num_slots = num_slots
+        layout, size = _layout(num_slots)
+        self.owner = name is None
+        self._shm = shared_memory.SharedMemory(name=name, create=self.owner, size=size)
+        self.name = self._shm.name
+        for field, (offset, shape, dtype) in layout.items():
+            setattr(self, field, np.ndarray(shape, dtype=dtype, buffer=self._shm.buf, offset=offset))
+        self._free = deque(range(num_slots)) if self.owner else deque()
+
+    # --- Слоты (только владелец) ---
+
+    def acquire(self, count: int) -> Optional[List[int]]:
+        """count свободных слотов или None, если столько нет."""
+        if count > len(self._free): return None
+        return [self._free.popleft() for _ in range(count)]
+
+    def release(self, slots: List[int]):
+        self._free.extend(slots)
+
+    def free_slots(self) -> int:
+        return len(self._free)
+
+    # --- Данные ---
+
+    def write_state(self, slot: int, state: GameState):
+        encode_state(state, self.states[slot])
+
+    def read_state(self, slot: int) -> GameState:
+        return decode_state(self.states[slot])
+
+    def write_result(self, slot: int, scores: np.ndarray, simulation_actions: np.ndarray):
+        self.scores[slot, :len(scores)] = scores
+        count = min(len(simulation_actions), MAX_SIMULATION_ACTIONS)
+        self.actions[slot, :count] = simulation_actions[:count]
+        self.num_actions[slot] = count
+
+    def read_result(self, slot: int, num_players: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Копии очков и кодов действий роллаута слота."""
+        return self.scores[slot, :num_players].copy(), self.actions[slot, :self.num_actions[slot]].copy()
+
+    def close(self):
+        """Отключается от памяти; владелец еще и удаляет блок."""
+        for field in _layout(0)[0]: setattr(self, field, None) # Представления мешают закрыть буфер
+        self._shm.close()
+        if self.owner: self._shm.unlink()
+
+
+_ATTACHED: Dict[str, RolloutRing] = {} # Подключенные кольца процесса-воркера
+
+def attach(name: str, num_slots: int) -> RolloutRing:
+    """Кольцо по имени (подключение один раз на процесс)."""
+    ring = _ATTACHED.get(name)
+    if ring is None: ring = _ATTACHED[name] = RolloutRing(num_slots, name)
+    return ring
@@ -3,11 +3,15 @@
 Логика подсчета очков, роялти, проверки фолов и условий Фантазии
 для OFC Pineapple согласно предоставленным правилам.
 """
-from typing import List, Tuple, Dict, Optional
+from typing import TYPE_CHECKING, List, Tuple, Dict, Optional, Sequence
+import numpy as np
 # Импортируем Card (теперь алиас PhevaluatorCard) и evaluate_hand, RANK_ORDER_MAP
 from card import Card, evaluate_hand, RANK_ORDER_MAP
 from collections import Counter
 
+if TYPE_CHECKING: # Только для аннотаций: board импортирует scoring
+    from board import PlayerBoard
+
 # --- Константы рангов phevaluator ---
 RANK_CLASS_ROYAL_FLUSH = 1
 RANK_CLASS_STRAIGHT_FLUSH = 10
@@ -132,36 +136,53 @@ def check_fantasyland_stay(top: List[Optional[Card]], middle: List[Optional[Card
 
     return False
 
+def score_matrix(ranks, royalties, fouls) -> np.ndarray:
+    """
+    Попарные очки всех игроков за один векторный проход.
+    ranks (..., P, 3) - ранги top/middle/bottom (меньше - сильнее),
+    royalties (..., P) - суммарные роялти, fouls (..., P) - фолы.
+    Возвращает (..., P, P): [i, j] - очки игрока i против игрока j
+    (правила calculate_headsup_score; матрица антисимметрична).
+    """
+    ranks = np.asarray(ranks)
+    fouls = np.asarray(fouls, dtype=np.int32)
+    royalties = np.asarray(royalties) * (1 - fouls) # Роялти фола не считаются
+    foul_i = fouls[..., :, None]
+    foul_j = fouls[..., None, :]
+    roy_i = royalties[..., :, None]
+    roy_j = royalties[..., None, :]
+
+    # Линии: +1 за каждый ряд, где ранг i меньше ранга j; скуп +-3
+    wins = np.sign(ranks[..., None, :, :] - ranks[..., :, None, :]).sum(axis=-1)
+    base = wins + 3 * (wins == 3) - 3 * (wins == -3) + roy_i - roy_j
+    # Фол: -(6 + роялти соперника); оба фола - 0
+    return (1 - foul_i) * (1 - foul_j) * base + 6 * (foul_j - foul_i) + foul_j * roy_i - foul_i * roy_j
+
+def board_score_vectors(boards: Sequence['PlayerBoard']) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Векторы для score_matrix по доскам игроков: ранги рядов (P, 3), роялти (P,), фолы (P,).
+    Полная доска проверяется на фол; неполная считается фолом, только если
+    фол выставлен явно (игрок не смог сходить).
+    """
+    num = len(boards)
+    ranks = np.empty((num, 3), dtype=np.int32)
+    royalties = np.zeros(num, dtype=np.int32)
+    fouls = np.zeros(num, dtype=bool)
+    for i, board in enumerate(boards):
+        foul = board.check_and_set_foul() if board.is_complete() else board.is_foul
+        fouls[i] = foul
+        ranks[i] = board.get_rank_vector()
+        if not foul: royalties[i] = board.get_total_royalty()
+    return ranks, royalties, fouls
+
+def calculate_score_matrix(boards: Sequence['PlayerBoard']) -> np.ndarray:
+    """Матрица попарных очков (P, P) для досок всех игроков."""
+    return score_matrix(*board_score_vectors(boards))
+
+def calculate_scores(boards: Sequence['PlayerBoard']) -> np.ndarray:
+    """Итоговые очки каждого игрока против всех остальных (P,)."""
+    return calculate_score_matrix(boards).sum(axis=1)
+
 def calculate_headsup_score(board1: 'PlayerBoard', board2: 'PlayerBoard') -> int:
     """Считает очки между двумя игроками (с точки зрения Игрока 1)."""
-    # board1 и board2 теперь PlayerBoard, который использует phevaluator.Card
-    foul1 = board1.is_complete() and board1.check_and_set_foul()
-    foul2 = board2.is_complete() and board2.check_and_set_foul()
-    r1 = board1.get_total_royalty()
-    r2 = board2.get_total_royalty()
-
-    if foul1 and foul2: return 0
-    if foul1: return -(6 + r2)
-    if foul2: return 6 + r1
-
-    score1 = 0
-    rank_t1 = board1._get_rank('top')
-    rank_m1 = board1._get_rank('middle')
-    rank_b1 = board1._get_rank('bottom')
-    rank_t2 = board2._get_rank('top')
-    rank_m2 = board2._get_rank('middle')
-    rank_b2 = board2._get_rank('bottom')
-
-    wins1 = 0
-    if rank_t1 < rank_t2: wins1 += 1
-    elif rank_t2 < rank_t1: wins1 -= 1
-    if rank_m1 < rank_m2: wins1 += 1
-    elif rank_m2 < rank_m1: wins1 -= 1
-    if rank_b1 < rank_b2: wins1 += 1
-    elif rank_b2 < rank_b1: wins1 -= 1
-
-    score1 += wins1
-    if wins1 == 3: score1 += 3
-    elif wins1 == -3: score1 -= 3
-    score1 += (r1 - r2)
-    return score1
+    return int(calculate_score_matrix((board1, board2))[0, 1])
@@ -0,0 +1,85 @@
+# search_params.py
+"""
+Параметры поиска по улицам и progressive widening.
+
+Число раскрытых детей узла ограничено величиной ceil(pw_k * N^pw_alpha),
+где N - посещения узла: новые дети (в порядке prior, см. action_prior)
+добавляются по мере роста N, а до этого поиск уточняет уже раскрытые.
+pw_k <= 0 отключает widening (раскрываются все действия, как раньше).
+
+SearchBudget - бюджет одного поиска (итерации, симуляции, дедлайн).
+"""
+import json
+import math
+import time
+from typing import Dict, NamedTuple, Optional
+
+
+class StreetParams(NamedTuple):
+    exploration: float
+    rave_k: float
+    pw_k: float = 0.0
+    pw_alpha: float = 0.5
+    c_puct: float = 5.0 # Только для selection='puct'
+
+
+class SearchBudget(NamedTuple):
+    """
+    Бюджет одного поиска: поиск останавливается, как только исчерпан любой из
+    заданных лимитов (None - без лимита). Итерация - спуск к листу, симуляция -
+    роллаут (или терминальный лист), учтенный в дереве. deadline - момент по
+    time.time(); бюджет без него ограничен только работой (для воспроизводимых
+    прогонов), а дедлайн вместе с лимитами дает предел задержки.
+    """
+    max_iterations: Optional[int] = None
+    max_simulations: Optional[int] = None
+    deadline: Optional[float] = None
+
+    def is_limited(self) -> bool:
+        return self.max_iterations is not None or self.max_simulations is not None or self.deadline is not None
+
+    def exhausted(self, iterations: int, simulations: int) -> bool:
+        return ((self.max_iterations is not None and iterations >= self.max_iterations)
+                or (self.max_simulations is not None and simulations >= self.max_simulations)
+                or (self.deadline is not None and time.time() >= self.deadline))
+
+    def remaining_time(self, default: float) -> float:
+        """Секунд до дедлайна (не меньше нуля) или default без дедлайна."""
+        return max(0.0, self.deadline - time.time()) if self.deadline is not None else default
+
+    def split(self, parts: int) -> 'SearchBudget':
+        """Доля одного из parts независимых поисков (лимиты работы делятся с округлением вверх)."""
+        def share(limit: Optional[int]) -> Optional[int]:
+            return None if limit is None else -(-limit // parts)
+        return self._replace(max_iterations=share(self.max_iterations), max_simulations=share(self.max_simulations))
+
+
+def widening_limit(visits: int, pw_k: float, pw_alpha: float) -> float:
+    """Сколько детей узла может быть раскрыто при visits посещениях (inf - без ограничения)."""
+    if pw_k <= 0: return math.inf
+    return max(1, math.ceil(pw_k * max(1, visits) ** pw_alpha))
+
+
+def resolve_street_params(exploration: float, rave_k: float,
+                          defaults: Dict[int, Dict[str, float]],
+                          overrides: Optional[Dict[int, Dict[str, float]]] = None) -> Dict[int, StreetParams]:
+    """
+    Параметры для улиц 0-5 (0 - Фантазия): общие exploration/rave_k,
+    поверх них значения по умолчанию для улицы, поверх них overrides.
+    """
+    result = {}
+    for street in range(6):
+        values = {'exploration': exploration, 'rave_k': rave_k}
+        values.update(defaults.get(street, {}))
+        if overrides: values.update(overrides.get(street, {}))
+        unknown = set(values) - set(StreetParams._fields)
+        if unknown: raise ValueError(f"Unknown search parameters for street {street}: {sorted(unknown)}")
+        result[street] = StreetParams(**values)
+    return result
+
+
+def parse_street_params(text: Optional[str]) -> Optional[Dict[int, Dict[str, float]]]:
+    """Разбирает JSON вида '{"1": {"pw_k": 4, "exploration": 2.0}}' (пустая строка - None)."""
+    if not text: return None
+    return {int(street): {name: float(value) for name, value in values.items()}
+            for street, values in json.loads(text).items()}
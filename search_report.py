@@ -0,0 +1,94 @@
+# search_report.py
+"""
+Отчет о поиске MCTSAgent (choose_action(..., return_report=True)).
+
+SearchReport - неизменяемая сводка одного решения: статистика детей корня
+(посещения, Q и RAVE-Q с точки зрения ходящего из корня), объем работы и
+время, размер и глубина дерева, посещения, унаследованные от дерева
+сессии, загрузка воркеров и время основного процесса по фазам итерации. to_dict дает JSON-совместимый словарь, а
+log_report пишет его строкой JSON (для планирования мощностей; app.py и
+main.py включают это через MCTS_SEARCH_LOG).
+
+Фазы (PhaseTimes, секунды основного процесса):
+
+    select    спуск по дереву (в open-loop - вместе с раскрытием)
+    expand    раскрытие нового узла
+    rollout   роллауты или ожидание их результатов от пула
+    backprop  обратное распространение
+"""
+import json
+import sys
+from typing import Any, Dict, List, NamedTuple, Optional, TextIO
+
+from action_codec import format_action
+
+PHASES = ('select', 'expand', 'rollout', 'backprop')
+
+
+class PhaseTimes:
+    """Накопленное время фаз итераций одного поиска."""
+    __slots__ = PHASES
+
+    def __init__(self):
+        self.select = 0.0
+        self.expand = 0.0
+        self.rollout = 0.0
+        self.backprop = 0.0
+
+    def as_dict(self) -> Dict[str, float]:
+        return {phase: getattr(self, phase) for phase in PHASES}
+
+
+class ChildReport(NamedTuple):
+    """Статистика одного действия корня."""
+    action: int # int-код действия (action_codec)
+    visits: int
+    q: Optional[float] # Средняя награда (None - не посещалось)
+    rave_visits: int
+    rave_q: Optional[float] # None - RAVE-статистики нет
+    solved: Optional[float] = None # Точное значение (MCTS-Solver), None - не решено
+
+
+class SearchReport(NamedTuple):
+    """Сводка одного решения choose_action."""
+    player: int
+    street: int
+    mode: str # parallel/tree_store или solver/forced для решений без поиска
+    iterations: int
+    simulations: int
+    elapsed: float # Секунд на решение целиком
+    tree_nodes: Optional[int] # None - дерево не в этом процессе (root-параллелизм)
+    max_depth: Optional[int]
+    worker_utilization: Optional[float] # None - без конвейера роллаутов
+    phase_times: Optional[Dict[str, float]] # None - фазы считали воркеры
+    stop_reason: Optional[str] # Причина остановки по часам TimeManager или solved (корень решен)
+    children: List[ChildReport] # По убыванию посещений
+    reused_visits: Optional[int] = None # Посещения корня из дерева сессии (None - дерево не переиспользовано)
+
+    @property
+    def sims_per_sec(self) -> float:
+        return self.simulations / self.elapsed if self.elapsed > 0 else 0.0
+
+    def to_dict(self, max_children: Optional[int] = 10) -> Dict[str, Any]:
+        """JSON-совместимый словарь; дети - не больше max_children самых посещаемых (None - все)."""
+        children = self.children if max_children is None else self.children[:max_children]
+        result = self._asdict()
+        result['sims_per_sec'] = self.sims_per_sec
+        result['num_children'] = len(self.children)
+        result['children'] = [dict(child._asdict(), action=format_action(child.action)) for child in children]
+        return result
+
+
+def report_stream(target: Optional[str]) -> Optional[TextIO]:
+    """Поток для log_report по значению MCTS_SEARCH_LOG: пусто - без логов, '-' - stdout, иначе файл (дописывается)."""
+    if not target: return None
+    if target == '-': return sys.stdout
+    return open(target, 'a', buffering=1, encoding='utf-8')
+
+
+def log_report(report: SearchReport, stream: Optional[TextIO] = None, **fields: Any):
+    """Пишет отчет одной строкой JSON (в stdout по умолчанию); fields - дополнительные поля (сессия и т.п.)."""
+    record = dict(fields, **report.to_dict())
+    stream = stream or sys.stdout
+    stream.write(json.dumps(record, default=str) + "\n")
+    stream.flush()
@@ -0,0 +1,333 @@
+# search_service.py
+"""
+Сервис поиска MCTS: один процесс на хост с одним агентом и одним пулом
+воркеров, к которому подключаются все процессы gunicorn (SearchClient).
+
+Без сервиса у каждого процесса gunicorn свой агент со своим пулом, и
+одновременные партии делят ядра без согласования: N поисков запускают
+N * num_workers процессов. В сервисе поиски всех сессий идут в одном
+процессе, каждый в своем потоке на копии агента (MCTSAgent.search_view),
+но основной цикл в каждый момент выполняет только один из них: поиск
+держит ход не дольше time_slice и между итерациями (yield_hook) уступает
+его следующему по политике планировщика (SearchScheduler). Роллауты всех
+поисков уходят в общий пул. Дедлайны решений не меняются, так что при N
+одновременных партиях задержка остается прежней, а каждый поиск получает
+около 1/N итераций.
+
+Протокол - multiprocessing.connection (Unix-сокет или host:port, с
+authkey): запрос - кортеж (операция, аргументы...), ответ - ('ok',
+результат) или ('error', текст). Состояния передаются словарями to_dict.
+Запросы - pickle, то есть подключившийся с ключом выполняет в сервисе
+любой код: ключа по умолчанию нет (MCTS_SERVICE_AUTHKEY обязателен), а
+TCP допускается только на loopback-адресах.
+
+Запуск отдельно: MCTS_SERVICE_AUTHKEY=... python search_service.py [адрес];
+под gunicorn сервис запускает gunicorn.conf.py, если задан MCTS_SERVICE
+(адрес), и при отсутствии ключа генерирует случайный для сервиса и
+процессов приложения. Параметры агента - те же переменные окружения, что у
+app.py (agent_config.agent_from_env).
+"""
+import contextlib
+import ipaddress
+import os
+import signal
+import stat
+import sys
+import threading
+import time
+import traceback
+from multiprocessing.connection import Client, Connection, Listener
+from typing import Any, Dict, List, Mapping, Optional, Tuple, Union
+
+from game_state import GameState
+from mcts_agent import MCTSAgent
+from agent_config import agent_from_env
+from search_params import SearchBudget
+
+Address = Union[str, Tuple[str, int]]
+
+DEFAULT_ADDRESS = '/tmp/ofc-mcts.sock'
+DEFAULT_POLICY = 'fair'
+DEFAULT_TIME_SLICE_MS = 20
+CONNECT_TIMEOUT = 30.0 # Секунд ожидания сервиса при подключении (он может еще прогревать пул)
+
+
+def parse_address(text: str) -> Address:
+    """'host:port' - TCP (только loopback: localhost, 127.x.x.x, ::1), иначе путь Unix-сокета."""
+    host, _, port = text.rpartition(':')
+    if not (host and port.isdigit()): return text
+    host = host.strip('[]')
+    try: loopback = host == 'localhost' or ipaddress.ip_address(host).is_loopback
+    except ValueError: loopback = False
+    if not loopback: raise ValueError(f"Search service TCP address must be a loopback address, got '{text}'")
+    return host, int(port)
+
+
+def service_authkey(environ: Mapping[str, str] = os.environ) -> bytes:
+    """Ключ сервиса из MCTS_SERVICE_AUTHKEY; без него сервис не запускается и клиент не подключается."""
+    key = environ.get('MCTS_SERVICE_AUTHKEY', '')
+    if not key: raise ValueError("MCTS_SERVICE_AUTHKEY is not set: the search service requires an authentication key")
+    return key.encode()
+
+
+class SearchJob:
+    """Один поиск (или служебная операция) в очереди планировщика."""
+    __slots__ = ('session_id', 'deadline', 'arrival', 'service', 'waited', 'slices', 'slice_start')
+
+    def __init__(self, session_id: Any, deadline: float):
+        self.session_id = session_id
+        self.deadline = deadline # time.time(), для политики deadline
+        self.arrival = time.perf_counter()
+        self.service = 0.0 # Виртуальное время: сколько хода получил поиск (политика fair)
+        self.waited = 0.0 # Секунд в ожидании хода
+        self.slices = 0
+        self.slice_start = 0.0
+
+
+class SearchScheduler:
+    """
+    Очередность поисков: ход (право выполнять итерации) в каждый момент у
+    одного поиска, он держит его не дольше time_slice и в checkpoint
+    передает следующему по политике:
+
+        fair      поиск, получивший меньше всего времени хода; новый поиск
+                  начинает с наименьшего времени среди идущих, а не с нуля,
+                  иначе он вытеснял бы остальных, пока не догонит;
+        deadline  поиск с самым ранним дедлайном (EDF), при равенстве - fair.
+                  При перегрузке ранние решения досчитываются целиком, а
+                  поздним остается время до их дедлайна (или ничего) - fair
+                  деградирует равномернее.
+    """
+    POLICIES = ('fair', 'deadline')
+
+    def __init__(self, policy: str = DEFAULT_POLICY, time_slice: float = DEFAULT_TIME_SLICE_MS / 1000.0):
+        if policy not in self.POLICIES:
+            raise ValueError(f"Unknown scheduling policy '{policy}', expected one of {self.POLICIES}")
+        self.policy = policy
+        self.time_slice = time_slice
+        self.completed = 0
+        self.total_waited = 0.0
+        self.total_elapsed = 0.0
+        self._jobs: List[SearchJob] = []
+        self._holder: Optional[SearchJob] = None
+        self._cond = threading.Condition()
+
+    @contextlib.contextmanager
+    def running(self, job: SearchJob):
+        """Блок выполняется, держа ход: job ставится в очередь и ждет своей очереди."""
+        with self._cond:
+            job.service = min((other.service for other in self._jobs), default=0.0)
+            self._jobs.append(job)
+        self._acquire(job)
+        try:
+            yield job
+        finally:
+            with self._cond:
+                job.service += time.perf_counter() - job.slice_start
+                self._jobs.remove(job)
+                self._holder = None
+                self.completed += 1
+                self.total_waited += job.waited
+                self.total_elapsed += time.perf_counter() - job.arrival
+                self._cond.notify_all()
+
+    def checkpoint(self, job: SearchJob):
+        """Вызывается держащим ход между итерациями: по истечении time_slice ход переходит к следующему."""
+        now = time.perf_counter()
+        if now - job.slice_start < self.time_slice: return
+        with self._cond:
+            job.service += now - job.slice_start
+            if self._next() is job: # Очередь за ним же - продолжаем без переключения
+                job.slice_start = now
+                return
+            self._holder = None
+            self._cond.notify_all()
+        self._acquire(job)
+
+    def _acquire(self, job: SearchJob):
+        wait_start = time.perf_counter()
+        with self._cond:
+            self._cond.wait_for(lambda: self._holder is None and self._next() is job)
+            self._holder = job
+        job.slice_start = time.perf_counter()
+        job.waited += job.slice_start - wait_start
+        job.slices += 1
+
+    def _next(self) -> SearchJob:
+        if self.policy == 'deadline': return min(self._jobs, key=lambda job: (job.deadline, job.service, job.arrival))
+        return min(self._jobs, key=lambda job: (job.service, job.arrival))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {'policy': self.policy, 'active': len(self._jobs), 'completed': self.completed,
+                    'wait_share': self.total_waited / self.total_elapsed if self.total_elapsed > 0 else 0.0}
+
+
+class SearchService:
+    """Агент и планировщик сервиса; serve_forever принимает подключения клиентов."""
+
+    def __init__(self, agent: MCTSAgent, address: Address = DEFAULT_ADDRESS, authkey: Optional[bytes] = None,
+                 policy: str = DEFAULT_POLICY, time_slice_ms: int = DEFAULT_TIME_SLICE_MS):
+        if agent.parallel == 'root':
+            # Поиски root-режима целиком идут в воркерах - чередовать в основном процессе нечего
+            agent.parallel = 'tree' if agent.tree_store == 'nodes' else 'leaf'
+            print(f"Warning: parallel='root' cannot be interleaved by the search service, using '{agent.parallel}'.")
+        self.agent = agent
+        self.address = address
+        self.authkey = authkey
+        self.scheduler = SearchScheduler(policy, time_slice_ms / 1000.0)
+
+    def choose_action(self, game_state: GameState, session_id: Any = None, budget: Optional[SearchBudget] = None,
+                      return_report: bool = False) -> Any:
+        """MCTSAgent.choose_action в очереди планировщика (seed не поддерживается: генераторы общие)."""
+        arrival = time.time()
+        job = SearchJob(session_id, self._deadline(game_state, budget, arrival))
+        view = self.agent.search_view()
+        view.decision_start = arrival # Ожидание в очереди входит во время решения
+        view.yield_hook = lambda: self.scheduler.checkpoint(job)
+        try:
+            with self.scheduler.running(job):
+                return view.choose_action(game_state, session_id=session_id, budget=budget, return_report=return_report)
+        finally:
+            view.close()
+
+    def release_session(self, session_id: Any):
+        # Деревья сессий общие для всех поисков - меняем их, только держа ход
+        with self.scheduler.running(SearchJob(session_id, time.time())):
+            self.agent.release_session(session_id)
+
+    def _deadline(self, game_state: GameState, budget: Optional[SearchBudget], start: float) -> float:
+        """Дедлайн поиска для политики deadline (поиск без дедлайна - в конце очереди)."""
+        if budget is not None and budget.is_limited(): return budget.deadline if budget.deadline is not None else float('inf')
+        manager = self.agent.time_manager
+        if manager is not None: return start + manager.street_time(game_state.street) * (1.0 + manager.extension)
+        return start + self.agent.time_limit
+
+    def handle(self, operation: str, *args: Any) -> Any:
+        """Выполняет один запрос клиента."""
+        if operation == 'choose_action':
+            state_dict, session_id, budget, return_report = args
+            return self.choose_action(GameState.from_dict(state_dict), session_id, budget, return_report)
+        if operation == 'release_session': return self.release_session(*args)
+        if operation == 'stats': return self.scheduler.stats()
+        raise ValueError(f"Unknown search service operation '{operation}'")
+
+    def _serve_connection(self, conn: Connection):
+        with conn:
+            while True:
+                try: request = conn.recv()
+                except (EOFError, OSError): return # Клиент отключился
+                try:
+                    reply = ('ok', self.handle(*request))
+                except Exception as e:
+                    print(f"Error in search service request {request[0] if request else None}: {e}")
+                    traceback.print_exc()
+                    reply = ('error', f"{type(e).__name__}: {e}")
+                try: conn.send(reply)
+                except (EOFError, OSError): return
+
+    def serve_forever(self):
+        """Прогревает пул и принимает подключения (по потоку на клиента) до остановки процесса."""
+        if not self.authkey: raise ValueError("Search service requires an authkey (MCTS_SERVICE_AUTHKEY)")
+        self.agent.warm_up()
+        if isinstance(self.address, str) and os.path.exists(self.address) and stat.S_ISSOCK(os.lstat(self.address).st_mode):
+            os.unlink(self.address) # Сокет прошлого запуска; другие файлы не трогаем
+        with Listener(self.address, authkey=self.authkey) as listener:
+            print(f"MCTS search service listening on {listener.address} (policy={self.scheduler.policy}, "
+                  f"slice={1000 * self.scheduler.time_slice:.0f}ms, workers={self.agent.num_workers}).")
+            sys.stdout.flush()
+            while True:
+                try:
+                    conn = listener.accept()
+                except Exception as e: # Неверный authkey, оборванное подключение
+                    print(f"Warning: search service rejected a connection: {e}")
+                    continue
+                threading.Thread(target=self._serve_connection, args=(conn,), name="mcts-service-client", daemon=True).start()
+
+    def close(self):
+        self.agent.close()
+
+
+class SearchClient:
+    """
+    Клиент сервиса с интерфейсом агента, которым пользуется app.py.
+    Соединение одно на клиента, запросы идут по очереди; при обрыве
+    (перезапуск сервиса) запрос повторяется один раз с новым соединением.
+    Обдумывания через сервис нет (ponder_share = 0).
+    """
+    ponder_share = 0.0
+
+    def __init__(self, address: Address, authkey: bytes, connect_timeout: float = CONNECT_TIMEOUT):
+        self.address = address
+        self.authkey = authkey
+        self.connect_timeout = connect_timeout
+        self._conn: Optional[Connection] = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> Connection:
+        deadline = time.time() + self.connect_timeout
+        while True:
+            try:
+                return Client(self.address, authkey=self.authkey)
+            except (FileNotFoundError, ConnectionRefusedError):
+                if time.time() >= deadline: raise
+                time.sleep(0.2) # Сервис еще запускается
+
+    def _call(self, operation: str, *args: Any) -> Any:
+        with self._lock:
+            for attempt in range(2):
+                if self._conn is None: self._conn = self._connect()
+                try:
+                    self._conn.send((operation,) + args)
+                    status, result = self._conn.recv()
+                    break
+                except (EOFError, OSError):
+                    self._conn.close()
+                    self._conn = None
+                    if attempt == 1: raise
+        if status != 'ok': raise RuntimeError(f"Search service error: {result}")
+        return result
+
+    def choose_action(self, game_state: GameState, session_id: Optional[Any] = None,
+                      budget: Optional[SearchBudget] = None, return_report: bool = False) -> Any:
+        return self._call('choose_action', game_state.to_dict(), session_id, budget, return_report)
+
+    def release_session(self, session_id: Any):
+        self._call('release_session', session_id)
+
+    def start_pondering(self, session_id: Any, game_state: GameState, player: int) -> bool:
+        return False
+
+    def stop_pondering(self, session_id: Optional[Any] = None):
+        pass
+
+    def stats(self) -> Dict[str, Any]:
+        return self._call('stats')
+
+    def warm_up(self):
+        """Подключается заранее (ждет запуска сервиса)."""
+        with self._lock:
+            if self._conn is None: self._conn = self._connect()
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None: self._conn.close()
+            self._conn = None
+
+
+def run_service(address: Optional[Address] = None):
+    """Сервис с агентом из переменных окружения (MCTS_SERVICE_POLICY, MCTS_SERVICE_SLICE_MS); SIGTERM - штатная остановка."""
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    service = SearchService(agent_from_env(),
+                            address if address is not None else parse_address(os.environ.get('MCTS_SERVICE') or DEFAULT_ADDRESS),
+                            service_authkey(),
+                            os.environ.get('MCTS_SERVICE_POLICY', DEFAULT_POLICY),
+                            int(os.environ.get('MCTS_SERVICE_SLICE_MS', DEFAULT_TIME_SLICE_MS)))
+    try:
+        service.serve_forever()
+    finally:
+        service.close()
+
+
+if __name__ == '__main__':
+    run_service(parse_address(sys.argv[1]) if len(sys.argv) > 1 else None)
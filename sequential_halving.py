@@ -0,0 +1,123 @@
+# sequential_halving.py
+"""
+Выбор действия корня: Gumbel-top-k и последовательное деление (sequential halving).
+
+При малом бюджете UCB1 с бесконечной оценкой непосещенных детей тратит
+почти все симуляции на первое посещение сотен действий корня. Здесь корень
+сначала берет k кандидатов без возвращения по эвристическим prior
+(Gumbel-top-k: k лучших по g + logit, g ~ Gumbel(0, 1)), а бюджет делится
+на ceil(log2 k) фаз. В фазе оставшиеся кандидаты получают спуски по
+кругу (поровну), после фазы остается лучшая половина по
+g + logit + sigma(q), где sigma(q) = (C_VISIT + max посещений) * C_SCALE *
+q, нормированный к [0, 1] по кандидатам. Ниже корня поиск обычный (UCT +
+RAVE или PUCT). Итоговое действие - лучший из оставшихся кандидатов по той
+же оценке (Danihelka et al., "Policy improvement by planning with Gumbel").
+
+Бюджет фазы - доля еще не потраченного бюджета поиска (лимиты итераций и
+симуляций, время до дедлайна), поделенная на число оставшихся фаз, но не
+меньше одного спуска на кандидата; фаза заканчивается по первому
+исчерпанному лимиту. Когда остается один кандидат, выбор сделан и поиск
+можно заканчивать.
+"""
+import math
+import time
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+from mcts_node import MCTSNode
+from search_params import SearchBudget
+
+C_VISIT = 50.0
+C_SCALE = 1.0
+
+
+class SequentialHalving:
+    """План выбора действия корня на один поиск."""
+    __slots__ = ('candidates', '_base', '_budget', '_deadline', '_phases_left', '_turn',
+                 '_phase_iterations', '_phase_simulations', '_phase_deadline',
+                 '_start_iterations', '_start_simulations')
+
+    def __init__(self, actions: Sequence[int], logits: np.ndarray, k: int, budget: SearchBudget,
+                 deadline: Optional[float] = None):
+        """
+        actions и logits - действия корня и их эвристические оценки (уже
+        деленные на температуру). deadline - время окончания фаз, если оно
+        раньше дедлайна бюджета (мягкий дедлайн часов TimeManager).
+        """
+        base = np.asarray(logits, dtype=np.float64) + np.random.gumbel(size=len(actions))
+        top = np.argsort(-base, kind='stable')[:max(1, min(k, len(actions)))]
+        self.candidates: List[int] = [int(actions[i]) for i in top]
+        self._base = {action: float(base[i]) for action, i in zip(self.candidates, top)}
+        self._budget = budget
+        self._deadline = deadline if deadline is not None else budget.deadline
+        self._phases_left = max(1, math.ceil(math.log2(len(self.candidates)))) if len(self.candidates) > 1 else 0
+        self._turn = 0
+        self._start_phase(0, 0)
+
+    @property
+    def decided(self) -> bool:
+        return len(self.candidates) == 1
+
+    def _start_phase(self, iterations: int, simulations: int):
+        """Делит оставшийся бюджет поровну между оставшимися фазами."""
+        phases = max(1, self._phases_left)
+        budget = self._budget
+        self._start_iterations, self._start_simulations = iterations, simulations
+        # Не меньше спуска на кандидата, иначе половина отсеялась бы без посещений
+        self._phase_iterations = max(len(self.candidates), math.ceil((budget.max_iterations - iterations) / phases)) \
+            if budget.max_iterations is not None else None
+        self._phase_simulations = max(len(self.candidates), math.ceil((budget.max_simulations - simulations) / phases)) \
+            if budget.max_simulations is not None else None
+        now = time.time()
+        self._phase_deadline = now + (self._deadline - now) / phases if self._deadline is not None else None
+        self._turn = 0
+
+    def _phase_over(self, iterations: int, simulations: int) -> bool:
+        if self._phase_iterations is not None and iterations - self._start_iterations >= self._phase_iterations: return True
+        if self._phase_simulations is not None and simulations - self._start_simulations >= self._phase_simulations: return True
+        # По времени фаза кончается не раньше полного круга: отсев без посещений шел бы по одним prior
+        return self._phase_deadline is not None and self._turn >= len(self.candidates) and time.time() >= self._phase_deadline
+
+    def next_action(self, iterations: int, simulations: int, root: MCTSNode) -> Optional[int]:
+        """
+        Действие корня для следующего спуска (iterations и simulations -
+        работа поиска на этот момент). По окончании фазы сначала отсеивает
+        худшую половину. None - остался один кандидат, выбор сделан.
+        """
+        if self._phase_over(iterations, simulations) and not self.decided:
+            self._halve(root)
+            self._phases_left -= 1
+            self._start_phase(iterations, simulations)
+        if self.decided: return None
+        action = self.candidates[self._turn % len(self.candidates)]
+        self._turn += 1
+        return action
+
+    def _scores(self, root: MCTSNode) -> List[float]:
+        """g + logit + sigma(q) кандидатов; q - с точки зрения ходящего из корня."""
+        player = root._get_player_to_move()
+        children = [root.children.get(action) for action in self.candidates]
+        visited = [child for child in children if child is not None and (child.visits > 0 or child.solved is not None)]
+        if not visited: return [self._base[action] for action in self.candidates]
+        q_values = {id(child): child.get_q_value(player) for child in visited}
+        low, high = min(q_values.values()), max(q_values.values())
+        span = high - low
+        normalized = {key: (q - low) / span if span > 0 else 0.5 for key, q in q_values.items()}
+        mean_normalized = sum(normalized.values()) / len(normalized) # Для непосещенных кандидатов
+        scale = (C_VISIT + max(child.visits for child in visited)) * C_SCALE
+        return [self._base[action] + scale * normalized.get(id(child), mean_normalized)
+                for action, child in zip(self.candidates, children)]
+
+    def _halve(self, root: MCTSNode):
+        """Оставляет лучшую половину кандидатов (с округлением вверх)."""
+        scores = self._scores(root)
+        order = sorted(range(len(self.candidates)), key=lambda i: -scores[i])
+        keep = sorted(order[:math.ceil(len(self.candidates) / 2)]) # Исходный порядок - по g + logit
+        self.candidates = [self.candidates[i] for i in keep]
+
+    def best_action(self, root: MCTSNode) -> int:
+        """Итоговое действие: лучший из оставшихся кандидатов (поиск мог закончиться посреди фазы)."""
+        if self.decided: return self.candidates[0]
+        scores = self._scores(root)
+        return self.candidates[max(range(len(self.candidates)), key=lambda i: scores[i])]
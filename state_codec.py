@@ -0,0 +1,113 @@
+# state_codec.py
+"""
+Компактная двоичная запись GameState в строку int8 фиксированной длины
+(для передачи состояний воркерам через разделяемую память, см. rollout_ring).
+
+Раскладка (индексы карт - card_index, EMPTY = -1):
+
+    заголовок  [num_players, dealer_idx, current_player_idx, street,
+                is_fantasyland_round, turn_pos]
+    игрок      13 слотов доски, _cards_placed, is_foul, _is_complete,
+               fantasyland_status, next_fantasyland_status,
+               fantasyland_cards_to_deal, _player_acted_this_street,
+               _player_finished_round, затем три списка карт (рука, рука
+               Фантазии, сброс): длина (EMPTY - None) и MAX_LIST_CARDS карт
+
+Колода не пишется: как в GameState.from_dict, это все карты, которых нет на
+досках, в руках и в сбросе. В отличие от to_dict, пустая рука и None
+различаются.
+"""
+from typing import List, Optional
+
+import numpy as np
+
+from board import PlayerBoard
+from card import Card
+from card_index import CARD_TO_INDEX, INDEX_TO_CARD, NUM_CARDS
+from deck import Deck
+from game_state import GameState
+
+EMPTY = -1
+NUM_SLOTS = 13
+MAX_LIST_CARDS = 17 # Рука Фантазии - до 17 карт
+HEADER_SIZE = 6
+_FLAGS = 8
+_LIST_SIZE = 1 + MAX_LIST_CARDS
+PLAYER_SIZE = NUM_SLOTS + _FLAGS + 3 * _LIST_SIZE
+STATE_SIZE = HEADER_SIZE + GameState.MAX_PLAYERS * PLAYER_SIZE
+
+
+def _put_cards(out: List[int], cards: Optional[List[Card]]):
+    if cards is None:
+        out.append(EMPTY)
+        out.extend([EMPTY] * MAX_LIST_CARDS)
+        return
+    if len(cards) > MAX_LIST_CARDS: raise ValueError(f"Too many cards to encode: {len(cards)}")
+    out.append(len(cards))
+    out.extend(CARD_TO_INDEX[card] for card in cards)
+    out.extend([EMPTY] * (MAX_LIST_CARDS - len(cards)))
+
+
+def encode_state(state: GameState, out: np.ndarray):
+    """Записывает состояние в out (int8, длина не меньше STATE_SIZE)."""
+    values = [state.num_players, state.dealer_idx, state.current_player_idx, state.street,
+              int(state.is_fantasyland_round), state._turn_pos]
+    for p in range(state.num_players):
+        board = state.boards[p]
+        for row_name in PlayerBoard.ROW_NAMES:
+            values.extend(EMPTY if card is None else CARD_TO_INDEX[card] for card in board.rows[row_name])
+        values.extend((board._cards_placed, int(board.is_foul), int(board._is_complete),
+                       int(state.fantasyland_status[p]), int(state.next_fantasyland_status[p]),
+                       state.fantasyland_cards_to_deal[p], int(state._player_acted_this_street[p]),
+                       int(state._player_finished_round[p])))
+        _put_cards(values, state.current_hands.get(p))
+        _put_cards(values, state.fantasyland_hands[p])
+        _put_cards(values, state.private_discard[p])
+    out[:len(values)] = values
+
+
+def decode_state(data: np.ndarray) -> GameState:
+    """Восстанавливает состояние из строки, записанной encode_state."""
+    values = data[:STATE_SIZE].tolist()
+    num_players, dealer_idx, current_player_idx, street, is_fantasyland_round, turn_pos = values[:HEADER_SIZE]
+    known = set() # Индексы карт вне колоды
+
+    def cards_at(pos: int) -> Optional[List[Card]]:
+        length = values[pos]
+        if length == EMPTY: return None
+        indexes = values[pos + 1:pos + 1 + length]
+        known.update(indexes)
+        return [INDEX_TO_CARD[index] for index in indexes]
+
+    boards, flags, hands, fantasyland_hands, discards = [], [], {}, [], []
+    for p in range(num_players):
+        base = HEADER_SIZE + p * PLAYER_SIZE
+        board = PlayerBoard()
+        slot = base
+        for row_name in PlayerBoard.ROW_NAMES:
+            indexes = values[slot:slot + PlayerBoard.ROW_CAPACITY[row_name]]
+            known.update(indexes)
+            board.rows[row_name] = [None if index == EMPTY else INDEX_TO_CARD[index] for index in indexes]
+            slot += PlayerBoard.ROW_CAPACITY[row_name]
+        player_flags = values[base + NUM_SLOTS:base + NUM_SLOTS + _FLAGS]
+        board._cards_placed, board.is_foul, board._is_complete = player_flags[0], bool(player_flags[1]), bool(player_flags[2])
+        boards.append(board)
+        flags.append(player_flags)
+        lists = base + NUM_SLOTS + _FLAGS
+        hands[p] = cards_at(lists)
+        fantasyland_hands.append(cards_at(lists + _LIST_SIZE))
+        discards.append(cards_at(lists + 2 * _LIST_SIZE) or [])
+
+    return GameState(
+        boards=boards, deck=Deck(cards={INDEX_TO_CARD[index] for index in range(NUM_CARDS) if index not in known}),
+        private_discard=discards,
+        dealer_idx=dealer_idx, current_player_idx=current_player_idx, street=street,
+        current_hands=hands,
+        fantasyland_status=[bool(f[3]) for f in flags],
+        next_fantasyland_status=[bool(f[4]) for f in flags],
+        fantasyland_cards_to_deal=[f[5] for f in flags],
+        is_fantasyland_round=bool(is_fantasyland_round),
+        fantasyland_hands=fantasyland_hands,
+        _player_acted_this_street=[bool(f[6]) for f in flags],
+        _player_finished_round=[bool(f[7]) for f in flags],
+        _turn_pos=turn_pos, num_players=num_players)
@@ -0,0 +1,127 @@
+# time_manager.py
+"""
+Управление временем поиска MCTSAgent.
+
+TimeManager делит общее время раунда (на одного игрока) между улицами по
+весам: улица 1 (тысячи размещений пяти карт) получает больше, поздние
+улицы - меньше. Для каждого решения он выдает DecisionClock - часы поиска
+с мягким дедлайном и жестким (мягкий плюс продление). Доля улицы - это
+жесткий бюджет, так что даже с продлением всех решений раунд укладывается
+в общее время, а ранние остановки его только сокращают.
+
+Поиск периодически спрашивает часы, не пора ли остановиться. Остановка
+раньше мягкого дедлайна:
+
+    unreachable  отрыв самого посещаемого действия корня от второго больше,
+                 чем симуляций успеет пройти до дедлайна, - решение уже не
+                 изменится;
+    confident    доверительные интервалы (Хёфдинг) средних наград двух
+                 самых посещаемых действий не пересекаются.
+
+На мягком дедлайне поиск останавливается (time), если решение не близкое;
+близкое (второе действие по посещениям догоняет первое) один раз получает
+продление до жесткого дедлайна.
+"""
+import math
+import time
+from typing import Callable, Dict, Optional, Tuple
+
+import numpy as np
+
+# Посещения и суммы наград (игрока, ходящего из корня) раскрытых детей корня
+ChildStats = Callable[[], Tuple[np.ndarray, np.ndarray]]
+
+
+class TimeManager:
+    """Параметры распределения времени (общие для всех решений агента)."""
+    DEFAULT_STREET_WEIGHTS = {1: 3.0, 2: 1.5, 3: 1.5, 4: 1.0, 5: 1.0}
+    DEFAULT_EXTENSION = 0.5 # Продление близкого решения (доля мягкого бюджета)
+    DEFAULT_MIN_FRACTION = 0.2 # Раньше этой доли времени улицы поиск не останавливается
+    DEFAULT_CHECK_INTERVAL = 16 # Итераций между проверками остановки
+    DEFAULT_REWARD_RANGE = 40.0 # Размах очков роллаута для границы Хёфдинга
+    DEFAULT_CONFIDENCE = 0.05 # Вероятность ошибки границы
+    DEFAULT_CLOSE_RATIO = 0.8 # Решение близкое, если у второго действия не меньше этой доли посещений первого
+
+    def __init__(self, round_time: float, street_weights: Optional[Dict[int, float]] = None,
+                 extension: float = DEFAULT_EXTENSION, min_fraction: float = DEFAULT_MIN_FRACTION,
+                 check_interval: int = DEFAULT_CHECK_INTERVAL, reward_range: float = DEFAULT_REWARD_RANGE,
+                 confidence: float = DEFAULT_CONFIDENCE, close_ratio: float = DEFAULT_CLOSE_RATIO):
+        """round_time - секунд на все решения одного игрока за раунд (верхняя граница)."""
+        self.round_time = round_time
+        self.street_weights = dict(street_weights or self.DEFAULT_STREET_WEIGHTS)
+        self.extension = max(0.0, extension)
+        self.min_fraction = min_fraction
+        self.check_interval = max(1, check_interval)
+        self.reward_range = reward_range
+        self.confidence = confidence
+        self.close_ratio = close_ratio
+
+    def street_time(self, street: int) -> float:
+        """Мягкий бюджет решения на улице street (секунды); с продлением - доля улицы во времени раунда."""
+        total = sum(self.street_weights.values())
+        weight = self.street_weights.get(street, min(self.street_weights.values()))
+        return self.round_time * weight / total / (1.0 + self.extension)
+
+    def start(self, street: int, start: Optional[float] = None) -> 'DecisionClock':
+        """Часы решения на улице street, начинающегося в start (time.time())."""
+        return DecisionClock(self, time.time() if start is None else start, self.street_time(street))
+
+    def __repr__(self) -> str:
+        return f"TimeManager(round_time={self.round_time:.2f}s, weights={self.street_weights})"
+
+
+class DecisionClock:
+    """Часы одного решения: дедлайны, продление и причина остановки."""
+    __slots__ = ('manager', 'start', 'soft_deadline', 'hard_deadline', 'extended', 'stop_reason', '_next_check')
+
+    def __init__(self, manager: TimeManager, start: float, soft_time: float):
+        self.manager = manager
+        self.start = start
+        self.soft_deadline = start + soft_time
+        self.hard_deadline = start + soft_time * (1.0 + manager.extension)
+        self.extended = False
+        self.stop_reason: Optional[str] = None # unreachable, confident, time (None - остановил бюджет)
+        self._next_check = manager.check_interval
+
+    def should_stop(self, iterations: int, simulations: int, child_stats: ChildStats) -> bool:
+        """Проверка раз в check_interval итераций; True - поиск можно завершать."""
+        if iterations < self._next_check: return False
+        self._next_check = iterations + self.manager.check_interval
+        now = time.time()
+        elapsed = now - self.start
+        if elapsed < self.manager.min_fraction * (self.soft_deadline - self.start): return False
+
+        visits, rewards = child_stats()
+        top = self._top_two(visits)
+        if top is not None:
+            best, second = top
+            deadline = self.hard_deadline if self.extended else self.soft_deadline
+            remaining_sims = simulations / max(elapsed, 1e-9) * max(0.0, deadline - now)
+            if visits[best] - visits[second] > remaining_sims: return self._stop('unreachable')
+            if visits[second] > 0 and self._separated(visits[best], rewards[best], visits[second], rewards[second]):
+                return self._stop('confident')
+        if now < self.soft_deadline: return False
+        if not self.extended and self.hard_deadline > self.soft_deadline and top is not None \
+                and visits[top[1]] >= self.manager.close_ratio * visits[top[0]]:
+            self.extended = True # Близкое решение - досчитываем до жесткого дедлайна
+            return False
+        return self._stop('time')
+
+    def _stop(self, reason: str) -> bool:
+        self.stop_reason = reason
+        return True
+
+    @staticmethod
+    def _top_two(visits: np.ndarray) -> Optional[Tuple[int, int]]:
+        """Индексы двух самых посещаемых детей (None - детей меньше двух)."""
+        if len(visits) < 2: return None
+        top = np.argpartition(visits, -2)[-2:]
+        if visits[top[0]] > visits[top[1]]: return int(top[0]), int(top[1])
+        return int(top[1]), int(top[0])
+
+    def _separated(self, n1: float, reward1: float, n2: float, reward2: float) -> bool:
+        """Нижняя граница средней награды первого выше верхней границы второго."""
+        log_term = math.log(2.0 / self.manager.confidence)
+        def radius(n: float) -> float:
+            return self.manager.reward_range * math.sqrt(log_term / (2.0 * n))
+        return reward1 / n1 - radius(n1) > reward2 / n2 + radius(n2)
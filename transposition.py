@@ -0,0 +1,93 @@
+# transposition.py
+"""
+Таблица транспозиций для MCTS.
+
+Разные порядки размещения карт часто дают одну и ту же позицию (в том числе
+с точностью до перестановки карт внутри ряда и изоморфизма мастей - ключом
+служит canonicalize_state). Узлы MCTSNode с одинаковым ключом ссылаются на
+общую запись TranspositionEntry: Q берется из записи, а счетчики посещений
+узла остаются счетчиками ребра (родитель -> узел) и используются в
+исследовательском члене UCT - это корректное обобщение UCT на DAG.
+
+Размер таблицы ограничен: при переполнении вытесняется запись, которую
+дольше всех не посещали. Узлы, уже ссылающиеся на вытесненную запись,
+продолжают ее обновлять, но новые узлы ее больше не найдут.
+"""
+import sys
+from collections import OrderedDict
+from typing import Any, Dict
+
+import numpy as np
+
+from canonical import canonicalize_state
+from game_state import GameState
+
+
+class TranspositionEntry:
+    """Общая статистика позиции: посещения и сумма векторов очков всех игроков."""
+    __slots__ = ('key', 'visits', 'total_reward')
+
+    def __init__(self, key: Any, num_players: int):
+        self.key = key
+        self.visits: int = 0
+        self.total_reward: np.ndarray = np.zeros(num_players, dtype=np.float64)
+
+    def q_value(self, player_idx: int) -> float:
+        """Средние очки игрока по всем симуляциям через позицию."""
+        return float(self.total_reward[player_idx]) / self.visits if self.visits > 0 else 0.0
+
+
+class TranspositionTable:
+    """Ограниченная таблица транспозиций с вытеснением давно не посещавшихся записей."""
+    DEFAULT_MAX_ENTRIES = 200000
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES):
+        if max_entries <= 0: raise ValueError(f"max_entries must be positive, got {max_entries}")
+        self.max_entries = max_entries
+        self._entries: 'OrderedDict[Any, TranspositionEntry]' = OrderedDict()
+        self.lookups = 0
+        self.hits = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def key_of(state: GameState) -> Any:
+        """Ключ позиции: канонический (по мастям и порядку карт в рядах) ключ полного состояния."""
+        key, _ = canonicalize_state(state)
+        return key
+
+    def lookup(self, state: GameState) -> TranspositionEntry:
+        """Возвращает запись позиции, создавая ее при отсутствии."""
+        key = self.key_of(state)
+        self.lookups += 1
+        entry = self._entries.get(key)
+        if entry is not None:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return entry
+        entry = TranspositionEntry(key, state.num_players)
+        self._entries[key] = entry
+        if len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+        return entry
+
+    def touch(self, entry: TranspositionEntry):
+        """Отмечает запись как посещенную (для порядка вытеснения)."""
+        if self._entries.get(entry.key) is entry: self._entries.move_to_end(entry.key)
+
+    def hit_rate(self) -> float:
+        return self.hits / self.lookups if self.lookups else 0.0
+
+    def nbytes(self) -> int:
+        """Приблизительный объем памяти таблицы (словарь, ключи и записи)."""
+        total = sys.getsizeof(self._entries)
+        for key, entry in self._entries.items():
+            total += sys.getsizeof(key) + sys.getsizeof(entry) + entry.total_reward.nbytes
+        return total
+
+    def stats(self) -> Dict[str, Any]:
+        return {'entries': len(self._entries), 'lookups': self.lookups, 'hits': self.hits,
+                'hit_rate': self.hit_rate(), 'evictions': self.evictions}